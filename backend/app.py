@@ -1,23 +1,50 @@
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-from openai import OpenAI
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, stream_with_context
+from flask import has_request_context
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import json
 import io
-import requests
 from datetime import datetime
 from functools import wraps
+import hmac
 import logging
 import os
+import queue
 import socket
-from supabase import create_client
+import time
+from supabase import create_client, acreate_client
+from supabase.lib.client_options import AsyncClientOptions, SyncClientOptions
 from supabase.client import Client
 import stripe
 from flask import url_for
-import traceback
+import uuid
+from markupsafe import escape
+from werkzeug.utils import secure_filename
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from async_runtime import runtime as async_runtime
+from export import stream_zip
+from formatting import format_content, format_section_html, get_section_key, schema_for, splice_section
+from http_pool import create_pool_from_env
+from image_validation import ImageValidator, extract_image_urls
+from jobs import JobStore, JobWorkerPool
+from llm_backends import create_router_from_env
+from llm_cache import create_cache_from_env, make_cache_key
+from llm_output import parse_llm_output, parse_outline, parse_section
+from log_config import RequestLogger, configure_logging
+import metrics
+import prompts
+from quota import QuotaExceeded, QuotaManager, Reservation
+from rendering import TemplateRenderer
+from resilience import UpstreamUnavailable, is_retryable, retry_after_seconds
+from singleflight import SingleFlight
+from token_budget import TokenBudget, count_message_tokens
+from token_verifier import TokenVerifier
+from utils import JSONArrayStreamParser, TTLCache, find_json_string, sse_event
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -29,18 +56,11 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')  # Changed to match your .env f
 # Access your API key
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (LOG_LEVEL, LOG_FORMAT), written from a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
-
-# Suppress excessive debug logs from specific libraries
-logging.getLogger('hpack').setLevel(logging.WARNING)
-logging.getLogger('httpx').setLevel(logging.WARNING)
-logging.getLogger('urllib3').setLevel(logging.WARNING)
-
-
 def find_free_port(start_port=5001, max_port=5010):
     """Find a free port to use"""
     for port in range(start_port, max_port):
@@ -85,20 +105,14 @@ def check_auth():
 
     return auth_header or token or hash_token
 
-@app.before_request
-def log_request_info():
-    app.logger.debug('Headers: %s', request.headers)
-    app.logger.debug('Body: %s', request.get_data())
-    app.logger.debug('Path: %s', request.path)
+# Sampled access log, see LOG_REQUEST_* in log_config.RequestLogger
+request_logger = RequestLogger(app)
 
 @app.route('/PageCrafter.svg')
 def serve_svg():
     file_path = os.path.join('../frontend/public', 'PageCrafter.svg')
-    print(f"Looking for SVG at: {os.path.abspath(file_path)}")
-    if os.path.exists(file_path):
-        print("SVG file found!")
-    else:
-        print("SVG file not found!")
+    if not os.path.exists(file_path):
+        logger.warning(f"SVG file not found at {os.path.abspath(file_path)}")
     return send_from_directory('../frontend/public', 'PageCrafter.svg', mimetype='image/svg+xml')
 
 @app.route('/', defaults={'path': ''})
@@ -139,13 +153,101 @@ def protected_routes():
         return jsonify({'error': 'Unauthorized'}), 401
     return jsonify({'status': 'ok'})
 
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
+# Keep-alive connection pools and per-host metrics for outbound HTTP. Every
+# upstream gets its own client so auth headers never leak between them.
+http_pool = create_pool_from_env()
+
+# Initialize OpenAI client. Retries are done by llm_router (with backoff and
+# circuit breakers), not by the SDK as well.
+client = OpenAI(api_key=api_key, max_retries=0, http_client=http_pool.client(follow_redirects=True))
+
+# Async OpenAI client, used on the shared background event loop
+async_client = AsyncOpenAI(api_key=api_key, max_retries=0,
+                           http_client=http_pool.async_client(follow_redirects=True))
+
+# Completions go to the fastest configured backend (LLM_BACKENDS) and are
+# hedged on the next one when they run slow
+llm_router = create_router_from_env(client, async_client, http_pool)
+
+# Image URL checks, concurrent and cached per URL
+image_validator = ImageValidator(
+    http_pool.client(timeout=5),
+    ttl=int(os.getenv('IMAGE_VALIDATION_TTL', 86400)),
+    negative_ttl=int(os.getenv('IMAGE_VALIDATION_NEGATIVE_TTL', 600)),
+    per_host_limit=int(os.getenv('IMAGE_VALIDATION_PER_HOST', 4)),
+    max_urls=int(os.getenv('IMAGE_VALIDATION_MAX_URLS', 50))
+)
+
+# A section is a few paragraphs, not a whole article: max_tokens for one until
+# the section budget has samples
+SECTION_MAX_TOKENS = int(os.getenv('SECTION_MAX_TOKENS', 2000))
+
+# generation_mode 'parallel': an outline first, then the sections concurrently.
+# GENERATION_MODE sets the default for requests that don't choose.
+PARALLEL_TEMPLATES = ('article_template.html', 'ss_article_template.html', 'ss_player_scout_report_template.html')
+DEFAULT_GENERATION_MODE = os.getenv('GENERATION_MODE', 'single')
+OUTLINE_MAX_TOKENS = int(os.getenv('OUTLINE_MAX_TOKENS', 1500))
+PARALLEL_SECTION_CONCURRENCY = int(os.getenv('PARALLEL_SECTION_CONCURRENCY', 4))
+
+# max_tokens per template from observed completion sizes, instead of a flat 16000.
+# Sections and outlines are budgeted separately, starting from their own limits.
+token_budget = TokenBudget(
+    default=int(os.getenv('MAX_TOKENS_DEFAULT', 16000)),
+    floor=int(os.getenv('MAX_TOKENS_FLOOR', 2000)),
+    part_defaults={'section': SECTION_MAX_TOKENS, 'outline': OUTLINE_MAX_TOKENS}
+)
+
+# Bulk zip export
+EXPORT_MAX_ARTICLES = int(os.getenv('EXPORT_MAX_ARTICLES', 100))
+EXPORT_RENDER_WORKERS = int(os.getenv('EXPORT_RENDER_WORKERS', 4))
+
+# Cache of completions keyed on prompts, model and sampling parameters
+llm_cache = create_cache_from_env()
+
+# Identical generation requests from the same user (double clicks, retries)
+# share one completion, and only the first one is charged
+generation_flight = SingleFlight(window=float(os.getenv('GENERATION_COALESCE_WINDOW', 30)))
 
 # Initialize Supabase client
 supabase_client = create_client(
     SUPABASE_URL,
-    SUPABASE_KEY
+    SUPABASE_KEY,
+    options=SyncClientOptions(httpx_client=http_pool.client(timeout=120, follow_redirects=True))
+)
+
+# The async Supabase client is created on first use inside the event loop
+_async_supabase_client = None
+
+
+async def get_async_supabase():
+    global _async_supabase_client
+    if _async_supabase_client is None:
+        _async_supabase_client = await acreate_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=AsyncClientOptions(httpx_client=http_pool.async_client(timeout=120, follow_redirects=True))
+        )
+    return _async_supabase_client
+
+# Article quota accounting on the subscriptions table. Rows are cached per
+# user (SUBSCRIPTION_CACHE_BACKEND / _TTL / _PATH), refreshed on every quota
+# update and invalidated by the Stripe webhook; the TTL bounds staleness for
+# changes made outside this app.
+subscription_cache = create_cache_from_env('SUBSCRIPTION_CACHE', ttl=300, max_entries=10000)
+quota = QuotaManager(
+    supabase_client,
+    reserve_rpc=os.getenv('QUOTA_RESERVE_RPC'),
+    release_rpc=os.getenv('QUOTA_RELEASE_RPC'),
+    cache=subscription_cache,
+    async_client=get_async_supabase
+)
+
+# Verifies access tokens locally and caches the user, falling back to Supabase
+token_verifier = TokenVerifier(
+    supabase_client.auth.get_user,
+    jwt_secret=os.getenv('SUPABASE_JWT_SECRET'),
+    jwks_url=f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None,
+    cache_ttl=int(os.getenv('AUTH_CACHE_TTL', 300))
 )
 
 def require_auth(f):
@@ -158,16 +260,33 @@ def require_auth(f):
 
         try:
             token = auth_header.split(' ')[1]
-            # The user data is in the 'user' property of the response
-            user_response = supabase_client.auth.get_user(token)
-            user = user_response.user  # Get the actual user object
+            with metrics.stage('auth'):
+                user = token_verifier.verify(token)
 
             # Add user to request context for use in the route
             request.user = user
             return f(*args, **kwargs)
         except Exception as e:
-            print(f"Error verifying token: {str(e)}")
+            logger.info(f"Error verifying token: {str(e)}")
+            return jsonify({'message': 'Invalid token'}), 401
+
+    return decorated
+
+# The debug and metrics endpoints expose internals (cached completions, quotas,
+# latencies). They are off unless DEBUG_API_TOKEN is set, and need it as a
+# bearer token then.
+DEBUG_API_TOKEN = os.getenv('DEBUG_API_TOKEN')
+
+
+def require_debug_access(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not DEBUG_API_TOKEN:
+            return jsonify({'error': 'Not Found'}), 404
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.encode('utf-8'), f'Bearer {DEBUG_API_TOKEN}'.encode('utf-8')):
             return jsonify({'message': 'Invalid token'}), 401
+        return f(*args, **kwargs)
 
     return decorated
 
@@ -198,169 +317,737 @@ def validate_template_vars(template_vars, template_name):
 def get_user_id_from_token(token):
     try:
         # Verify the JWT token
-        user = supabase_client.auth.get_user(token)
+        user = token_verifier.verify(token)
         return user.id
     except Exception as e:
         logger.error(f"Error verifying token: {str(e)}")
         return None
 
+
+ALLOWED_TEMPLATES = [
+    'match_report_template.html',
+    'ss_match_report_template.html',
+    'download_template.html',
+    'article_template.html',
+    'ss_article_template.html',
+    'ss_player_scout_report_template.html'
+]
+
+# Compile the allowed templates up front and time every render
+template_renderer = TemplateRenderer(
+    app,
+    ALLOWED_TEMPLATES,
+    cache_dir=os.getenv('TEMPLATE_CACHE_DIR'),
+    fragment_cache_size=int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 500))
+)
+template_renderer.precompile()
+
+
+def resolve_template_name(data):
+    """Return the requested template, falling back to the default article template"""
+    template_name = data.get('template_name', 'article_template.html')
+    if template_name not in ALLOWED_TEMPLATES:
+        template_name = 'article_template.html'
+    return template_name
+
+
+async def get_user_async(token):
+    user = token_verifier.lookup(token)
+    if user is not None:
+        return user
+
+    supabase = await get_async_supabase()
+    user_response = await supabase.auth.get_user(token)
+    if user_response.user is None:
+        raise ValueError('Invalid token')
+    token_verifier.remember(token, user_response.user)
+    return user_response.user
+
+
+def missing_generation_fields(data):
+    required_fields = ['topic', 'keywords', 'context', 'supporting_data']
+    return [field for field in required_fields if not data.get(field)]
+
+
+def prepare_template_vars(formatted_content, template_name, data):
+    """Apply template-specific defaults and validation. Returns an error message or None."""
+    if template_name == 'ss_player_scout_report_template':
+        required_defaults = {
+            'headline': 'Player Scout Report',
+            'summary': 'No summary provided.',
+            'article_content': '<p>No content available.</p>',
+            'meta_description': 'A comprehensive scout report on the player.',
+            'keywords': ['Football', 'Scout Report'],
+            'featured_image_url': '/static/images/default-featured-image.jpg',
+            'featured_image_alt': 'Default featured image',
+            'publish_date': datetime.now().strftime('%Y-%m-%d'),
+            'player_name': 'Unknown Player',
+            'player_position': 'Unknown Position',
+            'player_age': 'Unknown Age',
+            'player_nationality': 'Unknown Nationality',
+            'favored_foot': 'Unknown',
+            'scout_stats': 'No stats available.'
+        }
+        for key, default_value in required_defaults.items():
+            formatted_content.setdefault(key, default_value)
+
+    if template_name in ['match_report_template.html', 'ss_match_report_template.html']:
+        is_valid, error_message = validate_template_vars(formatted_content, template_name)
+        if not is_valid:
+            return error_message
+
+    # Add match stats if needed
+    if template_name == 'match_report_template.html' and 'match_stats' not in formatted_content:
+        formatted_content['match_stats'] = {
+            'possession': {'home': data.get('home_possession', 50), 'away': data.get('away_possession', 50)},
+            'shots': {'home': data.get('home_shots', 0), 'away': data.get('away_shots', 0)},
+            'shots_on_target': {'home': data.get('home_shots_on_target', 0), 'away': data.get('away_shots_on_target', 0)},
+            'corners': {'home': data.get('home_corners', 0), 'away': data.get('away_corners', 0)},
+            'fouls': {'home': data.get('home_fouls', 0), 'away': data.get('away_fouls', 0)},
+            'yellow_cards': {'home': data.get('home_yellow_cards', 0), 'away': data.get('away_yellow_cards', 0)},
+            'red_cards': {'home': data.get('home_red_cards', 0), 'away': data.get('away_red_cards', 0)},
+            'offsides': {'home': data.get('home_offsides', 0), 'away': data.get('away_offsides', 0)}
+        }
+
+    return None
+
+
+def build_generation_result(preview_html, formatted_content, template_name):
+    content = dict(formatted_content)
+    missing_parts = content.pop('missing_parts', None)
+    result = {
+        'preview_html': preview_html,
+        'raw_content': {
+            'template_name': template_name,
+            'theme': content.get('theme', {}),
+            **content
+        }
+    }
+    # Parts of a cut-off or malformed completion that didn't make it in
+    if missing_parts:
+        result['missing_parts'] = missing_parts
+    return result
+
+
 @app.route('/api/generate', methods=['POST', 'OPTIONS'])
 @require_auth
 def generate_api():
     try:
-        print("Received request data:", request.get_json())  # Log the incoming data
         user_id = request.user.id
-        print(f"Generating content for user: {user_id}")  # Add debug logging
 
-        # Add more detailed logging for subscription check
+        # Reserve the article up front, it is refunded unless generation succeeds
         try:
-            subscription_response = supabase_client.table('subscriptions')\
-                .select('*')\
-                .eq('user_id', user_id)\
-                .eq('status', 'active')\
-                .order('created_at', desc=True)\
-                .limit(1)\
-                .execute()
-            
-            print(f"Subscription response: {subscription_response}")  # Debug log
-            
-            user_subscription = {
-                'plan_type': 'free',
-                'articles_remaining': 3,
-                'articles_generated': 0,
-                'status': 'active'
-            }
+            with metrics.stage('quota_reserve'):
+                reservation = quota.reserve(user_id)
+        except QuotaExceeded:
+            return jsonify({
+                'error': 'No articles remaining. Please upgrade to continue generating content.'
+            }), 403
+        except Exception as e:
+            logger.error(f"Supabase error: {str(e)}")
+            return jsonify({'error': 'Error accessing subscription data'}), 500
+
+        charged = False
+        try:
+            data = request.get_json()
+            if not data:
+                return jsonify({'error': 'No data provided in the request.'}), 400
 
-            if subscription_response.data:
-                user_subscription = subscription_response.data[0]
-                print(f"Found subscription: {user_subscription}")  # Debug log
+            # Validate template name
+            template_name = resolve_template_name(data)
+
+            # Set when this request joined an identical in-flight generation
+            shared = False
+
+            # Check if this is an edit request
+            if 'edited_content' in data:
+                formatted_content = data['edited_content']
             else:
-                print("No subscription found, using default free tier")  # Debug log
+                # Validate required fields for new content
+                missing_fields = missing_generation_fields(data)
+                if missing_fields:
+                    return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+
+                # Generate content
+                prompt = create_prompt(data)
+                logger.debug("Created prompt (%d chars)", len(prompt))
+
+                if use_parallel_generation(data, template_name):
+                    flight_key = (user_id, template_name, prompt, 'parallel')
+                    generate, args = generate_parallel, (data, template_name)
+                else:
+                    flight_key = (user_id, template_name, prompt)
+                    generate, args = run_gpt4, (prompt, template_name)
+
+                try:
+                    if data.get('skip_cache'):
+                        # Regenerate asks for a new completion, not one shared
+                        # with (or kept from) an earlier identical request
+                        response = generate(*args, use_cache=False)
+                    else:
+                        response, shared = generation_flight.do(flight_key, generate, *args, use_cache=True)
+                except UpstreamUnavailable as e:
+                    return upstream_unavailable_response(e)
+
+                if not response:
+                    return jsonify({'error': 'Failed to generate content'}), 500
+
+                formatted_content = format_article_content(response, template_name)
+                if not formatted_content:
+                    return jsonify({'error': 'Failed to format article content'}), 500
+
+            # Template-specific validation and defaults
+            error_message = prepare_template_vars(formatted_content, template_name, data)
+            if error_message:
+                return jsonify({'error': error_message}), 400
+
+            try:
+                # Render template
+                with metrics.stage('render'):
+                    preview_html = template_renderer.render(
+                        template_name,
+                        preview_mode=True,
+                        **formatted_content
+                    )
+            except Exception as template_error:
+                logger.error(f"Template rendering error: {str(template_error)}")
+                return jsonify({'error': f'Template rendering failed: {str(template_error)}'}), 500
+
+            # Charge the article once per coalesced generation
+            charged = not shared
+
+            return jsonify(build_generation_result(preview_html, formatted_content, template_name))
+        finally:
+            with metrics.stage('quota_update'):
+                if charged:
+                    quota.commit(reservation)
+                else:
+                    quota.refund(reservation)
+
+    except Exception as e:
+        logger.exception(f"Error in generate_api: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/generate/stream', methods=['POST', 'OPTIONS'])
+@require_auth
+def generate_stream_api():
+    """
+    Streaming variant of /api/generate. Sends Server-Sent Events:
+    `section` with the rendered HTML of each section as soon as it is complete,
+    then `done` with the same payload /api/generate returns, or `error`.
+    """
+    user_id = request.user.id
+
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided in the request.'}), 400
+
+    missing_fields = missing_generation_fields(data)
+    if missing_fields:
+        return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+
+    template_name = resolve_template_name(data)
+    try:
+        prompt = create_prompt(data)
+    except KeyError as e:
+        # Template-specific fields, e.g. the scores of a match report
+        return jsonify({'error': f'Missing required field: {e.args[0]}'}), 400
+
+    try:
+        with metrics.stage('quota_reserve'):
+            reservation = quota.reserve(user_id)
+    except QuotaExceeded:
+        return jsonify({
+            'error': 'No articles remaining. Please upgrade to continue generating content.'
+        }), 403
+    except Exception as e:
+        logger.error(f"Supabase error: {str(e)}")
+        return jsonify({'error': 'Error accessing subscription data'}), 500
 
-            if user_subscription['articles_remaining'] <= 0 and user_subscription['plan_type'] != 'pro':
-                return jsonify({
-                    'error': 'No articles remaining. Please upgrade to continue generating content.'
-                }), 403
+    def generate():
+        # Refunds the reservation on errors and when the client disconnects
+        try:
+            yield from generate_sections()
+        finally:
+            quota.refund(reservation)
+
+    def generate_sections():
+        yield sse_event('start', {'template_name': template_name})
+
+        schema = schema_for(template_name)
+        parser = JSONArrayStreamParser(schema.section_key)
+        main_headline = None
 
+        try:
+            for delta in stream_gpt4(prompt, template_name):
+                # Sections keep their array position, the index missing_parts and section regeneration use
+                for index, section in parser.feed_indexed(delta):
+                    # Malformed sections are left out, and listed in the final missing_parts
+                    if not schema.valid_section(section):
+                        logger.warning(f"Skipping malformed streamed section for {template_name}")
+                        continue
+                    if main_headline is None:
+                        main_headline = find_json_string(parser.buffer, 'headline') or ''
+                    section_html = format_section_html(section, template_name, main_headline)
+                    if section_html:
+                        yield sse_event('section', {'index': index, 'html': section_html})
+        except UpstreamUnavailable as e:
+            yield sse_event('error', {'error': 'Content generation is temporarily unavailable',
+                                      'retry_after': e.retry_after})
+            return
         except Exception as e:
-            print(f"Subscription error details: {str(e)}")  # Add detailed error logging
-            logger.error(f"Supabase error: {str(e)}")
-            return jsonify({'error': 'Error accessing subscription data'}), 500
+            logger.error(f"OpenAI streaming error: {str(e)}")
+            yield sse_event('error', {'error': 'Failed to generate content'})
+            return
 
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided in the request.'}), 400
+        formatted_content = format_article_content(parser.buffer, template_name)
+        if not formatted_content:
+            yield sse_event('error', {'error': 'Failed to format article content'})
+            return
 
-        # Validate template name
-        template_name = data.get('template_name', 'article_template.html')
-        if template_name not in [
-            'match_report_template.html',
-            'ss_match_report_template.html',
-            'download_template.html',
-            'article_template.html',
-            'ss_article_template.html',
-            'ss_player_scout_report_template.html'
-        ]:
-            template_name = 'article_template.html'
-
-        # Check if this is an edit request
-        if 'edited_content' in data:
-            formatted_content = data['edited_content']
-        else:
-            # Validate required fields for new content
-            required_fields = ['topic', 'keywords', 'context', 'supporting_data']
-            missing_fields = [field for field in required_fields if not data.get(field)]
-            if missing_fields:
-                return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        error_message = prepare_template_vars(formatted_content, template_name, data)
+        if error_message:
+            yield sse_event('error', {'error': error_message})
+            return
 
-            # Generate content
-            prompt = create_prompt(data)
-            print(f"Created prompt: {prompt[:200]}...")
-
-            response = run_gpt4(prompt, template_name)
-            print(f"GPT response: {response[:200] if response else 'None'}")
-
-            if not response:
-                return jsonify({'error': 'Failed to generate content'}), 500
-
-            formatted_content = format_article_content(response, template_name)
-            if not formatted_content:
-                return jsonify({'error': 'Failed to format article content'}), 500
-
-        # Template-specific validation and defaults
-        if template_name == 'ss_player_scout_report_template':
-            required_defaults = {
-                'headline': 'Player Scout Report',
-                'summary': 'No summary provided.',
-                'article_content': '<p>No content available.</p>',
-                'meta_description': 'A comprehensive scout report on the player.',
-                'keywords': ['Football', 'Scout Report'],
-                'featured_image_url': '/static/images/default-featured-image.jpg',
-                'featured_image_alt': 'Default featured image',
-                'publish_date': datetime.now().strftime('%Y-%m-%d'),
-                'player_name': 'Unknown Player',
-                'player_position': 'Unknown Position',
-                'player_age': 'Unknown Age',
-                'player_nationality': 'Unknown Nationality',
-                'favored_foot': 'Unknown',
-                'scout_stats': 'No stats available.'
-            }
-            for key, default_value in required_defaults.items():
-                formatted_content.setdefault(key, default_value)
+        try:
+            with metrics.stage('render'):
+                preview_html = template_renderer.render(template_name, preview_mode=True, **formatted_content)
+        except Exception as e:
+            logger.error(f"Error finishing streamed generation: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+            return
+
+        with metrics.stage('quota_update'):
+            quota.commit(reservation)
+        yield sse_event('done', build_generation_result(preview_html, formatted_content, template_name))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+        }
+    )
 
-        if template_name in ['match_report_template.html', 'ss_match_report_template.html']:
-            is_valid, error_message = validate_template_vars(formatted_content, template_name)
-            if not is_valid:
-                return jsonify({'error': error_message}), 400
 
-        # Add match stats if needed
-        if template_name == 'match_report_template.html' and 'match_stats' not in formatted_content:
-            formatted_content['match_stats'] = {
-                'possession': {'home': data.get('home_possession', 50), 'away': data.get('away_possession', 50)},
-                'shots': {'home': data.get('home_shots', 0), 'away': data.get('away_shots', 0)},
-                'shots_on_target': {'home': data.get('home_shots_on_target', 0), 'away': data.get('away_shots_on_target', 0)},
-                'corners': {'home': data.get('home_corners', 0), 'away': data.get('away_corners', 0)},
-                'fouls': {'home': data.get('home_fouls', 0), 'away': data.get('away_fouls', 0)},
-                'yellow_cards': {'home': data.get('home_yellow_cards', 0), 'away': data.get('away_yellow_cards', 0)},
-                'red_cards': {'home': data.get('home_red_cards', 0), 'away': data.get('away_red_cards', 0)},
-                'offsides': {'home': data.get('home_offsides', 0), 'away': data.get('away_offsides', 0)}
-            }
+@app.route('/api/generate/section', methods=['POST', 'OPTIONS'])
+@require_auth
+def regenerate_section_api():
+    """
+    Regenerate one section of a generated article instead of the whole
+    article. Takes the original generation fields, the `raw_content` of the
+    earlier result, `section_index` (the number of sections appends a new
+    one) and optional `instructions`. Returns the /api/generate payload with
+    the new section spliced into article_content. Doesn't use up an article.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided in the request.'}), 400
+
+    raw_content = data.get('raw_content')
+    if not isinstance(raw_content, dict) or not isinstance(raw_content.get('sections'), list):
+        return jsonify({'error': 'raw_content with the sections of a generated article is required'}), 400
+    sections = raw_content['sections']
+
+    index = data.get('section_index')
+    if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index <= len(sections):
+        return jsonify({'error': f'section_index must be between 0 and {len(sections)}'}), 400
+
+    missing_fields = missing_generation_fields(data)
+    if missing_fields:
+        return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+
+    template_name = resolve_template_name({'template_name': raw_content.get('template_name') or
+                                           data.get('template_name')})
+    try:
+        prompt = prompts.build_section_prompt({**data, 'template_name': template_name}, sections, index,
+                                              data.get('instructions', ''))
+    except KeyError as e:
+        return jsonify({'error': f'Missing required field: {e.args[0]}'}), 400
+
+    try:
+        response = run_gpt4(prompt, template_name, use_cache=False,
+                            system_prompt=prompts.section_system_prompt(template_name),
+                            budget_key=f'{template_name}#section')
+    except UpstreamUnavailable as e:
+        return upstream_unavailable_response(e)
+    section = parse_section(response, template_name) if response else None
+    if section is None:
+        return jsonify({'error': 'Failed to generate section'}), 500
+
+    main_headline = raw_content.get('headline', '')
+    with metrics.stage('format'):
+        article_content = splice_section(raw_content.get('article_content', ''), template_name,
+                                         sections, index, section, main_headline)
+    if article_content is None:
+        return jsonify({'error': 'The section was edited in article_content and can no longer be replaced'}), 409
+
+    content = {key: value for key, value in raw_content.items() if key != 'template_name'}
+    content['sections'] = sections[:index] + [section] + sections[index + 1:]
+    content['article_content'] = article_content
+
+    try:
+        with metrics.stage('render'):
+            preview_html = template_renderer.render(template_name, preview_mode=True, **content)
+    except Exception as e:
+        logger.error(f"Template rendering error: {str(e)}")
+        return jsonify({'error': f'Template rendering failed: {str(e)}'}), 500
+
+    result = build_generation_result(preview_html, content, template_name)
+    result.update({'section_index': index, 'section': section})
+    return jsonify(result)
+
+
+@metrics.timed('render')
+def render_preview(template_name, template_vars):
+    """Render a template outside of a request, e.g. from a worker thread"""
+    with app.app_context():
+        return template_renderer.render(template_name, preview_mode=True, **template_vars)
+
+
+async def generate_article_async(data):
+    """Generate, format and render one article without touching quota. Returns (payload, status_code)."""
+    template_name = resolve_template_name(data)
+
+    if 'edited_content' in data:
+        formatted_content = data['edited_content']
+    else:
+        missing_fields = missing_generation_fields(data)
+        if missing_fields:
+            return {'error': f'Missing required fields: {", ".join(missing_fields)}'}, 400
 
         try:
-            # Render template
-            preview_html = render_template(
-                template_name,
-                preview_mode=True,
-                **formatted_content
-            )
-        except Exception as template_error:
-            print(f"Template rendering error: {str(template_error)}")
-            return jsonify({'error': f'Template rendering failed: {str(template_error)}'}), 500
-
-        # Update subscription for all users
-        supabase_client.table('subscriptions')\
-            .update({
-                'articles_remaining': user_subscription['articles_remaining'] - 1,
-                'articles_generated': user_subscription['articles_generated'] + 1
-            })\
-            .eq('user_id', user_id)\
-            .execute()
+            prompt = create_prompt(data)
+        except KeyError as e:
+            return {'error': f'Missing required field: {e.args[0]}'}, 400
+        try:
+            if use_parallel_generation(data, template_name):
+                response = await generate_parallel_async(data, template_name, use_cache=not data.get('skip_cache'))
+            else:
+                response = await run_gpt4_async(prompt, template_name, use_cache=not data.get('skip_cache'))
+        except UpstreamUnavailable as e:
+            return {'error': 'Content generation is temporarily unavailable', 'retry_after': e.retry_after}, 503
+        if not response:
+            return {'error': 'Failed to generate content'}, 500
+
+        formatted_content = format_article_content(response, template_name, data)
+        if not formatted_content:
+            return {'error': 'Failed to format article content'}, 500
+
+    error_message = prepare_template_vars(formatted_content, template_name, data)
+    if error_message:
+        return {'error': error_message}, 400
+
+    try:
+        # Rendering is CPU-bound, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        preview_html = await loop.run_in_executor(None, render_preview, template_name, formatted_content)
+    except Exception as template_error:
+        logger.error(f"Template rendering error: {str(template_error)}")
+        return {'error': f'Template rendering failed: {str(template_error)}'}, 500
+
+    return build_generation_result(preview_html, formatted_content, template_name), 200
 
-        return jsonify({
-            'preview_html': preview_html,
-            'raw_content': {
-                'template_name': template_name,
-                'theme': formatted_content.get('theme', {}),
-                **formatted_content
-            }
-        })
 
+async def generate_content_async(data, token):
+    """
+    Async generation pipeline: auth, quota reservation and the completion all
+    run from the shared event loop, so waiting on the network does not hold a
+    thread. Returns (payload, status_code).
+    """
+    try:
+        user = await get_user_async(token)
     except Exception as e:
-        print(f"Error in generate_api: {str(e)}")  # Log any errors
-        traceback.print_exc()  # Print the full stack trace
+        logger.info(f"Error verifying token: {str(e)}")
+        return {'message': 'Invalid token'}, 401
+
+    try:
+        with metrics.stage('quota_reserve'):
+            reservation = await quota.reserve_async(user.id)
+    except QuotaExceeded:
+        return {'error': 'No articles remaining. Please upgrade to continue generating content.'}, 403
+    except Exception as e:
+        logger.error(f"Supabase error: {str(e)}")
+        return {'error': 'Error accessing subscription data'}, 500
+
+    try:
+        payload, status = await generate_article_async(data)
+    except Exception:
+        await quota.refund_async(reservation)
+        raise
+
+    if status == 200:
+        quota.commit(reservation)
+    else:
+        await quota.refund_async(reservation)
+
+    return payload, status
+
+
+@app.route('/api/generate/async', methods=['POST', 'OPTIONS'])
+def generate_async_api():
+    """
+    /api/generate backed by the async pipeline. The request thread only waits
+    on the result; run with threaded workers (gunicorn --worker-class gthread)
+    to hold many concurrent generations per process.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return jsonify({'message': 'No authorization header'}), 401
+
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided in the request.'}), 400
+
+    try:
+        token = auth_header.split(' ')[1]
+        payload, status = async_runtime.run(generate_content_async(data, token))
+        return jsonify(payload), status
+    except Exception as e:
+        logger.exception(f"Error in generate_async_api: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
+async def run_batch_async(items, on_result, concurrency, on_complete=None):
+    """
+    Generate every item with at most `concurrency` completions in flight.
+    on_result(index, payload, status) is called as each item finishes, and
+    on_complete(failed_count) once all are done (in an executor thread).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(index, item):
+        async with semaphore:
+            try:
+                payload, status = await generate_article_async(item)
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+                payload, status = {'error': str(e)}, 500
+        on_result(index, payload, status)
+        return status == 200
+
+    outcomes = await asyncio.gather(*(run_item(index, item) for index, item in enumerate(items)))
+    failed = outcomes.count(False)
+
+    if on_complete is not None:
+        await asyncio.get_running_loop().run_in_executor(None, on_complete, failed)
+    return failed
+
+
+@app.route('/api/generate/batch', methods=['POST', 'OPTIONS'])
+@require_auth
+def generate_batch_api():
+    """
+    Generate many articles in one request, e.g. a full matchday of reports.
+    Body: {"items": [<same payload as /api/generate>, ...]}
+
+    Quota for the whole batch is reserved up front and refunded for items that
+    fail. Results are sent as Server-Sent Events: one `item` event per article
+    in completion order (with its index), then `done` with a summary.
+    """
+    user_id = request.user.id
+    data = request.get_json(silent=True)
+    items = (data.get('items') if isinstance(data, dict) else None) or []
+    max_items = int(os.getenv('BATCH_MAX_ITEMS', 50))
+
+    if not items:
+        return jsonify({'error': 'No items provided in the request.'}), 400
+    if not isinstance(items, list):
+        return jsonify({'error': 'items must be a list.'}), 400
+    if len(items) > max_items:
+        return jsonify({'error': f'A batch can contain at most {max_items} items.'}), 400
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify({'error': f'Item {index} must be an object.'}), 400
+        # Same as /api/generate: edited content is rendered, not generated
+        missing_fields = [] if 'edited_content' in item else missing_generation_fields(item)
+        if missing_fields:
+            return jsonify({'error': f'Item {index} is missing required fields: {", ".join(missing_fields)}'}), 400
+
+    try:
+        reservation = quota.reserve(user_id, len(items))
+    except QuotaExceeded:
+        return jsonify({
+            'error': 'Not enough articles remaining for this batch. Please upgrade to continue generating content.'
+        }), 403
+    except Exception as e:
+        logger.error(f"Supabase error: {str(e)}")
+        return jsonify({'error': 'Error accessing subscription data'}), 500
+
+    def refund(failed):
+        if failed:
+            quota.refund(reservation, failed)
+        else:
+            quota.commit(reservation)
+
+    results = queue.Queue()
+    async_runtime.submit(run_batch_async(
+        items,
+        lambda index, payload, status: results.put((index, payload, status)),
+        concurrency=int(os.getenv('BATCH_CONCURRENCY', 4)),
+        on_complete=refund
+    ))
+
+    def generate():
+        total = len(items)
+        yield sse_event('start', {'total': total})
+
+        failed = 0
+        for completed in range(1, total + 1):
+            index, payload, status = results.get()
+            if status != 200:
+                failed += 1
+            yield sse_event('item', {
+                'index': index,
+                'status': status,
+                'completed': completed,
+                'total': total,
+                **payload
+            })
+
+        yield sse_event('done', {'total': total, 'succeeded': total - failed, 'failed': failed})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+def run_generation_job(job):
+    """Worker side of /api/jobs: generate the article, refunding the quota reserved at submit on failure"""
+    reservation = Reservation(job['user_id'], 1, tracked=job['payload'].get('_quota_tracked', True))
+    try:
+        payload, status = async_runtime.run(generate_article_async(job['payload']))
+    except Exception:
+        quota.refund(reservation)
+        raise
+
+    if status == 200:
+        quota.commit(reservation)
+    else:
+        quota.refund(reservation)
+    return payload, status
+
+
+# Generations that outlive the HTTP request, persisted so a dropped connection
+# doesn't lose a paid completion
+job_store = JobStore(
+    os.getenv('JOB_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.sqlite3')),
+    retention=int(os.getenv('JOB_RETENTION', 86400))
+)
+job_workers = JobWorkerPool(job_store, run_generation_job, workers=int(os.getenv('JOB_WORKERS', 2)))
+# /api/jobs/<id>/stream checks the job this often and holds the connection at most this long
+JOB_STREAM_POLL_INTERVAL = float(os.getenv('JOB_STREAM_POLL_INTERVAL', 1))
+JOB_STREAM_MAX_SECONDS = float(os.getenv('JOB_STREAM_MAX_SECONDS', 300))
+
+
+def job_response(job):
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if job['status'] in ('succeeded', 'failed'):
+        response['status_code'] = job['status_code']
+        response['result'] = job['result']
+    return response
+
+
+def get_user_job(job_id):
+    job = job_store.get(job_id)
+    if job is None or job['user_id'] != request.user.id:
+        return None
+    return job
+
+
+@app.route('/api/jobs', methods=['POST', 'OPTIONS'])
+@require_auth
+def submit_job():
+    """Queue a generation (same payload as /api/generate) and return its job id"""
+    user_id = request.user.id
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided in the request.'}), 400
+
+    missing_fields = missing_generation_fields(data)
+    if 'edited_content' not in data and missing_fields:
+        return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+
+    # Queued jobs hold their article so the quota can't be oversubscribed
+    try:
+        reservation = quota.reserve(user_id)
+    except QuotaExceeded:
+        return jsonify({
+            'error': 'No articles remaining. Please upgrade to continue generating content.'
+        }), 403
+    except Exception as e:
+        logger.error(f"Supabase error: {str(e)}")
+        return jsonify({'error': 'Error accessing subscription data'}), 500
+
+    job_id = job_store.create(user_id, {**data, '_quota_tracked': reservation.tracked})
+    job_workers.ensure_started()
+    job_workers.notify()
+
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_job(job_id):
+    job_workers.ensure_started()
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
+
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+@require_auth
+def stream_job(job_id):
+    """Server-Sent Events: `status` on every status change, then `done` with the result"""
+    job_workers.ensure_started()
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        # Don't hold a request thread for the whole job: after JOB_STREAM_MAX_SECONDS
+        # send `pending` and close; the client reconnects or polls /api/jobs/<id>
+        deadline = time.monotonic() + JOB_STREAM_MAX_SECONDS
+        current = job
+        last_status = None
+        while True:
+            if current['status'] != last_status:
+                last_status = current['status']
+                yield sse_event('status', {'job_id': job_id, 'status': last_status})
+            if last_status in ('succeeded', 'failed'):
+                yield sse_event('done', job_response(current))
+                return
+            if time.monotonic() >= deadline:
+                yield sse_event('pending', {'job_id': job_id, 'status': last_status})
+                return
+            time.sleep(JOB_STREAM_POLL_INTERVAL)
+            current = job_store.get(job_id)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/api/auth/session', methods=['GET'])
 def get_session():
     try:
@@ -372,779 +1059,311 @@ def get_session():
 
 def validate_image_url(url):
     """Validate image URL with support for S3 and other cloud storage"""
-    try:
-        # If it's an S3 URL, consider it valid
-        if 'amazonaws.com' in url:
-            return True
-
-        # For other URLs, do a light validation
-        response = requests.head(url, timeout=5)
-        content_type = response.headers.get('content-type', '')
-        return 'image' in content_type.lower()
-    except:
-        # If validation fails, still return True if URL looks valid
-        return url.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
+    return image_validator.validate(url)
 
 
-import json
+@app.route('/api/images/validate', methods=['POST', 'OPTIONS'])
+@require_auth
+def validate_images():
+    """
+    Validate every image of a document in one call.
+    Body: {"urls": [...]} and/or {"content": "<html with <img> tags>"}
+    Returns {"results": {url: valid}, "invalid": [url, ...]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No image URLs provided in the request.'}), 400
+    urls = data.get('urls') or []
+    if not isinstance(urls, list):
+        return jsonify({'error': 'Image URLs must be a list.'}), 400
+    urls = list(urls)
+    if isinstance(data.get('content'), str):
+        urls.extend(extract_image_urls(data['content']))
+
+    max_urls = image_validator.max_urls
+    if not urls:
+        return jsonify({'error': 'No image URLs provided in the request.'}), 400
+    if not all(isinstance(url, str) for url in urls):
+        return jsonify({'error': 'Image URLs must be strings.'}), 400
+    if len(set(urls)) > max_urls:
+        return jsonify({'error': f'At most {max_urls} images can be validated at once.'}), 400
+
+    results = image_validator.validate_many(urls)
+    return jsonify({
+        'results': results,
+        'invalid': [url for url, valid in results.items() if not valid]
+    })
 
 
+@metrics.timed('prompt')
 def create_prompt(user_input):
     """Generate a refined dynamic prompt for the article while preventing invented content."""
-    template_name = user_input.get('template_name', 'article_template.html')
-    article_type = user_input.get('article_type', 'general')
-
-    # Define natural writing style personas
-    style_guides = {
-        'tech': """Write this article like an experienced tech journalist. 
-                   Make complex concepts effortless to understand, 
-                   like explaining to a smart but non-expert friend. 
-                   Keep the tone confident yet engaging, avoiding dry or robotic phrasing.""",
-
-        'travel': """Write this article like a seasoned travel writer, 
-                     painting vivid pictures of places, smells, and sounds. 
-                     Blend practical insights with immersive storytelling, 
-                     making the reader feel like they're right there with you.""",
-
-        'sports': """Write this article like a professional football journalist 
-                     with deep knowledge of tactics, player development, and match analysis.  
-                     Avoid over-the-top enthusiasm—focus on expert insight and factual precision.""",
-
-        'business': """Write this article like a respected business analyst, 
-                       breaking down complex ideas into clear, actionable insights.  
-                       Keep the tone authoritative yet engaging, avoiding corporate jargon.""",
-
-        'general': """Write this article like an experienced feature writer, 
-                      crafting engaging, informative content with a natural, 
-                      flowing rhythm that keeps the reader engaged."""
-    }
+    return prompts.build_user_prompt(user_input)
 
-    style_guide = style_guides.get(article_type, style_guides['general'])
 
-    # **Strictly prevent fabricated events**
-    factual_constraint = """
-    IMPORTANT: You must NOT invent or fabricate real-world events. 
-    - Stick to verifiable facts.  
-    - If details are missing, **do NOT assume or create additional information**.  
-    - Always prioritize journalistic integrity—accuracy over speculation.
-    """
+def build_system_prompt(template_name):
+    """Build the system prompt describing the JSON structure expected for the template."""
+    return prompts.system_prompt(template_name)
+
 
-    # **Natural tone guidelines**
-    natural_tone_guidelines = """
-    To ensure a **clear, factual, and engaging tone**, follow these principles:
-
-    ✅ **Write naturally and vary your structure**  
-       - Mix content formats naturally:
-         • Use paragraphs for main narrative
-         • Add bullet points for key takeaways or lists
-         • Use blockquotes for important quotes or statistics
-       - Let the content guide the format - don't force any particular structure
-       - Transition smoothly between different formats
-
-    ✅ **Stick to the facts**  
-       - Avoid words like "unprecedented," "transformational," "game-changing"
-       - Instead, describe actual impact in neutral terms
-       - Use precise descriptions and data points
-
-    ✅ **Keep descriptions factual and engaging**  
-       - ❌ "This mind-blowing innovation is set to revolutionize everything"
-       - ✅ "This update introduces new capabilities for users, improving efficiency"
-       - Use bullet points when listing features, benefits, or key points
-       - Break up dense information into digestible formats
-
-    ✅ **Stay focused on the provided topic and data**  
-       - Do NOT introduce unrelated details or assumptions
-       - Use supporting data to strengthen your points
-       - Organize information in the most reader-friendly format
-
-    **REMEMBER:**  
-    - Journalism is about clarity and accuracy, not hype
-    - Let the data tell the story
-    - Choose the most appropriate format for each piece of information
+def build_messages(prompt, template_name, model="gpt-4o", max_tokens=None, system_prompt=None, budget_key=None):
     """
+    Chat messages for a generation and the max_tokens to request (budgeted when
+    None). system_prompt defaults to the template's, budget_key (the budget's
+    sample set) to the template name.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt or build_system_prompt(template_name)},
+        {"role": "user", "content": str(prompt)}
+    ]
+    if max_tokens is None:
+        max_tokens = token_budget.max_tokens(budget_key or template_name, count_message_tokens(messages, model), model)
+    return messages, max_tokens
 
-    # **Universal Writing Guidelines** applied to all templates
-    universal_prompt = f"""
-    {style_guide}
 
-    {factual_constraint}
+def record_completion(template_name, model, usage, max_tokens, finish_reason):
+    """Feed the completion's token usage to the metrics and the max_tokens budget"""
+    metrics.record_usage(model, usage)
+    if usage is not None:
+        token_budget.record(template_name, usage.completion_tokens, max_tokens,
+                            truncated=finish_reason == 'length')
 
-    {natural_tone_guidelines}
 
-    ### Key Writing Guidelines:
-    - Write a detailed article that fully explores the subject
-    - Stay strictly focused on the topic '{user_input['topic']}'
-    - Use varied formats where they enhance understanding:
-      • Paragraphs for main narrative
-      • Bullet points for lists or key points
-      • Blockquotes for significant quotes or data
-    - Ensure smooth transitions between different formats
-    - Use real-world examples and data to support arguments
+def completion_failed(error):
+    """
+    Error handling shared by run_gpt4 and run_gpt4_async. Upstream outages
+    (retries exhausted, circuit open, queue full) raise UpstreamUnavailable so
+    callers can answer 503; anything else is logged and gives None.
     """
+    if isinstance(error, UpstreamUnavailable):
+        logger.warning(f"LLM unavailable: {str(error)}")
+        raise error
+    if is_retryable(error):
+        logger.warning(f"LLM unavailable after retries: {str(error)}")
+        raise UpstreamUnavailable(str(error), retry_after_seconds(error)) from error
+    logger.error(f"OpenAI error details: {str(error)}")
+    return None
+
+
+def upstream_unavailable_response(error):
+    """503 with a Retry-After header for an UpstreamUnavailable"""
+    response = jsonify({'error': 'Content generation is temporarily unavailable. Please try again shortly.'})
+    response.status_code = 503
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, int(error.retry_after + 0.5)))
+    return response
 
-    # **Template-Specific Prompts**
-    if template_name in ['article_template.html', 'ss_article_template.html']:
-        prompt = f"""Write a structured article about {user_input['topic']}.
-
-        {universal_prompt}
-
-        ### Required Structure:
-        1. **Title**: Create an engaging, attention-grabbing title.
-        2. **Headline**: Write a compelling one-sentence summary.
-        3. **Meta Information**:
-           - Meta Description: A natural, SEO-friendly description (max 150 characters).
-           - Keywords: Naturally incorporate these terms: {user_input.get('keywords', '')}.
-           - Article Category: {article_type.capitalize()}.
-           - Featured Image Alt Text: A descriptive text for the featured image.
-
-        4. **Article Content:**  
-           - **Each major section must have at least 3-4 paragraphs.**
-           - **Expand on each point using supporting data and context.**
-           - **Use real-world examples where relevant.**
-           - **Ensure the article fully explores the subject.**
-
-        Use this context and data to inform your writing:
-        Context:
-        {user_input.get('context', 'No context provided.')}
-
-        Supporting Data:
-        {user_input.get('supporting_data', 'No supporting data provided.')}
-
-        ### **Final Reminder:**
-        - **Stay strictly focused on '{user_input['topic']}'.**
-        - **Do NOT assume or fabricate missing details.**
-        """
 
-    elif template_name in ['ss_match_report_template.html', 'match_report_template.html']:
-        prompt = f"""
-        Write a professional match report for {user_input['home_team']} vs {user_input['away_team']} using ONLY the provided information.
-        {universal_prompt}
-
-        ### Match Context
-        {user_input.get('context', 'No context provided.')}
-
-        ### Supporting Data & Background
-        {user_input.get('supporting_data', 'No supporting data provided.')}
-
-        ### Match Details
-        **Score**: {user_input['home_team']} {user_input['home_score']} - {user_input['away_score']} {user_input['away_team']}
-        **Competition**: {user_input['competition']}
-        **Venue**: {user_input['venue']}
-        **Date**: {user_input['match_date']}
-
-        **Goals**:
-        - {user_input['home_team']}: {user_input.get('home_scorers', 'None')}
-        - {user_input['away_team']}: {user_input.get('away_scorers', 'None')}
-
-        **Match Statistics**:
-        - xG: {user_input['home_team']} {user_input.get('home_xg', 0)} vs {user_input.get('away_xg', 0)} {user_input['away_team']}
-        - Possession: {user_input.get('home_possession')}% vs {user_input.get('away_possession')}%
-        - Shots: {user_input.get('home_shots')} ({user_input.get('home_shots_on_target')} on target) vs {user_input.get('away_shots')} ({user_input.get('away_shots_on_target')} on target)
-        - Corners: {user_input.get('home_corners')} vs {user_input.get('away_corners')}
-        - Fouls: {user_input.get('home_fouls')} vs {user_input.get('away_fouls')}
-        - Yellow Cards: {user_input.get('home_yellow_cards')} vs {user_input.get('away_yellow_cards')}
-        - Red Cards: {user_input.get('home_red_cards')} vs {user_input.get('away_red_cards')}
-
-        ### Writing Instructions:
-        1. **Match Context & Build-up** (Use the provided context and supporting data)
-           - Set the scene using the background information
-           - Discuss the significance of the match
-           - Include relevant team form and statistics
-
-        2. **Match Overview** 
-           - Comprehensive introduction
-           - Final result and its implications
-           - Key tactical observations
-
-        3. **Detailed Analysis** (Use match statistics to support your analysis)
-           - Analyze possession control
-           - Evaluate attacking effectiveness (shots, xG)
-
-        4. **Key Moments** (ONLY if explicit key events exist)
-           - Goals
-           - Disciplinary incidents
-
-        5. **Match Impact & Context** (Connect to broader context)
-           - Impact on league/competition standing
-           - Historical context (if provided)
-           - Team form implications
-
-        **Final Reminders:**
-        - Integrate the supporting data and context throughout the report
-        - Use statistics to support your analysis
-        - Maintain a professional, analytical tone
-        - Stick to the provided data - NO speculation
-        """
+def run_gpt4(prompt, template_name, model="gpt-4o", max_tokens=None, temperature=0.7, top_p=0.9, use_cache=True,
+             system_prompt=None, budget_key=None):
+    """Send prompt to GPT-4 and get structured response."""
+    logger.debug("Sending prompt to %s (%d chars)", model, len(prompt))
+    budget_key = budget_key or template_name
 
-    elif template_name == 'ss_player_scout_report_template.html':
-        prompt = f"""
-        Write a professional scout report about {user_input.get('player_name', 'Unknown Player')}.
-        {universal_prompt}
-
-        ### Provided Data:
-        - Position: {user_input.get('player_position', '')}
-        - Age: {user_input.get('player_age', '')}
-        - Nationality: {user_input.get('player_nationality', '')}
-        - Favoured Foot: {user_input.get('favored_foot', '')}
-        - Stats: {json.dumps(user_input.get('scout_stats', {}), indent=2)}
-
-        ### Writing Requirements:
-        - Expand on each attribute in full detail.
-        - Avoid brief, summary-like descriptions.
-        - Ensure stats and context are naturally woven into the narrative.
-
-        **Final Reminder:**
-        - **Stay strictly focused on '{user_input['topic']}'.**
-        - **Do NOT assume or fabricate missing details.**
-        """
+    try:
+        messages, budget = build_messages(prompt, template_name, model, max_tokens, system_prompt, budget_key)
+
+        cache_key = make_cache_key(messages[0]['content'], messages[1]['content'], model,
+                                   max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        if use_cache:
+            cached_response = llm_cache.get(cache_key)
+            if cached_response:
+                logger.debug("Using cached OpenAI response")
+                return cached_response
+
+        # **Call OpenAI API with structured input**, hedged across backends on the shared loop
+        with metrics.stage('openai'):
+            completion, backend = async_runtime.run(llm_router.complete(
+                model=model,
+                messages=messages,
+                max_tokens=budget,
+                temperature=temperature,
+                top_p=top_p,
+                response_format={"type": "json_object"}
+            ))
+        record_completion(budget_key, backend.model_for(model), completion.usage, budget,
+                          completion.choices[0].finish_reason)
 
-    return prompt
+        # **Retrieve and return the response**
+        response = completion.choices[0].message.content.strip()
+        logger.debug("Got OpenAI response (%d chars)", len(response))
+        # A cut-off completion is still used, but not served again from the cache
+        if response and completion.choices[0].finish_reason != 'length':
+            llm_cache.set(cache_key, response)
+        return response
 
+    except Exception as e:
+        return completion_failed(e)
 
-import json
 
+def stream_gpt4(prompt, template_name, model="gpt-4o", max_tokens=None, temperature=0.7, top_p=0.9):
+    """Stream the GPT-4 response, yielding text deltas as they arrive."""
+    messages, budget = build_messages(prompt, template_name, model, max_tokens)
 
-def run_gpt4(prompt, template_name, model="gpt-4o", max_tokens=16000, temperature=0.7, top_p=0.9):
-    """Send prompt to GPT-4 and get structured response."""
-    print("Using model:", model)  # Debug log
-    print("Sending prompt:", prompt[:500] + "...")  # Debug first 500 chars of prompt
+    # Streams aren't hedged or retried (the client may already have sections),
+    # they go to the currently fastest backend
+    backend = llm_router.primary()
+    model = backend.model_for(model)
 
-    try:
-        # **Universal System Prompt** ensuring consistency across all templates
-        universal_system_prompt = """
-        You are a professional journalist and analyst. Your task is to generate a structured, well-written, and engaging response based on the provided input.
-
-        ### Writing Guidelines:
-        - **Keep responses detailed and informative**—each major section should contain **at least 3-4 paragraphs**.
-        - **Maintain strict focus on the provided topic**—avoid unrelated tangents.
-        - **Avoid dramatic language, exaggeration, or sweeping statements**.
-        - **Stick to real-world data**—do **not** assume or fabricate missing details.
-        - **Ensure responses are formatted as structured JSON**.
-        - **Write in a natural, engaging tone**—avoid robotic phrasing.
-        - **Vary sentence structure**—mix short, punchy lines with longer, flowing sentences.
-        - **Use contractions** (e.g., "he's" instead of "he is") for a more conversational feel.
-        - **Avoid overly formal or passive phrases**—write like a human, not a report.
-        - **Use real-world examples, context, and subtle emotion to enhance storytelling.**
-        - **Ensure smooth transitions between ideas**—avoid abrupt sectioning.
-        - **Strictly follow the provided topic and data**—do NOT introduce unrelated details.
-
-
-        Your response **must be well-structured and follow the format outlined below**.
-        """
+    with llm_router.limiter, metrics.stage('openai_stream'):
+        # Only once a slot is held, so a half-open trial always reaches the except clauses below
+        backend.breaker.allow()
+        try:
+            stream = backend.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=budget,
+                temperature=temperature,
+                top_p=top_p,
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True}
+            )
 
-        # **Template-Specific Prompts**
-        if template_name in ['match_report_template.html', 'ss_match_report_template.html']:
-            system_prompt = f"""{universal_system_prompt}
-
-            You are an expert sports journalist specializing in match reports. Your job is to **write a structured, professional match report**
-
-            Return your response in the following JSON format:
-            {{
-                "template_data": {{
-                    "headline": string,  // Engaging match headline
-                    "match_summary": string,  // Brief overview of the match
-                    "featured_image_alt": string
-                }},
-                "meta_data": {{
-                    "meta_description": string,
-                    "keywords": array of strings,
-                    "og_title": string,
-                    "og_description": string,
-                    "twitter_title": string,
-                    "twitter_description": string
-                }},
-                "match_report": [
-                    {{
-                        "type": string,  
-                        "heading": string,
-                        "content": array of strings (paragraphs)
-                    }}
-                ],
-                "match_stats": {{
-                    "possession": object,  // e.g., {{"home": 60, "away": 40}}
-                    "shots_on_target": object,
-                    "corners": object,
-                    "key_events": array of objects  // e.g., [{{"time": "23'", "event": "Goal", "team": "home"}}]
-                }}
-            }}
-
-            ### Report Guidelines:
-            - **Ensure that all analysis is backed by provided statistics**.
-            - **Use appropriate football terminology** (e.g., "high press," "deep block," "clinical finishing").
-            """
-
-        elif template_name == 'ss_player_scout_report_template.html':
-            system_prompt = f"""{universal_system_prompt}
-
-            You are a professional football analyst specializing in writing scout reports. Your task is to provide an **in-depth, structured scouting analysis** of a player based on the provided data.
-
-            Return your response in the following JSON format:
-            {{
-                "template_data": {{
-                    "headline": string,  // Engaging report title
-                    "summary": string,  // Brief summary of the report
-                    "featured_image_alt": string
-                }},
-                "meta_data": {{
-                    "meta_description": string,
-                    "keywords": array of strings,
-                    "og_title": string,
-                    "og_description": string,
-                    "twitter_title": string,
-                    "twitter_description": string
-                }},
-                "scout_report": [
-                    {{
-                        "type": "section",
-                        "heading": string,  // Section heading
-                        "content": array of strings (single paragraph or cohesive blocks)
-                    }}
-                ]
-            }}
-
-            ### Scouting Report Guidelines:
-            - **Ensure each section contains detailed analysis** (minimum **3-4 paragraphs per section**).
-            - **Avoid over-reliance on statistics**—explain how the numbers translate into performance.
-            - **Discuss technical ability, tactical understanding, physical attributes, and mentality**.
-            - **Maintain an objective, data-driven perspective**—do not overhype or make speculative claims.
-            """
-
-        else:  # General articles
-            system_prompt = f"""{universal_system_prompt}
-
-            You are an experienced journalist with expertise in writing structured, well-researched articles. Your task is to produce a **cohesive, insightful article** on the given topic.
-
-            Return your response in the following JSON format:
-            {{
-                "template_data": {{
-                    "headline": string,  // Engaging article title
-                    "short_title": string,  // One-sentence summary
-                    "featured_image_alt": string,  // SEO-optimized alt text for the featured image
-                    "article_category": string,
-                    "slug": string  // URL-friendly version of title
-                }},
-                "meta_data": {{
-                    "meta_description": string (150-160 characters, compelling and keyword-rich),
-                    "keywords": array of strings (primary and secondary keywords),
-                    "publish_date": string (YYYY-MM-DD),
-                    "author": string,
-                    "og_title": string,  // Optimized for social sharing
-                    "og_description": string,  // Optimized for social sharing
-                    "twitter_title": string,  // Optimized for Twitter
-                    "twitter_description": string,  // Optimized for Twitter
-                    "schema_type": string,  // e.g., "Article", "NewsArticle", "BlogPosting"
-                    "focus_keyword": string  // Primary keyword for the article
-                }},
-                "article_content": [
-                    {{
-                        "type": "section",
-                        "heading": string,
-                        "content": array of strings 
-                    }}
-                ]
-            }}
-
-            ### Article Writing Guidelines:
-            - **Each major section must have at least 3-4 paragraphs**.
-            - **Use real-world examples, data, and analysis to support claims**.
-            - **Maintain an engaging, yet neutral tone**—no hyperbole or exaggerated statements.
-            - **Ensure a smooth narrative flow between sections**—avoid robotic, list-based structures.
-            - **Write as if you're recounting a memorable story to a friend—let your language flow naturally.
-            - **Add subtle personal touches and natural expressions, but keep it factual and precise.
-            """
-
-        # **Call OpenAI API with structured input**
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": str(prompt)}
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            response_format={"type": "json_object"}
-        )
+            finish_reason = None
+            for chunk in stream:
+                # The final chunk has no choices, only the usage
+                if getattr(chunk, 'usage', None):
+                    record_completion(template_name, model, chunk.usage, budget, finish_reason)
+                if not chunk.choices:
+                    continue
+                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+                if chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            if not is_retryable(e):
+                backend.breaker.release_trial()
+                raise
+            backend.breaker.record_failure()
+            raise UpstreamUnavailable(str(e), retry_after_seconds(e)) from e
+        except GeneratorExit:
+            backend.breaker.release_trial()
+            raise
+        backend.breaker.record_success()
+
+
+async def run_gpt4_async(prompt, template_name, model="gpt-4o", max_tokens=None, temperature=0.7, top_p=0.9,
+                         use_cache=True, system_prompt=None, budget_key=None):
+    """Async version of run_gpt4 using the shared AsyncOpenAI client."""
+    budget_key = budget_key or template_name
+    try:
+        messages, budget = build_messages(prompt, template_name, model, max_tokens, system_prompt, budget_key)
+
+        cache_key = make_cache_key(messages[0]['content'], messages[1]['content'], model,
+                                   max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        if use_cache:
+            cached_response = llm_cache.get(cache_key)
+            if cached_response:
+                return cached_response
+
+        with metrics.stage('openai'):
+            completion, backend = await llm_router.complete(
+                model=model,
+                messages=messages,
+                max_tokens=budget,
+                temperature=temperature,
+                top_p=top_p,
+                response_format={"type": "json_object"}
+            )
+        record_completion(budget_key, backend.model_for(model), completion.usage, budget,
+                          completion.choices[0].finish_reason)
 
-        # **Retrieve and return the response**
         response = completion.choices[0].message.content.strip()
-        print("Got OpenAI response:", response[:200] + "...")  # Debug first 200 chars of response
+        if response and completion.choices[0].finish_reason != 'length':
+            llm_cache.set(cache_key, response)
         return response
 
     except Exception as e:
-        print(f"OpenAI error details: {str(e)}")  # Debug log
-        return None
-def format_article_content(gpt_response, template_type):
-    """
-    Convert GPT JSON response into template-ready HTML content based on template type
-    """
-    try:
-        response_data = json.loads(gpt_response)
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        # Default template_vars
-        template_vars = {
-            'headline': 'Default Headline',
-            'article_content': '<p>No content available.</p>',
-            'meta_description': 'Default meta description.',
-            'keywords': ['default', 'keywords'],
-            'publish_date': current_date,
-            'featured_image_url': '/static/images/default-match-image.jpg',
-            'featured_image_alt': 'Default image alt text.',
-            'article_category': 'Default Category',
-            'hero_image_position': 'center center',
-        }
-        # Default image values
-        default_image_url = '/static/images/default-match-image.jpg'
-        default_image_alt = 'Football match report'
-
-        if template_type == 'match_report_template.html':
-            match_content = []
-            for section in response_data['match_report']:
-                match_content.append(f'\n<section class="match-section">\n')
-                if 'heading' in section:
-                    match_content.append(f'<h2>{section["heading"]}</h2>\n')
-                for paragraph in section['content']:
-                    match_content.append(f'<p>{paragraph}</p>\n')
-                match_content.append('</section>\n')
-
-            # Get image URL from request or use default
-            image_url = request.json.get('image_url')
-            if not image_url or image_url.strip() == '':
-                image_url = default_image_url
-
-            # Get image alt from GPT response or use default
-            image_alt = response_data['template_data'].get('featured_image_alt')
-            if not image_alt or image_alt.strip() == '':
-                image_alt = f"{request.json.get('home_team', '')} vs {request.json.get('away_team', '')} match report"
-
-            template_vars.update({
-                'headline': response_data['template_data']['headline'],
-                'match_summary': response_data['template_data'].get('match_summary', ''),
-                'article_content': '\n'.join(match_content),
-                'meta_description': response_data['meta_data']['meta_description'],
-                'keywords': response_data['meta_data'].get('keywords', []),
-                'publish_date': current_date,
-                # Image fields with defaults
-                'featured_image_url': image_url,
-                'featured_image_alt': image_alt,
-
-                'article_category': 'Sports',
-                # Match-specific data
-                'home_team': request.json.get('home_team', ''),
-                'away_team': request.json.get('away_team', ''),
-                'home_score': request.json.get('home_score', ''),
-                'away_score': request.json.get('away_score', ''),
-                'home_lineup': request.json.get('home_lineup', ''),
-                'away_lineup': request.json.get('away_lineup', ''),
-                'competition': request.json.get('competition', ''),
-                'match_date': request.json.get('match_date', ''),
-                'venue': request.json.get('venue', ''),
-
-                # Additional meta data
-                'schema_type': 'SportsEvent',
-                'og_title': response_data['meta_data'].get('og_title', ''),
-                'og_description': response_data['meta_data'].get('og_description', ''),
-                'twitter_title': response_data['meta_data'].get('twitter_title', ''),
-                'twitter_description': response_data['meta_data'].get('twitter_description', ''),
-                'author': response_data['meta_data'].get('author', 'Sports Reporter'),
-                'publisher_name': request.json.get('publisher_name', ''),
-                # Add lineup data
-                'home_lineup': request.json.get('home_lineup', ''),
-                'away_lineup': request.json.get('away_lineup', ''),
-                # Match stats
-                'match_stats': {
-                    'possession': {
-                        'home': request.json.get('home_possession', 50),
-                        'away': request.json.get('away_possession', 50)
-                    },
-                    'shots': {
-                        'home': request.json.get('home_shots', 0),
-                        'away': request.json.get('away_shots', 0)
-                    },
-                    'shots_on_target': {
-                        'home': request.json.get('home_shots_on_target', 0),
-                        'away': request.json.get('away_shots_on_target', 0)
-                    },
-                    'corners': {
-                        'home': request.json.get('home_corners', 0),
-                        'away': request.json.get('away_corners', 0)
-                    },
-                    'fouls': {
-                        'home': request.json.get('home_fouls', 0),
-                        'away': request.json.get('away_fouls', 0)
-                    },
-                    'yellow_cards': {
-                        'home': request.json.get('home_yellow_cards', 0),
-                        'away': request.json.get('away_yellow_cards', 0)
-                    },
-                    'red_cards': {
-                        'home': request.json.get('home_red_cards', 0),
-                        'away': request.json.get('away_red_cards', 0)
-                    },
-                    'offsides': {
-                        'home': request.json.get('home_offsides', 0),
-                        'away': request.json.get('away_offsides', 0)
-                    },
-                    'xg': {
-                        'home': float(request.json.get('home_xg', 0.0)),
-                        'away': float(request.json.get('away_xg', 0.0))
-                    }
-                },
-                'theme': request.json.get('theme', {}),
-                'hero_image_position': request.json.get('hero_image_position', 'center center')
-            })
+        return completion_failed(e)
 
-        elif template_type in ['match_report_template.html', 'ss_match_report_template.html']:
-            # For updates, the content might come directly rather than in sections
-            if isinstance(gpt_response, dict) and 'article_content' in gpt_response:
-                # Direct content update
-                template_vars.update({
-                    'headline': gpt_response.get('headline', ''),
-                    'match_summary': gpt_response.get('match_summary', ''),
-                    'article_content': gpt_response.get('article_content', ''),
-                    'meta_description': gpt_response.get('meta_description', ''),
-                    # ... preserve other fields ...
-                })
-            else:
-                # Original content generation path
-                match_content = []
-                for section in response_data['match_report']:
-                    match_content.append(f'\n<div class="ss-match-section">\n')
-                    if 'heading' in section:
-                        match_content.append(f'<h2 class="ss-section-heading">{section["heading"]}</h2>\n')
-                    for paragraph in section['content']:
-                        match_content.append(f'<p class="ss-content-paragraph">{paragraph}</p>\n')
-                    match_content.append('</div>\n')
-                
-                template_vars.update({
-                    'headline': response_data['template_data']['headline'],
-                    'match_summary': response_data['template_data'].get('match_summary', ''),
-                    'article_content': '\n'.join(match_content),
-                    'meta_description': response_data['meta_data']['meta_description'],
-                    'keywords': response_data['meta_data'].get('keywords', []),
-                    'publish_date': current_date,
-                    'featured_image_url': request.json.get('image_url', default_image_url),
-                    'featured_image_alt': response_data['template_data'].get('featured_image_alt', default_image_alt),
-                    'article_category': 'Sports',
-                    # Match-specific data
-                    'home_team': request.json.get('home_team', ''),
-                    'away_team': request.json.get('away_team', ''),
-                    'home_score': request.json.get('home_score', ''),
-                    'away_score': request.json.get('away_score', ''),
-                    'home_lineup': request.json.get('home_lineup', ''),
-                    'away_lineup': request.json.get('away_lineup', ''),
-                    'competition': request.json.get('competition', ''),
-                    'match_date': request.json.get('match_date', ''),
-                    'venue': request.json.get('venue', ''),
-                    # Additional meta data
-                    'schema_type': 'SportsEvent',
-                    'og_title': response_data['meta_data'].get('og_title', ''),
-                    'og_description': response_data['meta_data'].get('og_description', ''),
-                    'twitter_title': response_data['meta_data'].get('twitter_title', ''),
-                    'twitter_description': response_data['meta_data'].get('twitter_description', ''),
-                    'author': response_data['meta_data'].get('author', 'Sports Reporter'),
-                    'publisher_name': request.json.get('publisher_name', ''),
-                    # Match stats
-                    'match_stats': {
-                        'possession': {
-                            'home': request.json.get('home_possession', 50),
-                            'away': request.json.get('away_possession', 50)
-                        },
-                        'shots': {
-                            'home': request.json.get('home_shots', 0),
-                            'away': request.json.get('away_shots', 0)
-                        },
-                        'shots_on_target': {
-                            'home': request.json.get('home_shots_on_target', 0),
-                            'away': request.json.get('away_shots_on_target', 0)
-                        },
-                        'corners': {
-                            'home': request.json.get('home_corners', 0),
-                            'away': request.json.get('away_corners', 0)
-                        },
-                        'fouls': {
-                            'home': request.json.get('home_fouls', 0),
-                            'away': request.json.get('away_fouls', 0)
-                        },
-                        'yellow_cards': {
-                            'home': request.json.get('home_yellow_cards', 0),
-                            'away': request.json.get('away_yellow_cards', 0)
-                        },
-                        'red_cards': {
-                            'home': request.json.get('home_red_cards', 0),
-                            'away': request.json.get('away_red_cards', 0)
-                        },
-                        'offsides': {
-                            'home': request.json.get('home_offsides', 0),
-                            'away': request.json.get('away_offsides', 0)
-                        },
-                        'xg': {
-                            'home': float(request.json.get('home_xg', 0.0)),
-                            'away': float(request.json.get('away_xg', 0.0))
-                        }
-                    },
-                    'theme': request.json.get('theme', {}),
-                    'hero_image_position': request.json.get('hero_image_position', 'center center')
-                })
-        elif template_type == 'ss_player_scout_report_template.html':
-            # == New Player Scout Report ==
-            scout_content = []
-
-            # Process the correct key: 'scout_report'
-            for section in response_data.get('scout_report', []):
-                # Open a new section with the appropriate class
-                scout_content.append('<section class="scout-report-section">\n')
-
-                # Add the heading if it exists
-                if 'heading' in section:
-                    scout_content.append(f'<h2>{section["heading"]}</h2>\n')
-
-                # Add each paragraph separately to preserve structure
-                if 'content' in section:
-                    for paragraph in section['content']:
-                        scout_content.append(f'<p>{paragraph}</p>\n')
-
-                # Close the section
-                scout_content.append('</section>\n')
-
-            # Ensure the image fields are handled properly
-            image_url = request.json.get('image_url', default_image_url)
-            image_alt = response_data.get('template_data', {}).get('featured_image_alt', default_image_alt)
-
-            # Parse the recent form data
-            recent_form_text = request.json.get('scout_stats', {}).get('Recent Form', '')
-            form_summary, recent_matches = parse_recent_form(recent_form_text)
-
-            # Build template_vars specifically for the "Player Scout Report"
-            template_vars.update({
-                'headline': response_data['template_data'].get('headline', 'Default Headline'),
-                'summary': response_data['template_data'].get('summary', 'Default Summary'),
-                'article_content': '\n'.join(scout_content),
-                'meta_description': response_data['meta_data'].get('meta_description', 'Default meta description.'),
-                'meta_title': response_data['template_data'].get('headline', 'Default Headline'),
-                'title': response_data['template_data'].get('headline', 'Default Headline'),
-                'featured_image_url': image_url,
-                'featured_image_alt': image_alt,
-                'player_name': request.json.get('player_name', 'Unknown Player'),
-                'player_position': request.json.get('player_position', 'Unknown Position'),
-                'player_age': request.json.get('player_age', 'Unknown Age'),
-                'player_nationality': request.json.get('player_nationality', 'Unknown Nationality'),
-                'favored_foot': request.json.get('favored_foot', 'Unknown'),
-                'og_title': response_data['template_data'].get('headline', 'Default Headline'),
-                'og_description': response_data['meta_data'].get('meta_description', 'Default meta description.'),
-                'keywords': ', '.join(response_data['meta_data'].get('keywords', [])),  # Convert list to string
-                'scout_stats': request.json.get('scout_stats', 'No stats available.'),
-                'form_summary': form_summary,
-                'recent_matches': recent_matches,  # Add the parsed matches data
-                'hero_image_position': request.json.get('hero_image_position', 'center center'),
-                'theme': request.json.get('theme', {}),
-                'hero_image_position': request.json.get('hero_image_position', 'center center'),
-            })
 
+def use_parallel_generation(data, template_name):
+    return data.get('generation_mode', DEFAULT_GENERATION_MODE) == 'parallel' and template_name in PARALLEL_TEMPLATES
 
-        elif template_type in ['article_template.html', 'ss_article_template.html']:
-            html_content = []
-            main_headline = response_data['template_data'].get('headline', '')
-            
-            for section in response_data['article_content']:
-                if section.get('heading') and section["heading"] == main_headline:
-                    continue
 
-                if 'heading' in section:
-                    html_content.append(f'<h2>{section["heading"]}</h2>')
-
-                for content in section['content']:
-                    # Check if content is a string (paragraph) or a list (bullet points)
-                    if isinstance(content, str):
-                        # Regular paragraph
-                        clean_paragraph = content.replace('<p>', '').replace('</p>', '').strip()
-                        html_content.append(f'<p>{clean_paragraph}</p>')
-                    elif isinstance(content, dict):
-                        # Handle different content types
-                        content_type = content.get('type', 'paragraph')
-                        content_text = content.get('text', '')
-
-                        if content_type == 'bullet_list':
-                            # Handle bullet points
-                            points = content.get('points', [])
-                            html_content.append('<ul>')
-                            for point in points:
-                                html_content.append(f'<li>{point}</li>')
-                            html_content.append('</ul>')
-                        elif content_type == 'numbered_list':
-                            # Handle numbered lists
-                            items = content.get('items', [])
-                            html_content.append('<ol>')
-                            for item in items:
-                                html_content.append(f'<li>{item}</li>')
-                            html_content.append('</ol>')
-                        elif content_type == 'blockquote':
-                            # Handle blockquotes
-                            html_content.append(f'<blockquote>{content_text}</blockquote>')
-
-            # Rest of the template_vars update remains the same
-            template_vars.update({
-                "headline": response_data['template_data'].get('headline', ''),
-                "article_title": response_data['template_data'].get('headline', ''),
-                "article_content": '\n'.join(html_content),  # Join as single HTML string
-                "featured_image_url": request.json.get("image_url", default_image_url),
-                "featured_image_alt": response_data['template_data'].get('featured_image_alt', default_image_alt),
-                "meta_description": response_data['meta_data'].get('meta_description', ''),
-                "meta_title": response_data['template_data'].get('headline', ''),
-                "title": response_data['template_data'].get('headline', ''),
-                "keywords": response_data['meta_data'].get('keywords', ''),
-                "publish_date": current_date,
-                "author": response_data['meta_data'].get('author', ''),
-                "publisher_name": request.json.get("publisher_name", ''),
-                "og_title": response_data['meta_data'].get('og_title', ''),
-                "og_description": response_data['meta_data'].get('og_description', ''),
-                "twitter_title": response_data['meta_data'].get('twitter_title', ''),
-                "twitter_description": response_data['meta_data'].get('twitter_description', ''),
-                'hero_image_position': request.json.get('hero_image_position', 'center center'),
-                'theme': request.json.get('theme', {}),
-                'hero_image_position': request.json.get('hero_image_position', 'center center')
-            })
+async def generate_parallel_async(data, template_name, use_cache=True):
+    """
+    Outline-then-sections generation: one small completion returns the
+    metadata and an outline, then each section is written by its own
+    completion, at most PARALLEL_SECTION_CONCURRENCY at a time. Returns the
+    assembled response in the same JSON shape as a single completion, so it is
+    formatted the same way. A section that failed is left as null at its
+    outline position, so it is reported missing under that index and can be
+    regenerated in place. Without a usable outline it falls back to a single
+    completion.
+    """
+    user_input = {**data, 'template_name': template_name}
+    outline_response = await run_gpt4_async(
+        prompts.build_outline_prompt(user_input), template_name, use_cache=use_cache,
+        system_prompt=prompts.outline_system_prompt(template_name), budget_key=f'{template_name}#outline'
+    )
+    plan = parse_outline(outline_response, prompts.OUTLINE_MAX_SECTIONS) if outline_response else None
+    if plan is None:
+        logger.warning(f"No usable outline for {template_name}, generating in a single completion")
+        return await run_gpt4_async(create_prompt(user_input), template_name, use_cache=use_cache)
+
+    outline = plan['outline']
+    system_prompt = prompts.outlined_section_system_prompt(template_name)
+    semaphore = asyncio.Semaphore(PARALLEL_SECTION_CONCURRENCY)
+
+    async def write_section(index):
+        async with semaphore:
+            response = await run_gpt4_async(
+                prompts.build_outlined_section_prompt(user_input, outline, index), template_name,
+                use_cache=use_cache, system_prompt=system_prompt,
+                budget_key=f'{template_name}#section'
+            )
+        section = parse_section(response, template_name) if response else None
+        if section is not None and not section.get('heading'):
+            section['heading'] = outline[index]['heading']
+        return section
+
+    results = await asyncio.gather(*(write_section(index) for index in range(len(outline))),
+                                   return_exceptions=True)
+    sections = []
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Section {index + 1} of {len(outline)} for {template_name} failed: {str(result)}")
+            result = None
+        sections.append(result)
+
+    if not any(sections):
+        unavailable = next((result for result in results if isinstance(result, UpstreamUnavailable)), None)
+        if unavailable is not None:
+            raise unavailable
+        return None
+    return json.dumps({
+        'template_data': plan['template_data'],
+        'meta_data': plan['meta_data'],
+        get_section_key(template_name): sections,
+    })
 
-            return template_vars
 
-        else:
-            # Original format for standard article template
-            html_content = []
-            for section in response_data['article_content']:
-                html_content.append(f'\n<section itemscope itemtype="https://schema.org/Article">\n')
-                html_content.append(f'<h2 itemprop="headline">{section["heading"]}</h2>\n')
-                for paragraph in section['content']:
-                    html_content.append(f'<p itemprop="text">{paragraph}</p>\n')
-                html_content.append('</section>\n')
-
-            template_vars.update({
-                'article_title': response_data['template_data']['headline'],
-                'short_title': response_data['template_data']['short_title'],
-                'headline': response_data['template_data']['headline'],
-                'featured_image_alt': response_data['template_data']['featured_image_alt'],
-                'article_category': response_data['template_data']['article_category'],
-                'slug': response_data['template_data']['slug'],
-                'article_content': '\n'.join(html_content),
-                'meta_description': response_data['meta_data']['meta_description'],
-                'keywords': ', '.join(response_data['meta_data']['keywords']),
-                'publish_date': current_date,
-                'author': response_data['meta_data']['author'],
-                'og_title': response_data['meta_data']['og_title'],
-                'og_description': response_data['meta_data']['og_description'],
-                'twitter_title': response_data['meta_data']['twitter_title'],
-                'twitter_description': response_data['meta_data']['twitter_description'],
-                'schema_type': response_data['meta_data']['schema_type'],
-                'focus_keyword': response_data['meta_data']['focus_keyword'],
-                'publisher_name': request.json.get('publisher_name', ''),
-                'hero_image_position': request.json.get('hero_image_position', 'center center'),
-                'theme': request.json.get('theme', {}),
-                'hero_image_position': request.json.get('hero_image_position', 'center center'),
-            })
+def generate_parallel(data, template_name, use_cache=True):
+    """generate_parallel_async from a request thread, on the shared event loop"""
+    return async_runtime.run(generate_parallel_async(data, template_name, use_cache=use_cache))
 
-        return template_vars
 
+@metrics.timed('format')
+def format_article_content(gpt_response, template_type, request_data=None):
+    """
+    Convert GPT JSON response into template-ready HTML content based on template type.
+    request_data defaults to the current request's JSON body (none outside a request).
+    What is recovered from a truncated response is formatted, with the parts
+    that are missing listed under 'missing_parts'.
+    """
+    try:
+        if request_data is None and has_request_context():
+            request_data = request.get_json(silent=True)
+        parsed = parse_llm_output(gpt_response, template_type)
+        if parsed is None:
+            return None
+        template_vars = format_content(parsed.data, template_type, request_data)
+        if parsed.missing:
+            template_vars['missing_parts'] = parsed.missing
+        return template_vars
     except Exception as e:
-        print(f"Error formatting article content: {str(e)}")
+        logger.error(f"Error formatting article content: {str(e)}")
         return None
 
 
@@ -1159,14 +1378,18 @@ def generate_article_api():
         template_name = data.get('template_name', 'article_template.html')
 
         # Get GPT response
-        gpt_response = run_gpt4(prompt, template_name)
+        try:
+            gpt_response = run_gpt4(prompt, template_name)
+        except UpstreamUnavailable as e:
+            return upstream_unavailable_response(e)
+        if not gpt_response:
+            raise ValueError("Failed to generate content")
 
         # Format for template
         template_vars = format_article_content(gpt_response, template_name)
-        template_vars['featured_image_url'] = image_url
-
         if template_vars is None:
             raise ValueError("Failed to format article content")
+        template_vars['featured_image_url'] = image_url
 
         # Return the rendered HTML content
         return jsonify({
@@ -1180,69 +1403,76 @@ def generate_article_api():
 
 
 
+def download_template_vars(content, template_name):
+    """Template variables for a downloaded article from its edited content"""
+    # Create template variables based on the template type
+    template_vars = {
+        'headline': content.get('headline', ''),
+        'article_content': content.get('article_content', ''),
+        'meta_description': content.get('meta_description', ''),
+        'keywords': content.get('keywords', ''),
+        'featured_image_url': content.get('featured_image_url', ''),
+        'featured_image_alt': content.get('featured_image_alt', ''),
+        'publish_date': datetime.now().strftime("%Y-%m-%d"),
+        'author': content.get('author', ''),
+        'publisher_name': content.get('publisher_name', ''),
+        'hero_image_position': content.get('hero_image_position', 'center 50%'),
+        'theme': content.get('theme', {})
+    }
+
+    # Add template-specific variables
+    if template_name in ['article_template.html', 'ss_article_template.html']:
+        template_vars.update({
+            'article_title': content.get('headline', ''),
+            'short_title': content.get('short_title', ''),
+            'article_category': content.get('article_category', ''),
+            'slug': content.get('slug', ''),
+            'og_title': content.get('og_title', ''),
+            'og_description': content.get('og_description', ''),
+            'twitter_title': content.get('twitter_title', ''),
+            'twitter_description': content.get('twitter_description', ''),
+            'schema_type': content.get('schema_type', 'Article'),
+            'focus_keyword': content.get('focus_keyword', '')
+        })
+    elif template_name in ['match_report_template.html', 'ss_match_report_template.html']:
+        template_vars.update({
+            'home_team': content.get('home_team', ''),
+            'away_team': content.get('away_team', ''),
+            'home_score': content.get('home_score', ''),
+            'away_score': content.get('away_score', ''),
+            'competition': content.get('competition', ''),
+            'match_date': content.get('match_date', ''),
+            'venue': content.get('venue', ''),
+            'home_lineup': content.get('home_lineup', ''),
+            'away_lineup': content.get('away_lineup', ''),
+            'key_events': content.get('key_events', ''),
+            'match_stats': content.get('match_stats', {})  # Just pass through the match_stats object directly
+        })
+    elif template_name == 'ss_player_scout_report_template.html':
+        template_vars.update({
+            'player_name': content.get('player_name', ''),
+            'player_position': content.get('player_position', ''),
+            'player_age': content.get('player_age', ''),
+            'player_nationality': content.get('player_nationality', ''),
+            'favored_foot': content.get('favored_foot', ''),
+            'scout_stats': content.get('scout_stats', ''),
+            'summary': content.get('summary', ''),
+            'form_summary': content.get('form_summary', {}),
+            'recent_matches': content.get('recent_matches', [])
+        })
+
+    return template_vars
+
+
 @app.route('/api/download_article', methods=['POST'])
 def download_article():
     try:
         content = request.json
         template_name = content.get('template_name', 'article_template.html')
 
-        # Create template variables based on the template type
-        template_vars = {
-            'headline': content.get('headline', ''),
-            'article_content': content.get('article_content', ''),
-            'meta_description': content.get('meta_description', ''),
-            'keywords': content.get('keywords', ''),
-            'featured_image_url': content.get('featured_image_url', ''),
-            'featured_image_alt': content.get('featured_image_alt', ''),
-            'publish_date': datetime.now().strftime("%Y-%m-%d"),
-            'author': content.get('author', ''),
-            'publisher_name': content.get('publisher_name', ''),
-            'hero_image_position': content.get('hero_image_position', 'center 50%'),
-            'theme': content.get('theme', {})
-        }
+        template_vars = download_template_vars(content, template_name)
 
-        # Add template-specific variables
-        if template_name in ['article_template.html', 'ss_article_template.html']:
-            template_vars.update({
-                'article_title': content.get('headline', ''),
-                'short_title': content.get('short_title', ''),
-                'article_category': content.get('article_category', ''),
-                'slug': content.get('slug', ''),
-                'og_title': content.get('og_title', ''),
-                'og_description': content.get('og_description', ''),
-                'twitter_title': content.get('twitter_title', ''),
-                'twitter_description': content.get('twitter_description', ''),
-                'schema_type': content.get('schema_type', 'Article'),
-                'focus_keyword': content.get('focus_keyword', '')
-            })
-        elif template_name in ['match_report_template.html', 'ss_match_report_template.html']:
-            template_vars.update({
-                'home_team': content.get('home_team', ''),
-                'away_team': content.get('away_team', ''),
-                'home_score': content.get('home_score', ''),
-                'away_score': content.get('away_score', ''),
-                'competition': content.get('competition', ''),
-                'match_date': content.get('match_date', ''),
-                'venue': content.get('venue', ''),
-                'home_lineup': content.get('home_lineup', ''),
-                'away_lineup': content.get('away_lineup', ''),
-                'key_events': content.get('key_events', ''),
-                'match_stats': content.get('match_stats', {})  # Just pass through the match_stats object directly
-            })
-        elif template_name == 'ss_player_scout_report_template.html':
-            template_vars.update({
-                'player_name': content.get('player_name', ''),
-                'player_position': content.get('player_position', ''),
-                'player_age': content.get('player_age', ''),
-                'player_nationality': content.get('player_nationality', ''),
-                'favored_foot': content.get('favored_foot', ''),
-                'scout_stats': content.get('scout_stats', ''),
-                'summary': content.get('summary', ''),
-                'form_summary': content.get('form_summary', {}),
-                'recent_matches': content.get('recent_matches', [])
-            })
-
-        rendered_html = render_template(template_name, **template_vars)
+        rendered_html = template_renderer.render(template_name, **template_vars)
 
         buffer = io.BytesIO()
         buffer.write(rendered_html.encode('utf-8'))
@@ -1258,44 +1488,82 @@ def download_article():
         )
 
     except Exception as e:
-        print(f"Download error: {str(e)}")
+        logger.error(f"Download error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 
-def parse_recent_form(form_text):
-    lines = form_text.split('\n')
-
-    # Parse summary line: "Total: 3 goals from 10 shots (8 on target, 1.11 xG)"
-    summary = {}
-    if lines and lines[1].startswith('Total:'):
-        summary_line = lines[1]
-        summary['goals'] = int(summary_line.split(' goals')[0].split(': ')[1])
-        summary['shots'] = int(summary_line.split('from ')[1].split(' shots')[0])
-        summary['on_target'] = int(summary_line.split('(')[1].split(' on')[0])
-        summary['xg'] = float(summary_line.split(', ')[1].split(' xG')[0])
-
-    # Parse matches (your existing parse_recent_matches logic)
-    matches = []
-    for line in lines[3:]:  # Skip header and summary lines
-        if line.startswith('- vs'):
-            # Parse: "- vs Nottm Forest (H): 0 goals from 1 shots (1 on target, 0.03 xG)"
-            match_data = {}
-
-            # Get opponent and venue
-            team_venue = line.split('- vs ')[1].split(':')[0]
-            match_data['opponent'] = team_venue.split(' (')[0]
-            match_data['venue'] = 'Home' if '(H)' in team_venue else 'Away'
-
-            # Get stats
-            stats = line.split(': ')[1]
-            match_data['goals'] = int(stats.split(' goals')[0])
-            match_data['shots'] = int(stats.split('from ')[1].split(' shots')[0])
-            match_data['on_target'] = int(stats.split('(')[1].split(' on')[0])
-            match_data['xg'] = float(stats.split(', ')[1].split(' xG')[0])
+@metrics.timed('render')
+def render_download(content):
+    """Render an export item (a download_article payload) outside of a request"""
+    template_name = resolve_template_name(content)
+    template_vars = download_template_vars(content, template_name)
+    with app.app_context():
+        return template_renderer.render(template_name, **template_vars)
+
+
+def download_filename(content):
+    return f"{secure_filename((content.get('headline') or '').replace(' ', '-')) or 'article'}.html"
+
+
+def load_saved_articles(user_id, article_ids):
+    """The user's saved articles by id, as download_article payloads"""
+    response = supabase_client.table('articles')\
+        .select('id, template_name, raw_content')\
+        .eq('user_id', user_id)\
+        .in_('id', article_ids)\
+        .execute()
+    articles = {}
+    for row in response.data:
+        raw_content = row.get('raw_content') or {}
+        if isinstance(raw_content, str):
+            raw_content = json.loads(raw_content)
+        articles[str(row['id'])] = {
+            **raw_content,
+            'template_name': row.get('template_name') or raw_content.get('template_name')
+        }
+    return articles
 
-            matches.append(match_data)
 
-    return summary, matches
+@app.route('/api/export', methods=['POST', 'OPTIONS'])
+@require_auth
+def export_articles():
+    """
+    Zip archive of rendered articles for bulk download. Takes `articles`
+    (download_article payloads) and/or `history_ids` (ids of the user's saved
+    articles), at most EXPORT_MAX_ARTICLES in total. Articles are rendered
+    concurrently and the archive is streamed while it is built.
+    """
+    data = request.get_json(silent=True) or {}
+    articles = data.get('articles') or []
+    history_ids = data.get('history_ids') or []
+    if not isinstance(articles, list) or not isinstance(history_ids, list) or not (articles or history_ids):
+        return jsonify({'error': 'Provide articles and/or history_ids to export'}), 400
+    if not all(isinstance(article, dict) for article in articles):
+        return jsonify({'error': 'Each article must be an object'}), 400
+    if len(articles) + len(history_ids) > EXPORT_MAX_ARTICLES:
+        return jsonify({'error': f'At most {EXPORT_MAX_ARTICLES} articles can be exported at once'}), 400
+
+    if history_ids:
+        try:
+            saved = load_saved_articles(request.user.id, history_ids)
+        except Exception as e:
+            logger.error(f"Error loading saved articles: {str(e)}")
+            return jsonify({'error': 'Error loading saved articles'}), 500
+        missing_ids = [article_id for article_id in history_ids if str(article_id) not in saved]
+        if missing_ids:
+            return jsonify({'error': 'Saved articles not found', 'missing_ids': missing_ids}), 404
+        articles = articles + [saved[str(article_id)] for article_id in history_ids]
+
+    filename = f"articles-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    return Response(
+        stream_with_context(stream_zip(articles, render_download, download_filename,
+                                       max_workers=EXPORT_RENDER_WORKERS)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'  # Stream instead of buffering the archive in nginx
+        }
+    )
 
 
 # Add this route handler
@@ -1340,8 +1608,7 @@ def create_checkout_session():
             return jsonify({'message': 'No authorization header'}), 401
 
         token = auth_header.split(' ')[1]
-        user_response = supabase_client.auth.get_user(token)
-        user = user_response.user
+        user = token_verifier.verify(token)
 
         checkout_session = stripe.checkout.Session.create(
             payment_method_types=['card'],
@@ -1405,7 +1672,7 @@ def webhook():
                 logger.warning("Missing subscription or customer ID")
                 return jsonify({'status': 'success', 'note': 'Missing required IDs'}), 200
 
-            supabase_client.table('subscriptions')\
+            response = supabase_client.table('subscriptions')\
                 .update({
                     'plan_type': 'pro',
                     'status': 'active',
@@ -1418,6 +1685,12 @@ def webhook():
                 .eq('user_id', user_id)\
                 .execute()
 
+            # Drop the cached free-tier row so the upgrade applies immediately
+            if response.data:
+                quota.remember(user_id, response.data[0])
+            else:
+                quota.invalidate(user_id)
+
             logger.info(f"Successfully updated subscription for user {user_id}")
 
         except Exception as e:
@@ -1426,68 +1699,74 @@ def webhook():
 
     return jsonify({'status': 'success'})
 
-@app.route('/api/render-template', methods=['POST'])
-@require_auth
-def render_template_preview():
-    try:
-        content = request.json.get('content', {})
-        template_name = request.json.get('template_name', 'article_template.html')
-        theme = request.json.get('theme', {})
-
-        template_vars = {
-            'headline': content.get('headline', ''),
-            'article_title': content.get('headline', ''),
-            'article_content': content.get('article_content', ''),
-            'meta_description': content.get('meta_description', ''),
-            'keywords': content.get('keywords', ''),
-            'featured_image_url': content.get('featured_image_url', ''),
-            'featured_image_alt': content.get('featured_image_alt', ''),
-            'publish_date': datetime.now().strftime("%Y-%m-%d"),
-            'author': content.get('author', ''),
-            'publisher_name': content.get('publisher_name', ''),
-            'hero_image_position': content.get('hero_image_position', 'center 50%'),
-            'theme': theme,
-        }
+def build_preview_vars(content, template_name, theme):
+    template_vars = {
+        'headline': content.get('headline', ''),
+        'article_title': content.get('headline', ''),
+        'article_content': content.get('article_content', ''),
+        'meta_description': content.get('meta_description', ''),
+        'keywords': content.get('keywords', ''),
+        'featured_image_url': content.get('featured_image_url', ''),
+        'featured_image_alt': content.get('featured_image_alt', ''),
+        'publish_date': datetime.now().strftime("%Y-%m-%d"),
+        'author': content.get('author', ''),
+        'publisher_name': content.get('publisher_name', ''),
+        'hero_image_position': content.get('hero_image_position', 'center 50%'),
+        'theme': theme,
+    }
 
-        # Add match-specific data for match report template
-        if template_name in ['match_report_template.html', 'ss_match_report_template.html']:
-            template_vars.update({
-                'home_team': content.get('home_team', ''),
-                'away_team': content.get('away_team', ''),
-                'home_score': content.get('home_score', ''),
-                'away_score': content.get('away_score', ''),
-                'competition': content.get('competition', ''),
-                'match_date': content.get('match_date', ''),
-                'venue': content.get('venue', ''),
-                'home_lineup': content.get('home_lineup', ''),
-                'away_lineup': content.get('away_lineup', ''),
-                'match_stats': content.get('match_stats', {
-                    'possession': {'home': 50, 'away': 50},
-                    'shots': {'home': 0, 'away': 0},
-                    'shots_on_target': {'home': 0, 'away': 0},
-                    'corners': {'home': 0, 'away': 0},
-                    'fouls': {'home': 0, 'away': 0},
-                    'yellow_cards': {'home': 0, 'away': 0},
-                    'red_cards': {'home': 0, 'away': 0},
-                    'offsides': {'home': 0, 'away': 0},
-                    'xg': {'home': 0.0, 'away': 0.0}
-                })
+    # Add match-specific data for match report template
+    if template_name in ['match_report_template.html', 'ss_match_report_template.html']:
+        template_vars.update({
+            'home_team': content.get('home_team', ''),
+            'away_team': content.get('away_team', ''),
+            'home_score': content.get('home_score', ''),
+            'away_score': content.get('away_score', ''),
+            'competition': content.get('competition', ''),
+            'match_date': content.get('match_date', ''),
+            'venue': content.get('venue', ''),
+            'home_lineup': content.get('home_lineup', ''),
+            'away_lineup': content.get('away_lineup', ''),
+            'match_stats': content.get('match_stats', {
+                'possession': {'home': 50, 'away': 50},
+                'shots': {'home': 0, 'away': 0},
+                'shots_on_target': {'home': 0, 'away': 0},
+                'corners': {'home': 0, 'away': 0},
+                'fouls': {'home': 0, 'away': 0},
+                'yellow_cards': {'home': 0, 'away': 0},
+                'red_cards': {'home': 0, 'away': 0},
+                'offsides': {'home': 0, 'away': 0},
+                'xg': {'home': 0.0, 'away': 0.0}
             })
+        })
+
+    return template_vars
+
+
+def theme_css_variables(theme):
+    return {'--theme-background': theme.get('colors', {}).get('background', '#0b0c1f')}
+
 
-        # For preview, we only want to render the article content without nav and footer
-        preview_html = f"""
+def render_preview_page(template_name, template_vars):
+    theme = template_vars['theme']
+
+    # For preview, we only want to render the article content without nav and footer
+    return f"""
         <!DOCTYPE html>
         <html>
         <head>
             <style>
+                :root {{
+                    --theme-background: {theme_css_variables(theme)['--theme-background']};
+                }}
                 html, body {{
-                    background-color: {theme.get('colors', {}).get('background', '#0b0c1f')};
+                    background-color: var(--theme-background);
                     margin: 0;
                     padding: 0;
                     min-height: 100vh;
                 }}
                 .preview-wrapper {{
-                    background-color: {theme.get('colors', {}).get('background', '#0b0c1f')};
+                    background-color: var(--theme-background);
                     min-height: 100vh;
                     padding: 0;
                     margin: 0;
@@ -1496,16 +1775,139 @@ def render_template_preview():
         </head>
         <body>
             <div class="preview-wrapper">
-                {render_template(template_name, preview_mode=True, **template_vars)}
+                {template_renderer.render(template_name, preview_mode=True, **template_vars)}
             </div>
         </body>
         </html>
         """
-        
+
+
+@app.route('/api/render-template', methods=['POST'])
+@require_auth
+def render_template_preview():
+    try:
+        content = request.json.get('content', {})
+        template_name = request.json.get('template_name', 'article_template.html')
+        theme = request.json.get('theme', {})
+
+        template_vars = build_preview_vars(content, template_name, theme)
+        preview_html = render_preview_page(template_name, template_vars)
+
         return jsonify({'preview_html': preview_html})
 
     except Exception as e:
-        print(f"Template rendering error: {str(e)}")
+        logger.error(f"Template rendering error: {str(e)}")
+        return jsonify({'error': f'Template rendering failed: {str(e)}'}), 500
+
+
+# Templates that mark their patchable elements with data-preview-field and
+# wrap their theme styles in a theme_styles block
+PATCHABLE_PREVIEW_TEMPLATES = [
+    'ss_article_template.html',
+    'ss_match_report_template.html',
+    'ss_player_scout_report_template.html'
+]
+
+# Content fields that can be patched into the page without a full render
+PREVIEW_FRAGMENT_FIELDS = ['headline', 'article_content']
+
+# Content fields that only affect the <head> metadata, not the visible preview
+PREVIEW_HIDDEN_FIELDS = ['meta_description', 'keywords', 'author', 'publisher_name', 'featured_image_alt']
+
+# Last rendered state of each editor session, keyed on (user_id, session_id)
+preview_sessions = TTLCache(
+    max_entries=int(os.getenv('PREVIEW_SESSION_MAX_ENTRIES', 1000)),
+    ttl=int(os.getenv('PREVIEW_SESSION_TTL', 900))
+)
+
+
+def merge_theme(theme, theme_changes):
+    merged = {**theme, **theme_changes}
+    merged['colors'] = {**theme.get('colors', {}), **theme_changes.get('colors', {})}
+    return merged
+
+
+@app.route('/api/render-template/diff', methods=['POST'])
+@require_auth
+def render_template_diff():
+    """
+    Incremental preview for the theme editor.
+
+    The client sends a session_id and the base_version it last received, plus
+    only the changed `content` fields and `theme` values. When the change can
+    be patched the response carries the new version and:
+      - fragments: {data-preview-field name: HTML} for changed visible fields
+      - theme_styles: the template's replacement <style id="theme-styles">
+      - css_variables: values for the preview wrapper
+    Otherwise (unknown session or version, template switch, or a field that
+    can't be patched) it falls back to a full render with `full: true`.
+    """
+    try:
+        payload = request.json
+        session_id = payload.get('session_id')
+        # Without a session_id there is no editor state to build on, and tabs
+        # must not share one: every such request is a full render
+        session_key = (request.user.id, session_id) if session_id else None
+        template_name = payload.get('template_name', 'article_template.html')
+        content_changes = payload.get('content', {})
+        theme_changes = payload.get('theme') or {}
+
+        state = preview_sessions.get(session_key) if session_key else None
+        can_patch = (
+            state is not None
+            and payload.get('base_version') == state['version']
+            and state['template_name'] == template_name
+            and template_name in PATCHABLE_PREVIEW_TEMPLATES
+            and all(field in PREVIEW_FRAGMENT_FIELDS or field in PREVIEW_HIDDEN_FIELDS
+                    for field in content_changes)
+        )
+
+        if not can_patch:
+            base_vars = state['template_vars'] if state and state['template_name'] == template_name else {}
+            content = {**base_vars, **content_changes}
+            theme = merge_theme(base_vars.get('theme', {}), theme_changes)
+            template_vars = build_preview_vars(content, template_name, theme)
+            version = uuid.uuid4().hex
+            if session_key:
+                preview_sessions.set(session_key, {
+                    'version': version,
+                    'template_name': template_name,
+                    'template_vars': template_vars
+                })
+            return jsonify({
+                'version': version,
+                'full': True,
+                'preview_html': render_preview_page(template_name, template_vars)
+            })
+
+        template_vars = {**state['template_vars'], **content_changes}
+        if 'headline' in content_changes:
+            template_vars['article_title'] = content_changes['headline']
+
+        response = {'full': False, 'fragments': {}}
+        for field in PREVIEW_FRAGMENT_FIELDS:
+            if field in content_changes:
+                value = content_changes[field]
+                # article_content is already HTML, everything else is text
+                response['fragments'][field] = value if field == 'article_content' else str(escape(value))
+
+        if theme_changes:
+            theme = merge_theme(template_vars['theme'], theme_changes)
+            template_vars['theme'] = theme
+            response['theme_styles'] = template_renderer.render_block(template_name, 'theme_styles', theme=theme)
+            response['css_variables'] = theme_css_variables(theme)
+
+        version = uuid.uuid4().hex
+        preview_sessions.set(session_key, {
+            'version': version,
+            'template_name': template_name,
+            'template_vars': template_vars
+        })
+        response['version'] = version
+        return jsonify(response)
+
+    except Exception as e:
+        logger.error(f"Template rendering error: {str(e)}")
         return jsonify({'error': f'Template rendering failed: {str(e)}'}), 500
 
 @app.route('/api/debug/env', methods=['GET'])
@@ -1517,5 +1919,52 @@ def debug_env():
         'api_url': os.getenv('API_URL')
     })
 
+@app.route('/api/debug/render-stats', methods=['GET'])
+@require_debug_access
+def debug_render_stats():
+    return jsonify(template_renderer.stats())
+
+def http_pool_metrics():
+    """Outbound HTTP stats per upstream host, for /metrics"""
+    requests_total = metrics.Counter('pagecrafter_upstream_requests_total', 'Outbound HTTP requests', ('host',))
+    errors_total = metrics.Counter('pagecrafter_upstream_errors_total', 'Outbound HTTP requests that failed or got a 5xx', ('host',))
+    seconds_total = metrics.Counter('pagecrafter_upstream_seconds_total', 'Time to response headers', ('host',))
+    active = metrics.Gauge('pagecrafter_upstream_active', 'Outbound HTTP requests in flight', ('host',))
+    for host, stats in http_pool.stats()['hosts'].items():
+        requests_total.inc(stats['requests'], host=host)
+        errors_total.inc(stats['errors'], host=host)
+        seconds_total.inc(stats['total_ms'] / 1000, host=host)
+        active.set(stats['active'], host=host)
+    return [requests_total, errors_total, seconds_total, active]
+
+
+metrics.registry.add_collector(http_pool_metrics)
+
+
+@app.route('/metrics', methods=['GET'])
+@require_debug_access
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/http', methods=['GET'])
+@require_debug_access
+def debug_http():
+    return jsonify({**http_pool.stats(), 'image_validation': image_validator.stats()})
+
+@app.route('/api/debug/llm-backends', methods=['GET'])
+@require_debug_access
+def debug_llm_backends():
+    return jsonify(llm_router.stats())
+
+@app.route('/api/debug/token-budget', methods=['GET'])
+@require_debug_access
+def debug_token_budget():
+    return jsonify(token_budget.stats())
+
+@app.route('/api/debug/cache', methods=['GET'])
+@require_debug_access
+def debug_cache():
+    return jsonify(llm_cache.stats())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import threading
+
+
+class BackgroundLoop:
+    """
+    A single asyncio event loop running in a daemon thread, shared by every
+    request thread in the process. Async clients (AsyncOpenAI, the async
+    Supabase client) live on this loop so their connection pools are shared
+    and any number of in-flight calls are multiplexed on one thread.
+    """
+
+    def __init__(self, name='async-runtime'):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        # Start lazily, and again after a fork (gunicorn --preload)
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name=self.name, daemon=True)
+        thread.start()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread until it finishes"""
+        return self.submit(coro).result(timeout)
+
+
+runtime = BackgroundLoop()
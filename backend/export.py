@@ -0,0 +1,101 @@
+"""
+Streaming zip export of rendered articles.
+
+Articles are rendered on a small thread pool, a bounded number ahead of the
+one being written. Each is compressed into the archive and handed to the
+client as soon as it is done, so neither the rendered HTML of every article
+nor the whole archive is held in memory.
+"""
+import json
+import logging
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _Sink:
+    """Write-only file for ZipFile, collecting its output until drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(name, taken):
+    """`name`, or name-2, name-3, ... if it is already in `taken` (which it is added to)"""
+    stem, dot, extension = name.rpartition('.')
+    if not dot:
+        stem, extension = name, ''
+    candidate, number = name, 1
+    while candidate in taken:
+        number += 1
+        candidate = f'{stem}-{number}{dot}{extension}'
+    taken.add(candidate)
+    return candidate
+
+
+def render_in_order(items, render, executor, ahead):
+    """
+    Yield (item, result, error) for each item in input order, rendering on
+    `executor` with at most `ahead` renders in flight or waiting to be taken
+    """
+    pending = deque()
+
+    def take():
+        item, future = pending.popleft()
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
+
+    try:
+        for item in items:
+            pending.append((item, executor.submit(render, item)))
+            if len(pending) >= ahead:
+                yield take()
+        while pending:
+            yield take()
+    finally:
+        # The client went away: don't render what nobody will read
+        for _, future in pending:
+            future.cancel()
+
+
+def stream_zip(items, render, filename_for, max_workers=4, ahead=None):
+    """
+    Yield the bytes of a zip archive with render(item) for every item, stored
+    as filename_for(item) (made unique). Items that fail to render are left
+    out and listed in the archive's manifest.json.
+    """
+    sink = _Sink()
+    manifest = {'files': [], 'errors': []}
+    names = set()
+    ahead = ahead or max_workers * 2
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export') as executor:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for item, html, error in render_in_order(items, render, executor, ahead):
+                name = unique_name(filename_for(item), names)
+                if error is not None:
+                    logger.warning(f"Export of {name} failed: {str(error)}")
+                    manifest['errors'].append({'name': name, 'error': str(error)})
+                    continue
+                archive.writestr(name, html)
+                manifest['files'].append(name)
+                yield sink.drain()
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+        # Closing the archive writes its central directory
+        yield sink.drain()
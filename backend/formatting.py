@@ -0,0 +1,486 @@
+"""
+Schema-driven formatting of parsed LLM responses into template variables.
+
+Each template has a schema: the fields it renders, where each one comes from
+(the LLM JSON, the request data, a constant or a computed value), its default
+and coercion, and the builder that turns one response section into HTML.
+Schemas are compiled into flat lists of accessors at import, so formatting is
+a single pass without branching on the template name, and it only needs the
+request data as a dict, not a Flask request context.
+"""
+from datetime import datetime
+
+DEFAULT_IMAGE_URL = '/static/images/default-match-image.jpg'
+DEFAULT_IMAGE_ALT = 'Football match report'
+
+_MISSING = object()
+
+
+class Field:
+    """
+    One template variable. `source` is 'llm' (`path` into the response JSON),
+    'request' (`path[0]` in the request data) or 'value' (`default` itself).
+    Missing values (and blank strings when `blank` is set) become `default`,
+    which may be a callable taking (response_data, request_data). A missing
+    `required` LLM field is also reported by TemplateSchema.missing_paths().
+    """
+
+    def __init__(self, name, source, path=(), default='', coerce=None, required=False, blank=False):
+        self.name = name
+        self.source = source
+        self.path = tuple(path)
+        self.default = default
+        self.coerce = coerce
+        self.required = required
+        self.blank = blank
+
+
+def llm(name, *path, **options):
+    return Field(name, 'llm', path, **options)
+
+
+def req(name, key=None, **options):
+    return Field(name, 'request', (key or name,), **options)
+
+
+def value(name, constant):
+    return Field(name, 'value', default=constant)
+
+
+class Computed:
+    """fn(response_data, request_data) returns a dict of template variables"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
+def _lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return _MISSING
+        data = data.get(key, _MISSING)
+        if data is _MISSING:
+            return _MISSING
+    return data
+
+
+def _default_getter(default):
+    if callable(default):
+        return default
+    if isinstance(default, (dict, list)):
+        # Fresh copy per call, callers may modify the result
+        return lambda response_data, request_data: type(default)(default)
+    return lambda response_data, request_data: default
+
+
+def _compile_field(field):
+    """Turn a Field into step(response_data, request_data, values)"""
+    name, path, coerce = field.name, field.path, field.coerce
+    get_default = _default_getter(field.default)
+
+    if field.source == 'value':
+        def step(response_data, request_data, values):
+            values[name] = get_default(response_data, request_data)
+        return step
+
+    if field.source not in ('llm', 'request'):
+        raise ValueError(f'Unknown field source {field.source!r} for {name}')
+    from_llm = field.source == 'llm'
+    blank = field.blank
+
+    def step(response_data, request_data, values):
+        found = _lookup(response_data if from_llm else request_data, path)
+        if found is _MISSING or found is None and not from_llm or blank and isinstance(found, str) and not found.strip():
+            found = get_default(response_data, request_data)
+        values[name] = coerce(found) if coerce is not None else found
+    return step
+
+
+def _compile_computed(computed):
+    fn = computed.fn
+
+    def step(response_data, request_data, values):
+        values.update(fn(response_data, request_data))
+    return step
+
+
+def join_keywords(keywords):
+    return ', '.join(keywords) if isinstance(keywords, list) else keywords
+
+
+def today(response_data, request_data):
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+# Section builders: one section of the response -> HTML
+
+def match_section_html(section, main_headline=''):
+    parts = ['\n<section class="match-section">\n']
+    if 'heading' in section:
+        parts.append(f'<h2>{section["heading"]}</h2>\n')
+    for paragraph in section['content']:
+        parts.append(f'<p>{paragraph}</p>\n')
+    parts.append('</section>\n')
+    return '\n'.join(parts)
+
+
+def ss_match_section_html(section, main_headline=''):
+    parts = ['\n<div class="ss-match-section">\n']
+    if 'heading' in section:
+        parts.append(f'<h2 class="ss-section-heading">{section["heading"]}</h2>\n')
+    for paragraph in section['content']:
+        parts.append(f'<p class="ss-content-paragraph">{paragraph}</p>\n')
+    parts.append('</div>\n')
+    return '\n'.join(parts)
+
+
+def scout_section_html(section, main_headline=''):
+    parts = ['<section class="scout-report-section">\n']
+    if 'heading' in section:
+        parts.append(f'<h2>{section["heading"]}</h2>\n')
+    # Each paragraph separately to preserve structure
+    for paragraph in section.get('content', ()):
+        parts.append(f'<p>{paragraph}</p>\n')
+    parts.append('</section>\n')
+    return '\n'.join(parts)
+
+
+def article_section_html(section, main_headline=''):
+    # The main headline is rendered by the template itself
+    if section.get('heading') and section['heading'] == main_headline:
+        return ''
+
+    parts = []
+    if 'heading' in section:
+        parts.append(f'<h2>{section["heading"]}</h2>')
+
+    for content in section['content']:
+        # A string is a paragraph, a dict a list or blockquote
+        if isinstance(content, str):
+            clean_paragraph = content.replace('<p>', '').replace('</p>', '').strip()
+            parts.append(f'<p>{clean_paragraph}</p>')
+        elif isinstance(content, dict):
+            content_type = content.get('type', 'paragraph')
+            if content_type == 'bullet_list':
+                parts.append('<ul>')
+                parts.extend(f'<li>{point}</li>' for point in content.get('points', []))
+                parts.append('</ul>')
+            elif content_type == 'numbered_list':
+                parts.append('<ol>')
+                parts.extend(f'<li>{item}</li>' for item in content.get('items', []))
+                parts.append('</ol>')
+            elif content_type == 'blockquote':
+                parts.append(f'<blockquote>{content.get("text", "")}</blockquote>')
+    return '\n'.join(parts)
+
+
+def standard_section_html(section, main_headline=''):
+    parts = ['\n<section itemscope itemtype="https://schema.org/Article">\n',
+             f'<h2 itemprop="headline">{section["heading"]}</h2>\n']
+    for paragraph in section['content']:
+        parts.append(f'<p itemprop="text">{paragraph}</p>\n')
+    parts.append('</section>\n')
+    return '\n'.join(parts)
+
+
+# Computed fields
+
+# (stat, default) for the home_<stat>/away_<stat> request fields
+MATCH_STATS = (
+    ('possession', 50),
+    ('shots', 0),
+    ('shots_on_target', 0),
+    ('corners', 0),
+    ('fouls', 0),
+    ('yellow_cards', 0),
+    ('red_cards', 0),
+    ('offsides', 0),
+)
+MATCH_STAT_KEYS = tuple((stat, f'home_{stat}', f'away_{stat}', default) for stat, default in MATCH_STATS)
+
+
+def match_stats(response_data, request_data):
+    stats = {stat: {'home': request_data.get(home, default), 'away': request_data.get(away, default)}
+             for stat, home, away, default in MATCH_STAT_KEYS}
+    stats['xg'] = {'home': float(request_data.get('home_xg', 0.0)),
+                   'away': float(request_data.get('away_xg', 0.0))}
+    return {'match_stats': stats}
+
+
+def match_image_alt(response_data, request_data):
+    return f"{request_data.get('home_team', '')} vs {request_data.get('away_team', '')} match report"
+
+
+def parse_recent_form(form_text):
+    lines = form_text.split('\n')
+
+    # Parse summary line: "Total: 3 goals from 10 shots (8 on target, 1.11 xG)"
+    summary = {}
+    if len(lines) > 1 and lines[1].startswith('Total:'):
+        summary_line = lines[1]
+        summary['goals'] = int(summary_line.split(' goals')[0].split(': ')[1])
+        summary['shots'] = int(summary_line.split('from ')[1].split(' shots')[0])
+        summary['on_target'] = int(summary_line.split('(')[1].split(' on')[0])
+        summary['xg'] = float(summary_line.split(', ')[1].split(' xG')[0])
+
+    matches = []
+    for line in lines[3:]:  # Skip header and summary lines
+        if line.startswith('- vs'):
+            # Parse: "- vs Nottm Forest (H): 0 goals from 1 shots (1 on target, 0.03 xG)"
+            match_data = {}
+
+            # Get opponent and venue
+            team_venue = line.split('- vs ')[1].split(':')[0]
+            match_data['opponent'] = team_venue.split(' (')[0]
+            match_data['venue'] = 'Home' if '(H)' in team_venue else 'Away'
+
+            # Get stats
+            stats = line.split(': ')[1]
+            match_data['goals'] = int(stats.split(' goals')[0])
+            match_data['shots'] = int(stats.split('from ')[1].split(' shots')[0])
+            match_data['on_target'] = int(stats.split('(')[1].split(' on')[0])
+            match_data['xg'] = float(stats.split(', ')[1].split(' xG')[0])
+
+            matches.append(match_data)
+
+    return summary, matches
+
+
+def recent_form(response_data, request_data):
+    scout_stats = request_data.get('scout_stats')
+    form_text = scout_stats.get('Recent Form', '') if isinstance(scout_stats, dict) else ''
+    form_summary, recent_matches = parse_recent_form(form_text)
+    return {'form_summary': form_summary, 'recent_matches': recent_matches}
+
+
+# Schemas
+
+# Defaults every template starts from
+BASE_FIELDS = (
+    value('headline', 'Default Headline'),
+    value('article_content', '<p>No content available.</p>'),
+    value('meta_description', 'Default meta description.'),
+    value('keywords', ['default', 'keywords']),
+    Field('publish_date', 'value', default=today),
+    value('featured_image_url', DEFAULT_IMAGE_URL),
+    value('featured_image_alt', 'Default image alt text.'),
+    value('article_category', 'Default Category'),
+    value('hero_image_position', 'center center'),
+)
+
+PRESENTATION_FIELDS = (
+    req('theme', default={}),
+    req('hero_image_position', default='center center'),
+)
+
+IMAGE_URL_FIELD = req('featured_image_url', 'image_url', default=DEFAULT_IMAGE_URL, blank=True)
+
+MATCH_REPORT_FIELDS = (
+    llm('headline', 'template_data', 'headline', required=True),
+    llm('match_summary', 'template_data', 'match_summary'),
+    llm('meta_description', 'meta_data', 'meta_description', required=True),
+    llm('keywords', 'meta_data', 'keywords', default=[]),
+    IMAGE_URL_FIELD,
+    llm('featured_image_alt', 'template_data', 'featured_image_alt', default=match_image_alt, blank=True),
+    value('article_category', 'Sports'),
+    req('home_team'),
+    req('away_team'),
+    req('home_score'),
+    req('away_score'),
+    req('home_lineup'),
+    req('away_lineup'),
+    req('competition'),
+    req('match_date'),
+    req('venue'),
+    value('schema_type', 'SportsEvent'),
+    llm('og_title', 'meta_data', 'og_title'),
+    llm('og_description', 'meta_data', 'og_description'),
+    llm('twitter_title', 'meta_data', 'twitter_title'),
+    llm('twitter_description', 'meta_data', 'twitter_description'),
+    llm('author', 'meta_data', 'author', default='Sports Reporter'),
+    req('publisher_name'),
+    Computed(match_stats),
+) + PRESENTATION_FIELDS
+
+SCOUT_REPORT_FIELDS = (
+    llm('headline', 'template_data', 'headline', default='Default Headline', required=True),
+    llm('summary', 'template_data', 'summary', default='Default Summary'),
+    llm('meta_description', 'meta_data', 'meta_description', default='Default meta description.',
+        required=True),
+    llm('meta_title', 'template_data', 'headline', default='Default Headline'),
+    llm('title', 'template_data', 'headline', default='Default Headline'),
+    IMAGE_URL_FIELD,
+    llm('featured_image_alt', 'template_data', 'featured_image_alt', default=DEFAULT_IMAGE_ALT),
+    req('player_name', default='Unknown Player'),
+    req('player_position', default='Unknown Position'),
+    req('player_age', default='Unknown Age'),
+    req('player_nationality', default='Unknown Nationality'),
+    req('favored_foot', default='Unknown'),
+    llm('og_title', 'template_data', 'headline', default='Default Headline'),
+    llm('og_description', 'meta_data', 'meta_description', default='Default meta description.'),
+    llm('keywords', 'meta_data', 'keywords', default=[], coerce=join_keywords),
+    req('scout_stats', default='No stats available.'),
+    Computed(recent_form),
+) + PRESENTATION_FIELDS
+
+ARTICLE_FIELDS = (
+    llm('headline', 'template_data', 'headline', required=True),
+    llm('article_title', 'template_data', 'headline'),
+    IMAGE_URL_FIELD,
+    llm('featured_image_alt', 'template_data', 'featured_image_alt', default=DEFAULT_IMAGE_ALT),
+    llm('meta_description', 'meta_data', 'meta_description', required=True),
+    llm('meta_title', 'template_data', 'headline'),
+    llm('title', 'template_data', 'headline'),
+    llm('keywords', 'meta_data', 'keywords'),
+    llm('author', 'meta_data', 'author'),
+    req('publisher_name'),
+    llm('og_title', 'meta_data', 'og_title'),
+    llm('og_description', 'meta_data', 'og_description'),
+    llm('twitter_title', 'meta_data', 'twitter_title'),
+    llm('twitter_description', 'meta_data', 'twitter_description'),
+) + PRESENTATION_FIELDS
+
+# The original article format, every LLM field is required
+STANDARD_FIELDS = (
+    llm('article_title', 'template_data', 'headline', required=True),
+    llm('short_title', 'template_data', 'short_title', required=True),
+    llm('headline', 'template_data', 'headline', required=True),
+    llm('featured_image_alt', 'template_data', 'featured_image_alt', required=True),
+    llm('article_category', 'template_data', 'article_category', required=True),
+    llm('slug', 'template_data', 'slug', required=True),
+    llm('meta_description', 'meta_data', 'meta_description', required=True),
+    llm('keywords', 'meta_data', 'keywords', required=True, coerce=join_keywords),
+    llm('author', 'meta_data', 'author', required=True),
+    llm('og_title', 'meta_data', 'og_title', required=True),
+    llm('og_description', 'meta_data', 'og_description', required=True),
+    llm('twitter_title', 'meta_data', 'twitter_title', required=True),
+    llm('twitter_description', 'meta_data', 'twitter_description', required=True),
+    llm('schema_type', 'meta_data', 'schema_type', required=True),
+    llm('focus_keyword', 'meta_data', 'focus_keyword', required=True),
+    req('publisher_name'),
+) + PRESENTATION_FIELDS
+
+
+class TemplateSchema:
+    """
+    Compiled formatting schema for one template. `section_key` names the
+    sections array in the response and `section_requires` the keys a section
+    can't be rendered without. Without `sections_required` a response with
+    no sections is still worth rendering.
+    """
+
+    def __init__(self, section_key, section_html, fields, sections_required=True,
+                 section_requires=('content',)):
+        self.section_key = section_key
+        self.section_html = section_html
+        self.sections_required = sections_required
+        self.section_requires = tuple(section_requires)
+        self.required_paths = tuple(dict.fromkeys(
+            field.path for field in fields
+            if isinstance(field, Field) and field.source == 'llm' and field.required
+        ))
+        # Later fields override earlier ones with the same name, so each
+        # variable is written once
+        by_name = {}
+        for field in BASE_FIELDS + tuple(fields):
+            by_name[field.name if isinstance(field, Field) else id(field)] = field
+        self._steps = tuple(
+            _compile_field(field) if isinstance(field, Field) else _compile_computed(field)
+            for field in by_name.values()
+        )
+
+    def valid_section(self, section):
+        if not isinstance(section, dict):
+            return False
+        if any(key not in section for key in self.section_requires):
+            return False
+        return isinstance(section.get('content', []), list)
+
+    def missing_paths(self, response_data):
+        """Dotted paths of required LLM fields absent from the response"""
+        return ['.'.join(path) for path in self.required_paths if _lookup(response_data, path) in (_MISSING, None, '')]
+
+    def format(self, response_data, request_data=None):
+        """Template variables for the parsed response. Raises TypeError/ValueError on malformed input."""
+        request_data = request_data or {}
+        values = {}
+        for step in self._steps:
+            step(response_data, request_data, values)
+
+        sections = list(response_data.get(self.section_key) or ())
+        main_headline = _lookup(response_data, ('template_data', 'headline'))
+        main_headline = '' if main_headline is _MISSING else main_headline
+        section_html = self.section_html
+        values['article_content'] = '\n'.join(
+            html for html in (section_html(section, main_headline) for section in sections if section is not None)
+            if html
+        )
+        # Kept so single sections can be regenerated and spliced back in. A
+        # None is a missing section, kept so later indices stay the same.
+        values['sections'] = sections
+        return values
+
+
+_article_schema = TemplateSchema('article_content', article_section_html, ARTICLE_FIELDS)
+
+SCHEMAS = {
+    'match_report_template.html': TemplateSchema('match_report', match_section_html, MATCH_REPORT_FIELDS),
+    'ss_match_report_template.html': TemplateSchema('match_report', ss_match_section_html, MATCH_REPORT_FIELDS),
+    'ss_player_scout_report_template.html': TemplateSchema('scout_report', scout_section_html,
+                                                           SCOUT_REPORT_FIELDS, sections_required=False,
+                                                           section_requires=()),
+    'article_template.html': _article_schema,
+    'ss_article_template.html': _article_schema,
+}
+STANDARD_SCHEMA = TemplateSchema('article_content', standard_section_html, STANDARD_FIELDS,
+                                 section_requires=('heading', 'content'))
+
+
+def schema_for(template_name):
+    return SCHEMAS.get(template_name, STANDARD_SCHEMA)
+
+
+def get_section_key(template_name):
+    return schema_for(template_name).section_key
+
+
+def format_section_html(section, template_name, main_headline=''):
+    """Convert one section of the LLM response into template-ready HTML"""
+    return schema_for(template_name).section_html(section, main_headline)
+
+
+def format_content(response_data, template_name, request_data=None):
+    """Template variables for `template_name` from the parsed LLM response and the request data"""
+    return schema_for(template_name).format(response_data, request_data)
+
+
+def splice_section(article_content, template_name, sections, index, section, main_headline=''):
+    """
+    article_content with the HTML of sections[index] replaced by that of
+    `section`, or with it appended when index == len(sections). A missing
+    section (None in `sections`) has no HTML to replace, so the new one is
+    inserted after the closest earlier section. None when the HTML to replace
+    or insert after isn't in article_content, e.g. after manual edits.
+    """
+    section_html = schema_for(template_name).section_html
+    new_html = section_html(section, main_headline)
+    if index == len(sections):
+        return '\n'.join(html for html in (article_content, new_html) if html)
+    if sections[index] is not None:
+        old_html = section_html(sections[index], main_headline)
+        if not old_html or old_html not in article_content:
+            return None
+        return article_content.replace(old_html, new_html, 1)
+
+    if not new_html:
+        return article_content
+    for earlier in reversed(sections[:index]):
+        anchor = section_html(earlier, main_headline) if earlier is not None else ''
+        if not anchor:
+            continue
+        position = article_content.find(anchor)
+        if position == -1:
+            return None
+        position += len(anchor)
+        return f'{article_content[:position]}\n{new_html}{article_content[position:]}'
+    return '\n'.join(html for html in (new_html, article_content) if html)
@@ -0,0 +1,175 @@
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class HostMetrics:
+    """Per upstream host request counts and time to response headers"""
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def started(self, host):
+        with self._lock:
+            stats = self._hosts.setdefault(host, {
+                'requests': 0, 'errors': 0, 'active': 0, 'http2': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            stats['requests'] += 1
+            stats['active'] += 1
+
+    def finished(self, host, elapsed_ms, response=None):
+        with self._lock:
+            stats = self._hosts[host]
+            stats['active'] -= 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if response is None or response.status_code >= 500:
+                stats['errors'] += 1
+            elif response.extensions.get('http_version') == b'HTTP/2':
+                stats['http2'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                host: {**stats, 'avg_ms': stats['total_ms'] / stats['requests']}
+                for host, stats in self._hosts.items()
+            }
+
+
+class MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport, metrics):
+        self.transport = transport
+        self.metrics = metrics
+
+    def handle_request(self, request):
+        host = request.url.host
+        self.metrics.started(host)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.transport.handle_request(request)
+            return response
+        finally:
+            self.metrics.finished(host, (time.perf_counter() - started) * 1000, response)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, metrics):
+        self.transport = transport
+        self.metrics = metrics
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        self.metrics.started(host)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.transport.handle_async_request(request)
+            return response
+        finally:
+            self.metrics.finished(host, (time.perf_counter() - started) * 1000, response)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class HTTPPool:
+    """
+    Builds httpx clients for outbound calls that keep connections alive, use
+    HTTP/2 when the h2 package is installed, and record per-host metrics.
+
+    `host_limits` maps a host pattern (as used by httpx mounts, e.g.
+    'api.openai.com' or '*.supabase.co') to its own max connections, so a
+    slow upstream can't take every connection. Other hosts share the default
+    limits. Each client gets its own pools; don't share a client between
+    upstreams that need different default headers.
+    """
+
+    def __init__(self, max_connections=100, max_keepalive=20, keepalive_expiry=30.0,
+                 http2=True, host_limits=None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.host_limits = host_limits or {}
+        self.metrics = HostMetrics()
+
+        if http2 and not HTTP2_AVAILABLE:
+            logger.info("h2 is not installed, outbound HTTP/2 is disabled")
+
+    def _limits(self, max_connections):
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(self.max_keepalive, max_connections),
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _mounts(self, transport_class, metered_class):
+        return {
+            f'all://{pattern}': metered_class(
+                transport_class(http2=self.http2, limits=self._limits(limit)), self.metrics
+            )
+            for pattern, limit in self.host_limits.items()
+        }
+
+    def client(self, **kwargs):
+        """A pooled httpx.Client; kwargs are passed through (timeout, headers, ...)"""
+        transport = httpx.HTTPTransport(http2=self.http2, limits=self._limits(self.max_connections))
+        return httpx.Client(
+            transport=MeteredTransport(transport, self.metrics),
+            mounts=self._mounts(httpx.HTTPTransport, MeteredTransport),
+            **kwargs
+        )
+
+    def async_client(self, **kwargs):
+        """A pooled httpx.AsyncClient, to be used from a single event loop"""
+        transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self._limits(self.max_connections))
+        return httpx.AsyncClient(
+            transport=AsyncMeteredTransport(transport, self.metrics),
+            mounts=self._mounts(httpx.AsyncHTTPTransport, AsyncMeteredTransport),
+            **kwargs
+        )
+
+    def stats(self):
+        return {'http2': self.http2, 'hosts': self.metrics.stats()}
+
+
+def parse_host_limits(value):
+    """'api.openai.com=50,*.supabase.co=20' -> {'api.openai.com': 50, '*.supabase.co': 20}"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        pattern, limit = item.split('=', 1)
+        try:
+            limits[pattern.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"Ignoring invalid host limit {item!r}")
+    return limits
+
+
+def create_pool_from_env():
+    """
+    HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP_POOL_KEEPALIVE_EXPIRY
+    (seconds), HTTP_POOL_HTTP2 (1/0) and HTTP_POOL_HOST_LIMITS
+    ('host=max_connections,...').
+    """
+    return HTTPPool(
+        max_connections=int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', 100)),
+        max_keepalive=int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', 20)),
+        keepalive_expiry=float(os.getenv('HTTP_POOL_KEEPALIVE_EXPIRY', 30)),
+        http2=os.getenv('HTTP_POOL_HTTP2', '1') == '1',
+        host_limits=parse_host_limits(os.getenv('HTTP_POOL_HOST_LIMITS'))
+    )
@@ -0,0 +1,133 @@
+import ipaddress
+import logging
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+from singleflight import SingleFlight
+from utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+IMG_SRC_PATTERN = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+MAX_REDIRECTS = 5
+
+
+def extract_image_urls(html):
+    """The src of every <img> in an HTML fragment, in order and without duplicates"""
+    return list(dict.fromkeys(IMG_SRC_PATTERN.findall(html or '')))
+
+
+def is_public_host(host, port=None):
+    """
+    True when every address `host` resolves to is publicly routable, so that
+    client-supplied URLs can't reach loopback, link-local (cloud metadata),
+    private or reserved addresses
+    """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        return False
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            return False
+    return bool(addresses)
+
+
+class ImageValidator:
+    """
+    Checks that URLs point at images with a HEAD request.
+
+    Only public hosts are contacted: every hop's host is resolved and
+    checked before the request, and redirects are followed by hand (at most
+    MAX_REDIRECTS) so each target is checked too. validate_many() takes at
+    most `max_urls` distinct URLs.
+
+    Results are cached, confirmed ones for `ttl` seconds and failed or
+    inconclusive ones for `negative_ttl`. Concurrent checks of the same URL
+    share one request, and at most `per_host_limit` requests run against any
+    one host at a time.
+    """
+
+    def __init__(self, http_client, ttl=86400, negative_ttl=600, max_entries=10000,
+                 per_host_limit=4, max_workers=16, max_urls=50):
+        self.http_client = http_client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.per_host_limit = per_host_limit
+        self.max_urls = max_urls
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-check')
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def _check(self, url):
+        """Returns (valid, conclusive)"""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False, True
+
+        # S3 URLs are considered valid
+        if 'amazonaws.com' in parts.hostname:
+            return True, True
+
+        location = url
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                parts = urlsplit(location)
+                if parts.scheme not in ('http', 'https') or not parts.hostname:
+                    return False, True
+                if not is_public_host(parts.hostname, parts.port):
+                    logger.info(f"Refusing to check image on non-public host {parts.hostname}")
+                    return False, True
+
+                with self._host_slot(parts.hostname):
+                    response = self.http_client.head(location, follow_redirects=False)
+                if not response.is_redirect:
+                    content_type = response.headers.get('content-type', '')
+                    return 'image' in content_type.lower(), True
+                location = urljoin(location, response.headers.get('location', ''))
+            return False, True
+        except Exception as e:
+            logger.debug(f"Image check failed for {url}: {str(e)}")
+            # If validation fails, still accept URLs that look like images
+            return url.lower().endswith(IMAGE_EXTENSIONS), False
+
+    def validate(self, url):
+        # Inline images can be large, check them without caching
+        if url.lower().startswith('data:'):
+            return url.lower().startswith('data:image/')
+
+        valid = self._cache.get(url)
+        if valid is not None:
+            return valid
+
+        (valid, conclusive), _ = self._flight.do(url, self._check, url)
+        self._cache.set(url, valid, ttl=self.ttl if valid and conclusive else self.negative_ttl)
+        return valid
+
+    def validate_many(self, urls):
+        """Validate several URLs concurrently. Returns {url: valid}; ValueError for over max_urls URLs."""
+        urls = list(dict.fromkeys(urls))
+        if len(urls) > self.max_urls:
+            raise ValueError(f'At most {self.max_urls} images can be validated at once.')
+        return dict(zip(urls, self._executor.map(self.validate, urls)))
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    SQLite-backed queue and result store for background generations. Safe to
+    share between threads and between worker processes on the same host; each
+    process opens its own connection on first use.
+    """
+
+    def __init__(self, path, retention=86400):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def _conn(self):
+        # Opened lazily, and again after a fork (gunicorn --preload): a sqlite
+        # connection must not be shared between processes
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    self._connection = self._connect()
+                    self._pid = os.getpid()
+        return self._connection
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' user_id TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'  # queued, running, succeeded, failed
+            ' payload TEXT NOT NULL,'
+            ' result TEXT,'
+            ' status_code INTEGER,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)')
+        return conn
+
+    def create(self, user_id, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, user_id, status, payload, created_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, user_id, 'queued', json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim_next(self):
+        """Mark the oldest queued job as running and return it, or None"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                        (time.time(), row['id'])
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self._to_dict(row) if row is not None else None
+
+    def finish(self, job_id, result, status_code):
+        status = 'succeeded' if status_code == 200 else 'failed'
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, status_code = ?, updated_at = ? WHERE id = ?',
+                (status, json.dumps(result), status_code, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def requeue_stale(self, older_than):
+        """Put back jobs left running by a worker that died"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND updated_at < ?",
+                (time.time(), time.time() - older_than)
+            ).rowcount
+
+    def purge_finished(self):
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (time.time() - self.retention,)
+            ).rowcount
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+
+class JobWorkerPool:
+    """
+    Threads that take jobs from a JobStore and run `handler(job)`, which must
+    return (result, status_code). Started lazily, and again after a fork.
+    """
+
+    def __init__(self, store, handler, workers=2, poll_interval=1.0, stale_after=900):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            requeued = self.store.requeue_stale(self.stale_after)
+            if requeued:
+                logger.warning(f"Requeued {requeued} stale jobs")
+            self.store.purge_finished()
+            for index in range(self.workers):
+                threading.Thread(target=self._run, name=f'job-worker-{index}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def notify(self):
+        """Wake an idle worker after a job was submitted"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                job = self.store.claim_next()
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                result, status_code = self.handler(job)
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                result, status_code = {'error': str(e)}, 500
+
+            try:
+                self.store.finish(job['id'], result, status_code)
+            except Exception as e:
+                logger.error(f"Failed to store result of job {job['id']}: {str(e)}")
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from openai import AsyncOpenAI, OpenAI
+
+import metrics
+from resilience import CircuitBreaker, ConcurrencyLimiter, RetryPolicy, is_retryable
+
+logger = logging.getLogger(__name__)
+
+backend_seconds = metrics.registry.histogram(
+    'pagecrafter_llm_backend_duration_seconds', 'Completion latency per LLM backend', ('backend',)
+)
+backend_errors = metrics.registry.counter(
+    'pagecrafter_llm_backend_errors_total', 'Failed completions per LLM backend', ('backend',)
+)
+hedged_requests = metrics.registry.counter(
+    'pagecrafter_llm_hedged_total', 'Hedged completions, by the backend that answered first', ('winner',)
+)
+
+
+class Backend:
+    """
+    One OpenAI-compatible endpoint (OpenAI itself, Azure, or a local server
+    such as vLLM, llama.cpp or a test stand-in) with its recent latencies.
+
+    `model` overrides the requested model, e.g. a local model name. A
+    `hedge_only` backend never takes traffic first, it only answers hedges.
+    """
+
+    def __init__(self, name, client, async_client, model=None, hedge_only=False, window=200, breaker=None):
+        self.name = name
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.hedge_only = hedge_only
+        self.breaker = breaker or CircuitBreaker(name)
+        self.consecutive_errors = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def model_for(self, requested):
+        return self.model or requested
+
+    def record(self, elapsed):
+        with self._lock:
+            self._latencies.append(elapsed)
+            self.consecutive_errors = 0
+        backend_seconds.observe(elapsed, backend=self.name)
+
+    def record_error(self):
+        with self._lock:
+            self.consecutive_errors += 1
+        backend_errors.inc(backend=self.name)
+
+    def latency(self, percentile):
+        """Latency at `percentile` of recent completions, or None without samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+    def stats(self):
+        with self._lock:
+            count = len(self._latencies)
+        return {'model': self.model, 'hedge_only': self.hedge_only, 'samples': count,
+                'consecutive_errors': self.consecutive_errors, 'circuit': self.breaker.stats(),
+                'p50': self.latency(0.5), 'p90': self.latency(0.9), 'p99': self.latency(0.99)}
+
+
+class BackendRouter:
+    """
+    Sends each completion to the fastest backend (lowest median latency;
+    backends without samples are tried first, in configuration order). A
+    backend whose last call failed goes to the back until it succeeds again
+    as a hedge, and one whose circuit is open is skipped.
+
+    Calls that fail with a rate limit or server error are retried with
+    jittered backoff (`retry_policy`), and at most `limiter.limit`
+    completions are in flight per process.
+
+    If it hasn't answered once the backend's `hedge_percentile` latency has
+    passed (`hedge_after` seconds until `min_samples` are recorded), the same
+    request is sent to the next backend and whichever answers first wins; the
+    other request is cancelled. A backend that fails is also retried on the
+    next one straight away.
+    """
+
+    def __init__(self, backends, hedge_percentile=0.9, hedge_after=None, min_samples=20,
+                 retry_policy=None, limiter=None):
+        if not backends:
+            raise ValueError('At least one LLM backend is required')
+        self.backends = list(backends)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.limiter = limiter or ConcurrencyLimiter(32)
+
+    def ranked(self):
+        def key(item):
+            index, backend = item
+            median = backend.latency(0.5)
+            return (backend.breaker.state == 'open', backend.hedge_only, backend.consecutive_errors > 0,
+                    median is not None, median or 0, index)
+        return [backend for _, backend in sorted(enumerate(self.backends), key=key)]
+
+    def primary(self):
+        return self.ranked()[0]
+
+    def _hedge_delay(self, backend):
+        if backend.stats()['samples'] < self.min_samples:
+            return self.hedge_after
+        return backend.latency(self.hedge_percentile)
+
+    async def _call(self, backend, request):
+        backend.breaker.allow()
+        started = time.perf_counter()
+        try:
+            completion = await backend.async_client.chat.completions.create(
+                **{**request, 'model': backend.model_for(request['model'])}
+            )
+        except asyncio.CancelledError:
+            backend.breaker.release_trial()
+            raise
+        except Exception as e:
+            backend.record_error()
+            if is_retryable(e):
+                backend.breaker.record_failure()
+            else:
+                backend.breaker.release_trial()
+            raise
+        backend.record(time.perf_counter() - started)
+        backend.breaker.record_success()
+        return completion, backend
+
+    async def complete(self, **request):
+        """chat.completions.create(**request) with retries and hedging. Returns (completion, backend)."""
+        async with self.limiter:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    return await self._complete_once(request)
+                except Exception as e:
+                    delay = self.retry_policy.delay(attempt, e)
+                    if delay is None:
+                        raise
+                    logger.warning(f"Completion failed ({str(e)}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def _complete_once(self, request):
+        ranked = self.ranked()
+        primary = ranked[0]
+        fallback = ranked[1] if len(ranked) > 1 else None
+
+        first = asyncio.ensure_future(self._call(primary, request))
+        if fallback is None:
+            return await first
+
+        delay = self._hedge_delay(primary)
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done and first.exception() is None:
+            return first.result()
+        if done:
+            logger.warning(f"LLM backend {primary.name} failed, retrying on {fallback.name}: {first.exception()}")
+
+        # Not done yet: hedge. Done with an error: fail over.
+        hedged = not done
+        second = asyncio.ensure_future(self._call(fallback, request))
+        pending = {first, second} if hedged else {second}
+        error = None if hedged else first.exception()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        completion, winner = task.result()
+                        if hedged:
+                            hedged_requests.inc(winner=winner.name)
+                        return completion, winner
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def stats(self):
+        return {
+            'backends': {backend.name: backend.stats() for backend in self.ranked()},
+            'limiter': self.limiter.stats(),
+        }
+
+
+def create_router_from_env(default_client, default_async_client, http_pool):
+    """
+    The OpenAI clients are the 'openai' backend. LLM_BACKENDS adds more, as a
+    JSON list of {"name", "base_url", "api_key" or "api_key_env", "model",
+    "hedge_only"}. LLM_HEDGE_PERCENTILE (default 0.9) and LLM_HEDGE_AFTER
+    (seconds, used until enough latencies are recorded; unset = no hedging
+    until then) tune hedging. LLM_MAX_ATTEMPTS, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET, LLM_MAX_CONCURRENCY and
+    LLM_QUEUE_TIMEOUT tune retries, circuit breakers and the limiter.
+    """
+    def breaker(name):
+        return CircuitBreaker(name, failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', 5)),
+                              reset_timeout=float(os.getenv('LLM_BREAKER_RESET', 30)))
+
+    backends = [Backend('openai', default_client, default_async_client, breaker=breaker('openai'))]
+    for config in json.loads(os.getenv('LLM_BACKENDS', '[]')):
+        api_key = config.get('api_key') or os.getenv(config.get('api_key_env', ''), '') or 'unused'
+        backends.append(Backend(
+            config['name'],
+            OpenAI(base_url=config['base_url'], api_key=api_key, max_retries=0,
+                   http_client=http_pool.client(follow_redirects=True)),
+            AsyncOpenAI(base_url=config['base_url'], api_key=api_key, max_retries=0,
+                        http_client=http_pool.async_client(follow_redirects=True)),
+            model=config.get('model'),
+            hedge_only=config.get('hedge_only', False),
+            breaker=breaker(config['name'])
+        ))
+
+    hedge_after = os.getenv('LLM_HEDGE_AFTER')
+    return BackendRouter(
+        backends,
+        hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', 0.9)),
+        hedge_after=float(hedge_after) if hedge_after else None,
+        retry_policy=RetryPolicy(max_attempts=int(os.getenv('LLM_MAX_ATTEMPTS', 3)),
+                                 max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY', 20))),
+        limiter=ConcurrencyLimiter(int(os.getenv('LLM_MAX_CONCURRENCY', 32)),
+                                   timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 30)))
+    )
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# sqlite caches default to this directory, not the one the process starts in
+DEFAULT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_cache_key(system_prompt, prompt, model, **params):
+    """Content-addressed key for a completion: prompts, model and sampling parameters"""
+    payload = json.dumps([system_prompt, str(prompt), model, params], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class NullCache:
+    """Cache backend that never stores anything"""
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+class MemoryCache(TTLCache):
+    """Per-process LRU cache of completions"""
+
+    def stats(self):
+        return {'backend': 'memory', **super().stats()}
+
+
+class SQLiteCache:
+    """
+    On-disk cache of completions shared by all worker processes on a host,
+    each with its own connection.
+    Entries expire after `ttl` seconds; once more than `max_entries` are stored
+    the least recently used ones are evicted. Values must be strings.
+    """
+
+    def __init__(self, path, max_entries=5000, ttl=86400, table='llm_cache'):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        # Create the table up front so an unusable path fails here, but keep
+        # no connection: each process opens its own on first use
+        self._connect().close()
+
+    @property
+    def _conn(self):
+        # Again after a fork (gunicorn --preload), sqlite connections must not cross processes
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    self._connection = self._connect()
+                    self._pid = os.getpid()
+        return self._connection
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL)'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)')
+        conn.commit()
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self._conn.execute(f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, value, expires_at, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        removed = self._conn.execute(f'DELETE FROM {self.table} WHERE expires_at <= ?', (now,)).rowcount
+        count = self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN ('
+                f' SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)',
+                (count - self.max_entries,)
+            ).rowcount
+        self.evictions += removed
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table}')
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        return {
+            'backend': 'sqlite',
+            'entries': entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def create_cache_from_env(prefix='LLM_CACHE', ttl=86400, max_entries=1000):
+    """
+    Build a cache from the environment, by default the completion cache:
+    LLM_CACHE_BACKEND (memory, sqlite or none), LLM_CACHE_TTL (seconds),
+    LLM_CACHE_MAX_ENTRIES and LLM_CACHE_PATH (sqlite only, next to this module
+    by default). Other caches use
+    their own `prefix`, and `ttl` / `max_entries` as defaults.
+    """
+    backend = os.getenv(f'{prefix}_BACKEND', 'memory').lower()
+    ttl = int(os.getenv(f'{prefix}_TTL', ttl))
+    max_entries = int(os.getenv(f'{prefix}_MAX_ENTRIES', max_entries))
+
+    if backend == 'sqlite':
+        name = prefix.lower()
+        path = os.getenv(f'{prefix}_PATH', os.path.join(DEFAULT_DIR, f'{name}.sqlite3'))
+        try:
+            return SQLiteCache(path, max_entries=max_entries, ttl=ttl, table=name)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open cache at {path}, falling back to memory: {str(e)}")
+            return MemoryCache(max_entries=max_entries, ttl=ttl)
+    if backend == 'memory':
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    return NullCache()
@@ -0,0 +1,160 @@
+"""
+Parsing and validation of the JSON the LLM returns.
+
+Completions are parsed with jiter (the Rust JSON parser the OpenAI SDK
+already depends on). When the output is cut off, e.g. at max_tokens, the
+complete part is recovered instead of discarding the whole generation: the
+top-level fields that arrived and every section that was closed. Anything
+the template's schema needs but didn't arrive is listed in `missing`, so the
+caller can regenerate just those parts.
+"""
+import logging
+
+import jiter
+
+from formatting import schema_for
+from utils import JSONArrayStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+def loads(text):
+    """Parse a complete JSON document. Raises ValueError."""
+    if isinstance(text, str):
+        text = text.encode()
+    return jiter.from_json(text)
+
+
+class ParsedOutput:
+    """
+    `data` is the parsed response. Its sections array (under the template's
+    section key) keeps every section at the index the LLM gave it, with None
+    in place of a malformed one, so the indices in `missing` address it
+    directly; `sections` are just the usable ones. `missing` lists what is
+    absent:
+
+    - "template_data.headline": a required field
+    - "match_report": the sections array itself
+    - "match_report[3:]": sections from index 3 on (the output was cut off)
+    - "match_report[1]": a section that was malformed, None in `data`
+    """
+
+    def __init__(self, data, sections, missing, truncated):
+        self.data = data
+        self.sections = sections
+        self.missing = missing
+        self.truncated = truncated
+
+    @property
+    def complete(self):
+        return not self.missing
+
+
+def _recover_sections(data, text, key):
+    """
+    Items of the array at `key` of the partially parsed `data` that were
+    closed before the text ends (None without the array), and whether the
+    array itself was closed. Every item is kept, whatever its type, so the
+    indices match the ones the LLM wrote.
+    """
+    sections = data.get(key)
+    if not isinstance(sections, list):
+        return None, False
+    parser = JSONArrayStreamParser(key)
+    parser.feed(text)
+    if parser.in_item:
+        # The partial parse includes the item the text ends in
+        sections = sections[:-1]
+    return sections, parser.done
+
+
+def parse_llm_output(text, template_name):
+    """
+    Parse and validate a completion for `template_name`. Returns a
+    ParsedOutput, or None when nothing usable can be recovered.
+    """
+    schema = schema_for(template_name)
+    key = schema.section_key
+    if isinstance(text, bytes):
+        text = text.decode()
+
+    truncated = False
+    try:
+        data = loads(text)
+        sections = data.get(key) if isinstance(data, dict) else None
+        closed = True
+    except ValueError:
+        try:
+            data = jiter.from_json(text.encode(), partial_mode='on')
+        except ValueError as e:
+            logger.warning(f"Unparseable LLM output ({len(text)} chars): {str(e)}")
+            return None
+        truncated = True
+        sections, closed = _recover_sections(data, text, key) if isinstance(data, dict) else (None, False)
+
+    if not isinstance(data, dict):
+        logger.warning(f"LLM output is a {type(data).__name__}, not an object")
+        return None
+
+    missing = schema.missing_paths(data)
+    placed = []
+    if isinstance(sections, list):
+        for index, section in enumerate(sections):
+            if schema.valid_section(section):
+                placed.append(section)
+            else:
+                placed.append(None)
+                missing.append(f'{key}[{index}]')
+        if not closed:
+            missing.append(f'{key}[{len(sections)}:]')
+    else:
+        missing.append(key)
+    data[key] = placed
+    valid = [section for section in placed if section is not None]
+
+    if not valid and schema.sections_required:
+        logger.warning(f"No usable sections in LLM output for {template_name}, missing {missing}")
+        return None
+    if missing:
+        logger.warning(f"Incomplete LLM output for {template_name} (truncated={truncated}), missing {missing}")
+    return ParsedOutput(data, valid, missing, truncated)
+
+
+def parse_section(text, template_name):
+    """The {"section": {...}} of a section regeneration, or None if it isn't a valid section"""
+    try:
+        data = loads(text)
+    except ValueError as e:
+        logger.warning(f"Unparseable section output ({len(text)} chars): {str(e)}")
+        return None
+    section = data.get('section') if isinstance(data, dict) else None
+    if not schema_for(template_name).valid_section(section):
+        logger.warning(f"Invalid section output for {template_name}")
+        return None
+    return section
+
+
+def parse_outline(text, max_sections=None):
+    """
+    The {"template_data", "meta_data", "outline"} of an outline completion,
+    with the outline cut to `max_sections`, or None without a usable outline
+    """
+    try:
+        data = loads(text)
+    except ValueError as e:
+        logger.warning(f"Unparseable outline ({len(text)} chars): {str(e)}")
+        return None
+    outline = data.get('outline') if isinstance(data, dict) else None
+    if not isinstance(outline, list):
+        logger.warning("Outline output has no outline")
+        return None
+    outline = [item for item in outline if isinstance(item, dict) and isinstance(item.get('heading'), str)
+               and item['heading'].strip()][:max_sections]
+    if not outline:
+        logger.warning("Outline output has no usable sections")
+        return None
+    return {
+        'template_data': data.get('template_data') if isinstance(data.get('template_data'), dict) else {},
+        'meta_data': data.get('meta_data') if isinstance(data.get('meta_data'), dict) else {},
+        'outline': outline,
+    }
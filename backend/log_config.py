@@ -0,0 +1,197 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+from flask import g, request
+
+REDACTED = '[redacted]'
+
+SENSITIVE_HEADERS = {'authorization', 'cookie', 'set-cookie', 'stripe-signature', 'x-api-key'}
+SENSITIVE_KEY_PATTERN = re.compile(r'pass(word)?|secret|token|api[_-]?key|authorization|card', re.IGNORECASE)
+
+# Libraries that are far too chatty at DEBUG
+NOISY_LOGGERS = ('hpack', 'httpx', 'httpcore', 'urllib3', 'openai', 'werkzeug')
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are included as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ForkSafeQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a queue that a background thread writes to `handler`.
+    The thread is started lazily, and again after a fork (gunicorn --preload),
+    since threads don't survive into the child.
+    """
+
+    def __init__(self, handler):
+        super().__init__(queue.Queue(-1))
+        self.handler = handler
+        self._listener = None
+        self._pid = None
+
+    def _start_listener(self):
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            # The parent's queue may hold records its listener never wrote
+            self.queue = queue.Queue(-1)
+            self._listener = logging.handlers.QueueListener(self.queue, self.handler, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._listener.stop)
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start_listener()
+        super().enqueue(record)
+
+
+def configure_logging():
+    """
+    Route all logging through a queue so request threads never block on I/O,
+    and write it from a background listener thread. Configured by LOG_LEVEL
+    (default INFO) and LOG_FORMAT (json or text).
+    """
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'json':
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(ForkSafeQueueHandler(handler))
+    root.setLevel(level)
+
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def redact(value, depth=0):
+    """Replace values of sensitive-looking keys in decoded JSON"""
+    if depth > 10:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if SENSITIVE_KEY_PATTERN.search(str(key)) else redact(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, depth + 1) for item in value]
+    return value
+
+
+def redact_headers(headers):
+    return {key: REDACTED if key.lower() in SENSITIVE_HEADERS else value for key, value in headers.items()}
+
+
+def truncate(text, max_bytes):
+    if len(text) <= max_bytes:
+        return text
+    return f'{text[:max_bytes]}... ({len(text)} bytes)'
+
+
+def parse_sample_rates(value):
+    """'/api/generate=0.1,/api/debug=0,*=0.01' -> {'/api/generate': 0.1, ...}"""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        prefix, rate = item.split('=', 1)
+        try:
+            rates[prefix.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+class RequestLogger:
+    """
+    Access log for a Flask app: one structured line per sampled request with
+    method, path, status and duration. Errors (5xx) are always logged.
+
+    The sample rate is chosen by longest path prefix from LOG_REQUEST_SAMPLING
+    (default rate LOG_REQUEST_SAMPLE_RATE). With LOG_REQUEST_PAYLOADS=1 the
+    sampled lines also carry redacted headers and the body, capped at
+    LOG_PAYLOAD_MAX_BYTES.
+    """
+
+    def __init__(self, app, logger_name='requests'):
+        self.logger = logging.getLogger(logger_name)
+        self.default_rate = float(os.getenv('LOG_REQUEST_SAMPLE_RATE', 1.0))
+        self.rates = sorted(parse_sample_rates(os.getenv('LOG_REQUEST_SAMPLING')).items(),
+                            key=lambda item: len(item[0]), reverse=True)
+        self.log_payloads = os.getenv('LOG_REQUEST_PAYLOADS', '0') == '1'
+        self.max_payload_bytes = int(os.getenv('LOG_PAYLOAD_MAX_BYTES', 1024))
+
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def sample_rate(self, path):
+        for prefix, rate in self.rates:
+            if prefix == '*' or path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def _before(self):
+        g.request_started = time.perf_counter()
+
+    def _payload(self):
+        if request.is_json:
+            body = request.get_json(silent=True)
+            text = json.dumps(redact(body), default=str) if body is not None else ''
+        elif (request.content_length or 0) > self.max_payload_bytes * 4:
+            text = f'<{request.content_length} bytes>'
+        else:
+            text = request.get_data(as_text=True)
+        return truncate(text, self.max_payload_bytes)
+
+    def _after(self, response):
+        sampled = random.random() < self.sample_rate(request.path)
+        if not sampled and response.status_code < 500:
+            return response
+
+        started = g.get('request_started')
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1) if started else None,
+        }
+        user = getattr(request, 'user', None)
+        if user is not None:
+            fields['user_id'] = user.id
+        if self.log_payloads and sampled:
+            fields['headers'] = redact_headers(request.headers)
+            fields['body'] = self._payload()
+
+        level = logging.ERROR if response.status_code >= 500 else logging.INFO
+        self.logger.log(level, '%s %s %s', request.method, request.path, response.status_code, extra=fields)
+        return response
@@ -0,0 +1,639 @@
+"""
+Prompt assembly for article generation.
+
+Everything that doesn't depend on the request is built once at import: the
+system prompt per template and the instruction prefix of the user message per
+template and article type. Request data is appended after the static text, so
+consecutive requests share the longest possible prompt prefix and the
+provider's prompt caching can reuse it.
+"""
+import json
+
+from token_budget import dedupe_instructions
+
+MATCH_REPORT_TEMPLATES = ('match_report_template.html', 'ss_match_report_template.html')
+SCOUT_REPORT_TEMPLATES = ('ss_player_scout_report_template.html',)
+
+UNIVERSAL_SYSTEM_PROMPT = """
+You are a professional journalist and analyst. Your task is to generate a structured, well-written, and engaging response based on the provided input.
+
+### Writing Guidelines:
+- **Keep responses detailed and informative**—each major section should contain **at least 3-4 paragraphs**.
+- **Maintain strict focus on the provided topic**—avoid unrelated tangents.
+- **Avoid dramatic language, exaggeration, or sweeping statements**.
+- **Stick to real-world data**—do **not** assume or fabricate missing details.
+- **Ensure responses are formatted as structured JSON**.
+- **Write in a natural, engaging tone**—avoid robotic phrasing.
+- **Vary sentence structure**—mix short, punchy lines with longer, flowing sentences.
+- **Use contractions** (e.g., "he's" instead of "he is") for a more conversational feel.
+- **Avoid overly formal or passive phrases**—write like a human, not a report.
+- **Use real-world examples, context, and subtle emotion to enhance storytelling.**
+- **Ensure smooth transitions between ideas**—avoid abrupt sectioning.
+- **Strictly follow the provided topic and data**—do NOT introduce unrelated details.
+
+
+Your response **must be well-structured and follow the format outlined below**.
+"""
+
+MATCH_REPORT_SYSTEM_PROMPT = """
+You are an expert sports journalist specializing in match reports. Your job is to **write a structured, professional match report**
+
+Return your response in the following JSON format:
+{
+    "template_data": {
+        "headline": string,  // Engaging match headline
+        "match_summary": string,  // Brief overview of the match
+        "featured_image_alt": string
+    },
+    "meta_data": {
+        "meta_description": string,
+        "keywords": array of strings,
+        "og_title": string,
+        "og_description": string,
+        "twitter_title": string,
+        "twitter_description": string
+    },
+    "match_report": [
+        {
+            "type": string,
+            "heading": string,
+            "content": array of strings (paragraphs)
+        }
+    ],
+    "match_stats": {
+        "possession": object,  // e.g., {"home": 60, "away": 40}
+        "shots_on_target": object,
+        "corners": object,
+        "key_events": array of objects  // e.g., [{"time": "23'", "event": "Goal", "team": "home"}]
+    }
+}
+
+### Report Guidelines:
+- **Ensure that all analysis is backed by provided statistics**.
+- **Use appropriate football terminology** (e.g., "high press," "deep block," "clinical finishing").
+"""
+
+SCOUT_REPORT_SYSTEM_PROMPT = """
+You are a professional football analyst specializing in writing scout reports. Your task is to provide an **in-depth, structured scouting analysis** of a player based on the provided data.
+
+Return your response in the following JSON format:
+{
+    "template_data": {
+        "headline": string,  // Engaging report title
+        "summary": string,  // Brief summary of the report
+        "featured_image_alt": string
+    },
+    "meta_data": {
+        "meta_description": string,
+        "keywords": array of strings,
+        "og_title": string,
+        "og_description": string,
+        "twitter_title": string,
+        "twitter_description": string
+    },
+    "scout_report": [
+        {
+            "type": "section",
+            "heading": string,  // Section heading
+            "content": array of strings (single paragraph or cohesive blocks)
+        }
+    ]
+}
+
+### Scouting Report Guidelines:
+- **Ensure each section contains detailed analysis** (minimum **3-4 paragraphs per section**).
+- **Avoid over-reliance on statistics**—explain how the numbers translate into performance.
+- **Discuss technical ability, tactical understanding, physical attributes, and mentality**.
+- **Maintain an objective, data-driven perspective**—do not overhype or make speculative claims.
+"""
+
+ARTICLE_SYSTEM_PROMPT = """
+You are an experienced journalist with expertise in writing structured, well-researched articles. Your task is to produce a **cohesive, insightful article** on the given topic.
+
+Return your response in the following JSON format:
+{
+    "template_data": {
+        "headline": string,  // Engaging article title
+        "short_title": string,  // One-sentence summary
+        "featured_image_alt": string,  // SEO-optimized alt text for the featured image
+        "article_category": string,
+        "slug": string  // URL-friendly version of title
+    },
+    "meta_data": {
+        "meta_description": string (150-160 characters, compelling and keyword-rich),
+        "keywords": array of strings (primary and secondary keywords),
+        "publish_date": string (YYYY-MM-DD),
+        "author": string,
+        "og_title": string,  // Optimized for social sharing
+        "og_description": string,  // Optimized for social sharing
+        "twitter_title": string,  // Optimized for Twitter
+        "twitter_description": string,  // Optimized for Twitter
+        "schema_type": string,  // e.g., "Article", "NewsArticle", "BlogPosting"
+        "focus_keyword": string  // Primary keyword for the article
+    },
+    "article_content": [
+        {
+            "type": "section",
+            "heading": string,
+            "content": array of strings
+        }
+    ]
+}
+
+### Article Writing Guidelines:
+- **Each major section must have at least 3-4 paragraphs**.
+- **Use real-world examples, data, and analysis to support claims**.
+- **Maintain an engaging, yet neutral tone**—no hyperbole or exaggerated statements.
+- **Ensure a smooth narrative flow between sections**—avoid robotic, list-based structures.
+- **Write as if you're recounting a memorable story to a friend—let your language flow naturally.
+- **Add subtle personal touches and natural expressions, but keep it factual and precise.
+"""
+
+# Natural writing style personas
+STYLE_GUIDES = {
+    'tech': """Write this article like an experienced tech journalist.
+Make complex concepts effortless to understand, like explaining to a smart but non-expert friend.
+Keep the tone confident yet engaging, avoiding dry or robotic phrasing.""",
+
+    'travel': """Write this article like a seasoned travel writer, painting vivid pictures of places, smells, and sounds.
+Blend practical insights with immersive storytelling, making the reader feel like they're right there with you.""",
+
+    'sports': """Write this article like a professional football journalist with deep knowledge of tactics, player development, and match analysis.
+Avoid over-the-top enthusiasm—focus on expert insight and factual precision.""",
+
+    'business': """Write this article like a respected business analyst, breaking down complex ideas into clear, actionable insights.
+Keep the tone authoritative yet engaging, avoiding corporate jargon.""",
+
+    'general': """Write this article like an experienced feature writer, crafting engaging, informative content with a natural,
+flowing rhythm that keeps the reader engaged."""
+}
+
+# **Strictly prevent fabricated events**
+FACTUAL_CONSTRAINT = """
+IMPORTANT: You must NOT invent or fabricate real-world events.
+- Stick to verifiable facts.
+- If details are missing, **do NOT assume or create additional information**.
+- Always prioritize journalistic integrity—accuracy over speculation.
+"""
+
+# **Natural tone guidelines**
+NATURAL_TONE_GUIDELINES = """
+To ensure a **clear, factual, and engaging tone**, follow these principles:
+
+✅ **Write naturally and vary your structure**
+   - Mix content formats naturally:
+     • Use paragraphs for main narrative
+     • Add bullet points for key takeaways or lists
+     • Use blockquotes for important quotes or statistics
+   - Let the content guide the format - don't force any particular structure
+   - Transition smoothly between different formats
+
+✅ **Stick to the facts**
+   - Avoid words like "unprecedented," "transformational," "game-changing"
+   - Instead, describe actual impact in neutral terms
+   - Use precise descriptions and data points
+
+✅ **Keep descriptions factual and engaging**
+   - ❌ "This mind-blowing innovation is set to revolutionize everything"
+   - ✅ "This update introduces new capabilities for users, improving efficiency"
+   - Use bullet points when listing features, benefits, or key points
+   - Break up dense information into digestible formats
+
+✅ **Stay focused on the provided topic and data**
+   - Do NOT introduce unrelated details or assumptions
+   - Use supporting data to strengthen your points
+   - Organize information in the most reader-friendly format
+
+**REMEMBER:**
+- Journalism is about clarity and accuracy, not hype
+- Let the data tell the story
+- Choose the most appropriate format for each piece of information
+"""
+
+KEY_WRITING_GUIDELINES = """
+### Key Writing Guidelines:
+- Write a detailed article that fully explores the subject
+- Stay strictly focused on the topic given below
+- Use real-world examples and data to support arguments
+"""
+
+ARTICLE_INSTRUCTIONS = """
+### Required Structure:
+1. **Title**: Create an engaging, attention-grabbing title.
+2. **Headline**: Write a compelling one-sentence summary.
+3. **Meta Information**:
+   - Meta Description: A natural, SEO-friendly description (max 150 characters).
+   - Keywords: Naturally incorporate the keywords given below.
+   - Article Category: As given below.
+   - Featured Image Alt Text: A descriptive text for the featured image.
+
+4. **Article Content:**
+   - **Each major section must have at least 3-4 paragraphs.**
+   - **Expand on each point using supporting data and context.**
+   - **Use real-world examples where relevant.**
+   - **Ensure the article fully explores the subject.**
+
+Use the context and data below to inform your writing.
+"""
+
+MATCH_REPORT_INSTRUCTIONS = """
+### Writing Instructions:
+1. **Match Context & Build-up** (Use the provided context and supporting data)
+   - Set the scene using the background information
+   - Discuss the significance of the match
+   - Include relevant team form and statistics
+
+2. **Match Overview**
+   - Comprehensive introduction
+   - Final result and its implications
+   - Key tactical observations
+
+3. **Detailed Analysis** (Use match statistics to support your analysis)
+   - Analyze possession control
+   - Evaluate attacking effectiveness (shots, xG)
+
+4. **Key Moments** (ONLY if explicit key events exist)
+   - Goals
+   - Disciplinary incidents
+
+5. **Match Impact & Context** (Connect to broader context)
+   - Impact on league/competition standing
+   - Historical context (if provided)
+   - Team form implications
+"""
+
+MATCH_REPORT_REMINDERS = """
+**Final Reminders:**
+- Integrate the supporting data and context throughout the report
+- Use statistics to support your analysis
+- Maintain a professional, analytical tone
+- Stick to the provided data - NO speculation
+"""
+
+SCOUT_REPORT_INSTRUCTIONS = """
+### Writing Requirements:
+- Expand on each attribute in full detail.
+- Avoid brief, summary-like descriptions.
+- Ensure stats and context are naturally woven into the narrative.
+"""
+
+
+def prompt_kind(template_name):
+    if template_name in MATCH_REPORT_TEMPLATES:
+        return 'match_report'
+    if template_name in SCOUT_REPORT_TEMPLATES:
+        return 'scout_report'
+    return 'article'
+
+
+SYSTEM_PROMPTS = {
+    'match_report': UNIVERSAL_SYSTEM_PROMPT + MATCH_REPORT_SYSTEM_PROMPT,
+    'scout_report': UNIVERSAL_SYSTEM_PROMPT + SCOUT_REPORT_SYSTEM_PROMPT,
+    'article': UNIVERSAL_SYSTEM_PROMPT + ARTICLE_SYSTEM_PROMPT,
+}
+
+_OPENINGS = {
+    'match_report': 'Write a professional match report for the match described below using ONLY the provided information.',
+    'scout_report': 'Write a professional scout report about the player described below.',
+    'article': 'Write a structured article about the topic given below.',
+}
+
+_KIND_INSTRUCTIONS = {
+    'match_report': MATCH_REPORT_INSTRUCTIONS,
+    'scout_report': SCOUT_REPORT_INSTRUCTIONS,
+    'article': ARTICLE_INSTRUCTIONS,
+}
+
+
+def _build_prefix(kind, article_type):
+    style_guide = STYLE_GUIDES.get(article_type, STYLE_GUIDES['general'])
+    prefix = '\n'.join([
+        _OPENINGS[kind],
+        style_guide,
+        FACTUAL_CONSTRAINT,
+        NATURAL_TONE_GUIDELINES,
+        KEY_WRITING_GUIDELINES,
+        _KIND_INSTRUCTIONS[kind],
+    ])
+    # Instructions the system prompt already gives are left out
+    return dedupe_instructions(prefix, SYSTEM_PROMPTS[kind])
+
+
+# Static start of the user message per (prompt kind, article type)
+USER_PROMPT_PREFIXES = {
+    (kind, article_type): _build_prefix(kind, article_type)
+    for kind in SYSTEM_PROMPTS
+    for article_type in STYLE_GUIDES
+}
+
+
+def system_prompt(template_name):
+    return SYSTEM_PROMPTS[prompt_kind(template_name)]
+
+
+def _article_details(user_input, article_type):
+    return f"""
+### Article Details
+Topic: {user_input['topic']}
+Keywords: {user_input.get('keywords', '')}
+Article Category: {article_type.capitalize()}
+
+Context:
+{user_input.get('context', 'No context provided.')}
+
+Supporting Data:
+{user_input.get('supporting_data', 'No supporting data provided.')}
+
+### **Final Reminder:**
+- **Stay strictly focused on '{user_input['topic']}'.**
+- **Do NOT assume or fabricate missing details.**
+"""
+
+
+def _match_details(user_input):
+    home, away = user_input['home_team'], user_input['away_team']
+    return f"""
+### Match: {home} vs {away}
+
+### Match Context
+{user_input.get('context', 'No context provided.')}
+
+### Supporting Data & Background
+{user_input.get('supporting_data', 'No supporting data provided.')}
+
+### Match Details
+**Score**: {home} {user_input['home_score']} - {user_input['away_score']} {away}
+**Competition**: {user_input['competition']}
+**Venue**: {user_input['venue']}
+**Date**: {user_input['match_date']}
+
+**Goals**:
+- {home}: {user_input.get('home_scorers', 'None')}
+- {away}: {user_input.get('away_scorers', 'None')}
+
+**Match Statistics**:
+- xG: {home} {user_input.get('home_xg', 0)} vs {user_input.get('away_xg', 0)} {away}
+- Possession: {user_input.get('home_possession')}% vs {user_input.get('away_possession')}%
+- Shots: {user_input.get('home_shots')} ({user_input.get('home_shots_on_target')} on target) vs {user_input.get('away_shots')} ({user_input.get('away_shots_on_target')} on target)
+- Corners: {user_input.get('home_corners')} vs {user_input.get('away_corners')}
+- Fouls: {user_input.get('home_fouls')} vs {user_input.get('away_fouls')}
+- Yellow Cards: {user_input.get('home_yellow_cards')} vs {user_input.get('away_yellow_cards')}
+- Red Cards: {user_input.get('home_red_cards')} vs {user_input.get('away_red_cards')}
+{MATCH_REPORT_REMINDERS}"""
+
+
+def _scout_details(user_input):
+    return f"""
+### Player: {user_input.get('player_name', 'Unknown Player')}
+
+### Provided Data:
+- Position: {user_input.get('player_position', '')}
+- Age: {user_input.get('player_age', '')}
+- Nationality: {user_input.get('player_nationality', '')}
+- Favoured Foot: {user_input.get('favored_foot', '')}
+- Stats: {json.dumps(user_input.get('scout_stats', {}), indent=2)}
+
+**Final Reminder:**
+- **Stay strictly focused on '{user_input['topic']}'.**
+- **Do NOT assume or fabricate missing details.**
+"""
+
+
+def build_user_prompt(user_input):
+    """The user message: the precomputed instructions for the template, then the request data"""
+    template_name = user_input.get('template_name', 'article_template.html')
+    article_type = user_input.get('article_type', 'general')
+    kind = prompt_kind(template_name)
+
+    prefix = USER_PROMPT_PREFIXES.get((kind, article_type)) or USER_PROMPT_PREFIXES[(kind, 'general')]
+    if kind == 'match_report':
+        details = _match_details(user_input)
+    elif kind == 'scout_report':
+        details = _scout_details(user_input)
+    else:
+        details = _article_details(user_input, article_type)
+    return prefix + '\n' + details
+
+
+# Section regeneration: a short system prompt asking for one section, and a
+# user message with the original inputs, the outline and the neighbouring
+# sections instead of the full article instructions
+
+_SECTION_CONTENT = {
+    'match_report': 'array of strings (paragraphs)',
+    'scout_report': 'array of strings (paragraphs)',
+    'article': 'array of paragraphs (strings) and blocks such as {"type": "bullet_list", "points": [strings]}, '
+               '{"type": "numbered_list", "items": [strings]} or {"type": "blockquote", "text": string}',
+}
+
+
+def _section_system_prompt(kind):
+    return UNIVERSAL_SYSTEM_PROMPT + f"""
+You are rewriting one section of an existing {kind.replace('_', ' ')}. Write only that section, so that it
+continues from the section before it and leads into the one after it without repeating them.
+
+Return your response in the following JSON format:
+{{
+    "section": {{
+        "type": "section",
+        "heading": string,
+        "content": {_SECTION_CONTENT[kind]}
+    }}
+}}
+"""
+
+
+SECTION_SYSTEM_PROMPTS = {kind: _section_system_prompt(kind) for kind in SYSTEM_PROMPTS}
+
+_SECTION_OPENINGS = {
+    'match_report': 'Rewrite one section of the match report described below using ONLY the provided information.',
+    'scout_report': 'Rewrite one section of the scout report about the player described below.',
+    'article': 'Rewrite one section of the article about the topic given below.',
+}
+
+SECTION_PREFIXES = {
+    (kind, article_type): '\n'.join([_SECTION_OPENINGS[kind], style_guide, FACTUAL_CONSTRAINT])
+    for kind in SYSTEM_PROMPTS
+    for article_type, style_guide in STYLE_GUIDES.items()
+}
+
+# Characters of each neighbouring section included for context
+NEIGHBOUR_CHARS = 1500
+
+
+def section_system_prompt(template_name):
+    return SECTION_SYSTEM_PROMPTS[prompt_kind(template_name)]
+
+
+def section_text(section, limit=None):
+    """Plain-text version of a response section, cut at about `limit` characters"""
+    lines = [f"## {section.get('heading', '')}"]
+    for block in section.get('content') or []:
+        if isinstance(block, str):
+            lines.append(block)
+        elif isinstance(block, dict):
+            if block.get('text'):
+                lines.append(block['text'])
+            lines.extend(f"- {item}" for item in block.get('points') or block.get('items') or [])
+    text = '\n'.join(lines)
+    if limit is not None and len(text) > limit:
+        text = text[:limit].rsplit(' ', 1)[0] + ' ...'
+    return text
+
+
+def build_section_prompt(user_input, sections, index, instructions=''):
+    """
+    User message to regenerate sections[index], or to write a new section
+    after the last one when index == len(sections). None in `sections` is a
+    section that is missing from the generated article.
+    """
+    template_name = user_input.get('template_name', 'article_template.html')
+    article_type = user_input.get('article_type', 'general')
+    kind = prompt_kind(template_name)
+
+    prefix = SECTION_PREFIXES.get((kind, article_type)) or SECTION_PREFIXES[(kind, 'general')]
+    if kind == 'match_report':
+        details = _match_details(user_input)
+    elif kind == 'scout_report':
+        details = _scout_details(user_input)
+    else:
+        details = _article_details(user_input, article_type)
+
+    outline = [f"{number}. {section.get('heading', '') if section is not None else '(missing section)'}"
+               for number, section in enumerate(sections, 1)]
+    if index == len(sections):
+        outline.append(f"{index + 1}. (new section)")
+    outline[index] += '  <-- this section'
+    parts = [prefix, details, '### Outline', '\n'.join(outline)]
+
+    if index > 0 and sections[index - 1] is not None:
+        parts += ['### Previous Section', section_text(sections[index - 1], NEIGHBOUR_CHARS)]
+    if index + 1 < len(sections) and sections[index + 1] is not None:
+        parts += ['### Next Section', section_text(sections[index + 1], NEIGHBOUR_CHARS)]
+
+    if index == len(sections):
+        task = f"Write section {index + 1}, a new section that follows the ones above."
+    elif sections[index] is None:
+        task = f"Write section {index + 1} of {len(sections)}, which is missing."
+    else:
+        parts += ['### Current Version (to be replaced)', section_text(sections[index])]
+        task = f"Write a new version of section {index + 1} of {len(sections)}."
+    if instructions:
+        task += f"\nEditor's instructions for this section: {instructions}"
+    parts += ['### Task', task]
+    return '\n\n'.join(parts)
+
+
+# Outline-then-sections generation: one small completion plans the document
+# (metadata and an outline), then every section is written concurrently
+
+_OUTLINE_FIELDS = {
+    'scout_report': (
+        '"headline": string, "summary": string, "featured_image_alt": string',
+        '"meta_description": string, "keywords": array of strings, "og_title": string, "og_description": string, '
+        '"twitter_title": string, "twitter_description": string',
+    ),
+    'article': (
+        '"headline": string, "short_title": string, "featured_image_alt": string, "article_category": string, '
+        '"slug": string',
+        '"meta_description": string (150-160 characters), "keywords": array of strings, "author": string, '
+        '"og_title": string, "og_description": string, "twitter_title": string, "twitter_description": string, '
+        '"schema_type": string, "focus_keyword": string',
+    ),
+}
+
+# Bounds on the number of sections an outline may have
+OUTLINE_MIN_SECTIONS = 3
+OUTLINE_MAX_SECTIONS = 8
+
+
+def _outline_system_prompt(kind):
+    template_fields, meta_fields = _OUTLINE_FIELDS[kind]
+    return UNIVERSAL_SYSTEM_PROMPT + f"""
+You are planning a {kind.replace('_', ' ')}. Do not write it yet: return its metadata and an outline of
+{OUTLINE_MIN_SECTIONS} to {OUTLINE_MAX_SECTIONS} sections. Each section will be written separately from
+the outline, so give every section distinct points and don't let sections overlap.
+
+Return your response in the following JSON format:
+{{
+    "template_data": {{{template_fields}}},
+    "meta_data": {{{meta_fields}}},
+    "outline": [
+        {{
+            "heading": string,
+            "points": array of strings  // What the section covers, one short line each
+        }}
+    ]
+}}
+"""
+
+
+def _outlined_section_system_prompt(kind):
+    return UNIVERSAL_SYSTEM_PROMPT + f"""
+You are writing one section of a {kind.replace('_', ' ')} from its outline. The other sections are written
+separately, so cover only this section's points and don't introduce or summarize the whole piece.
+
+Return your response in the following JSON format:
+{{
+    "section": {{
+        "type": "section",
+        "heading": string,
+        "content": {_SECTION_CONTENT[kind]}
+    }}
+}}
+"""
+
+
+OUTLINE_SYSTEM_PROMPTS = {kind: _outline_system_prompt(kind) for kind in _OUTLINE_FIELDS}
+OUTLINED_SECTION_SYSTEM_PROMPTS = {kind: _outlined_section_system_prompt(kind) for kind in _OUTLINE_FIELDS}
+
+_OUTLINED_SECTION_OPENINGS = {
+    'scout_report': 'Write one section of the scout report about the player described below.',
+    'article': 'Write one section of the article about the topic given below.',
+}
+
+OUTLINED_SECTION_PREFIXES = {
+    (kind, article_type): '\n'.join([_OUTLINED_SECTION_OPENINGS[kind], style_guide, FACTUAL_CONSTRAINT])
+    for kind in _OUTLINE_FIELDS
+    for article_type, style_guide in STYLE_GUIDES.items()
+}
+
+
+def supports_outline(template_name):
+    return prompt_kind(template_name) in OUTLINE_SYSTEM_PROMPTS
+
+
+def outline_system_prompt(template_name):
+    return OUTLINE_SYSTEM_PROMPTS[prompt_kind(template_name)]
+
+
+def outlined_section_system_prompt(template_name):
+    return OUTLINED_SECTION_SYSTEM_PROMPTS[prompt_kind(template_name)]
+
+
+def build_outline_prompt(user_input):
+    """The full generation prompt, asking for the outline instead of the article"""
+    return build_user_prompt(user_input) + "\n### Output\nReturn the metadata and the outline only, not the sections' text.\n"
+
+
+def build_outlined_section_prompt(user_input, outline, index):
+    """User message to write section `index` of `outline` ([{"heading", "points"}])"""
+    template_name = user_input.get('template_name', 'article_template.html')
+    article_type = user_input.get('article_type', 'general')
+    kind = prompt_kind(template_name)
+
+    prefix = OUTLINED_SECTION_PREFIXES.get((kind, article_type)) or OUTLINED_SECTION_PREFIXES[(kind, 'general')]
+    if kind == 'scout_report':
+        details = _scout_details(user_input)
+    else:
+        details = _article_details(user_input, article_type)
+
+    lines = []
+    for number, item in enumerate(outline, 1):
+        marker = '  <-- this section' if number == index + 1 else ''
+        lines.append(f"{number}. {item.get('heading', '')}{marker}")
+        lines.extend(f"   - {point}" for point in item.get('points') or [])
+
+    section = outline[index]
+    task = f"Write section {index + 1} of {len(outline)}, \"{section.get('heading', '')}\", covering its points."
+    return '\n\n'.join([prefix, details, '### Outline', '\n'.join(lines), '### Task', task])
@@ -0,0 +1,321 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Used when the user has no active subscription row
+DEFAULT_SUBSCRIPTION = {
+    'plan_type': 'free',
+    'articles_remaining': 3,
+    'articles_generated': 0,
+    'status': 'active'
+}
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class Reservation:
+    """Articles taken from a user's quota, to be committed or refunded"""
+
+    def __init__(self, user_id, count, tracked=True):
+        self.user_id = user_id
+        self.count = count
+        # False when the user has no subscription row, so nothing was decremented
+        self.tracked = tracked
+        self.settled = False
+
+
+class QuotaManager:
+    """
+    Reserve/commit/refund accounting on the subscriptions table.
+
+    reserve() decrements articles_remaining before the work starts, in a
+    single conditional update, so concurrent requests can't spend the same
+    articles. refund() gives them back when the generation fails.
+
+    With `reserve_rpc` / `release_rpc` set, each step is one Postgres call:
+
+        create or replace function reserve_articles(p_user_id uuid, p_count int)
+        returns setof subscriptions language sql as $$
+          update subscriptions
+             set articles_remaining = articles_remaining - p_count,
+                 articles_generated = articles_generated + p_count
+           where user_id = p_user_id and status = 'active'
+             and (articles_remaining >= p_count or plan_type = 'pro')
+          returning *;
+        $$;
+
+        create or replace function release_articles(p_user_id uuid, p_count int)
+        returns setof subscriptions language sql as $$
+          update subscriptions
+             set articles_remaining = articles_remaining + p_count,
+                 articles_generated = greatest(articles_generated - p_count, 0)
+           where user_id = p_user_id and status = 'active'
+          returning *;
+        $$;
+
+    Without them a compare-and-set update on articles_remaining is used.
+
+    The *_async methods do the same through the async Supabase client that
+    `async_client` (a coroutine function) returns, for the async pipeline.
+
+    Subscription rows are kept in `cache` (anything with get/set/delete that
+    stores strings) and replaced by the row each quota update returns. A stale
+    entry is harmless: the compare-and-set fails and the row is read again.
+    """
+
+    def __init__(self, supabase_client, reserve_rpc=None, release_rpc=None, max_attempts=5, cache=None,
+                 async_client=None):
+        self.supabase_client = supabase_client
+        self.async_client = async_client
+        self.reserve_rpc = reserve_rpc
+        self.release_rpc = release_rpc
+        self.max_attempts = max_attempts
+        self.cache = cache
+
+    @staticmethod
+    def _cache_key(user_id):
+        return f'subscription:{user_id}'
+
+    def get_subscription(self, user_id, fresh=False):
+        """Fetch the user's active subscription, defaulting to the free tier"""
+        if self.cache is not None and not fresh:
+            cached = self.cache.get(self._cache_key(user_id))
+            if cached is not None:
+                return json.loads(cached)
+
+        response = self.supabase_client.table('subscriptions')\
+            .select('*')\
+            .eq('user_id', user_id)\
+            .eq('status', 'active')\
+            .order('created_at', desc=True)\
+            .limit(1)\
+            .execute()
+
+        subscription = response.data[0] if response.data else dict(DEFAULT_SUBSCRIPTION)
+        self.remember(user_id, subscription)
+        return subscription
+
+    def remember(self, user_id, subscription):
+        """Store a subscription row just read from or written to the database"""
+        if self.cache is not None:
+            self.cache.set(self._cache_key(user_id), json.dumps(subscription, default=str))
+
+    def invalidate(self, user_id):
+        """Drop the cached row, e.g. after the plan was changed elsewhere"""
+        if self.cache is not None:
+            self.cache.delete(self._cache_key(user_id))
+
+    def _remember_updated(self, user_id, response):
+        rows = [row for row in (response.data or []) if isinstance(row, dict) and row.get('status') == 'active']
+        if rows:
+            self.remember(user_id, rows[0])
+        else:
+            self.invalidate(user_id)
+
+    def reserve(self, user_id, count=1):
+        """Take `count` articles from the user's quota. Raises QuotaExceeded if there aren't enough."""
+        if self.reserve_rpc:
+            response = self.supabase_client.rpc(
+                self.reserve_rpc, {'p_user_id': user_id, 'p_count': count}
+            ).execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return Reservation(user_id, count)
+            # Either not enough articles left or no subscription row
+            return self._reserve_untracked(user_id, count)
+
+        fresh = False
+        for _ in range(self.max_attempts):
+            subscription = self.get_subscription(user_id, fresh=fresh)
+            remaining = subscription['articles_remaining']
+
+            if subscription['plan_type'] != 'pro' and remaining < count:
+                # Make sure a cached row isn't hiding an upgrade
+                if not fresh and self.cache is not None:
+                    fresh = True
+                    continue
+                raise QuotaExceeded()
+
+            # Default free tier without a stored row, nothing to update
+            if 'user_id' not in subscription:
+                return Reservation(user_id, count, tracked=False)
+
+            response = self.supabase_client.table('subscriptions')\
+                .update({
+                    'articles_remaining': remaining - count,
+                    'articles_generated': subscription['articles_generated'] + count
+                })\
+                .eq('user_id', user_id)\
+                .eq('articles_remaining', remaining)\
+                .execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return Reservation(user_id, count)
+            fresh = True
+
+        raise RuntimeError('Could not reserve articles, subscription is being updated concurrently')
+
+    async def get_subscription_async(self, user_id, fresh=False):
+        if self.cache is not None and not fresh:
+            cached = self.cache.get(self._cache_key(user_id))
+            if cached is not None:
+                return json.loads(cached)
+
+        supabase = await self.async_client()
+        response = await supabase.table('subscriptions')\
+            .select('*')\
+            .eq('user_id', user_id)\
+            .eq('status', 'active')\
+            .order('created_at', desc=True)\
+            .limit(1)\
+            .execute()
+
+        subscription = response.data[0] if response.data else dict(DEFAULT_SUBSCRIPTION)
+        self.remember(user_id, subscription)
+        return subscription
+
+    async def reserve_async(self, user_id, count=1):
+        """reserve() through the async client"""
+        supabase = await self.async_client()
+        if self.reserve_rpc:
+            response = await supabase.rpc(
+                self.reserve_rpc, {'p_user_id': user_id, 'p_count': count}
+            ).execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return Reservation(user_id, count)
+            subscription = await self.get_subscription_async(user_id, fresh=True)
+            if 'user_id' not in subscription and subscription['articles_remaining'] >= count:
+                return Reservation(user_id, count, tracked=False)
+            raise QuotaExceeded()
+
+        fresh = False
+        for _ in range(self.max_attempts):
+            subscription = await self.get_subscription_async(user_id, fresh=fresh)
+            remaining = subscription['articles_remaining']
+
+            if subscription['plan_type'] != 'pro' and remaining < count:
+                if not fresh and self.cache is not None:
+                    fresh = True
+                    continue
+                raise QuotaExceeded()
+
+            if 'user_id' not in subscription:
+                return Reservation(user_id, count, tracked=False)
+
+            response = await supabase.table('subscriptions')\
+                .update({
+                    'articles_remaining': remaining - count,
+                    'articles_generated': subscription['articles_generated'] + count
+                })\
+                .eq('user_id', user_id)\
+                .eq('articles_remaining', remaining)\
+                .execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return Reservation(user_id, count)
+            fresh = True
+
+        raise RuntimeError('Could not reserve articles, subscription is being updated concurrently')
+
+    def _reserve_untracked(self, user_id, count):
+        subscription = self.get_subscription(user_id, fresh=True)
+        if 'user_id' not in subscription and subscription['articles_remaining'] >= count:
+            return Reservation(user_id, count, tracked=False)
+        raise QuotaExceeded()
+
+    def commit(self, reservation):
+        """Keep the reserved articles; the generation succeeded"""
+        reservation.settled = True
+
+    def refund(self, reservation, count=None):
+        """Give back `count` (default all) reserved articles"""
+        if reservation.settled:
+            return
+        reservation.settled = True
+
+        count = reservation.count if count is None else count
+        if not reservation.tracked or count <= 0:
+            return
+
+        try:
+            self._release(reservation.user_id, count)
+        except Exception as e:
+            logger.error(f"Failed to refund {count} articles for user {reservation.user_id}: {str(e)}")
+
+    def _release(self, user_id, count):
+        if self.release_rpc:
+            response = self.supabase_client.rpc(self.release_rpc, {'p_user_id': user_id, 'p_count': count}).execute()
+            self._remember_updated(user_id, response)
+            return
+
+        fresh = False
+        for _ in range(self.max_attempts):
+            subscription = self.get_subscription(user_id, fresh=fresh)
+            if 'user_id' not in subscription:
+                return
+
+            remaining = subscription['articles_remaining']
+            response = self.supabase_client.table('subscriptions')\
+                .update({
+                    'articles_remaining': remaining + count,
+                    'articles_generated': max(subscription['articles_generated'] - count, 0)
+                })\
+                .eq('user_id', user_id)\
+                .eq('articles_remaining', remaining)\
+                .execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return
+            fresh = True
+
+        self.invalidate(user_id)
+        raise RuntimeError('Subscription is being updated concurrently')
+
+    async def refund_async(self, reservation, count=None):
+        """refund() through the async client"""
+        if reservation.settled:
+            return
+        reservation.settled = True
+
+        count = reservation.count if count is None else count
+        if not reservation.tracked or count <= 0:
+            return
+
+        try:
+            await self._release_async(reservation.user_id, count)
+        except Exception as e:
+            logger.error(f"Failed to refund {count} articles for user {reservation.user_id}: {str(e)}")
+
+    async def _release_async(self, user_id, count):
+        supabase = await self.async_client()
+        if self.release_rpc:
+            response = await supabase.rpc(self.release_rpc, {'p_user_id': user_id, 'p_count': count}).execute()
+            self._remember_updated(user_id, response)
+            return
+
+        fresh = False
+        for _ in range(self.max_attempts):
+            subscription = await self.get_subscription_async(user_id, fresh=fresh)
+            if 'user_id' not in subscription:
+                return
+
+            remaining = subscription['articles_remaining']
+            response = await supabase.table('subscriptions')\
+                .update({
+                    'articles_remaining': remaining + count,
+                    'articles_generated': max(subscription['articles_generated'] - count, 0)
+                })\
+                .eq('user_id', user_id)\
+                .eq('articles_remaining', remaining)\
+                .execute()
+            if response.data:
+                self._remember_updated(user_id, response)
+                return
+            fresh = True
+
+        self.invalidate(user_id)
+        raise RuntimeError('Subscription is being updated concurrently')
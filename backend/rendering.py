@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def fragment_cache_key(name, key_data):
+    payload = json.dumps([name, key_data], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache_fragment 'name', key_data %}...{% endcache_fragment %}
+
+    Renders the enclosed block once per distinct key_data (e.g. the theme
+    dict) and reuses the HTML afterwards. The block must not use any variable
+    that is not part of key_data.
+    """
+
+    tags = {'cache_fragment'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache_fragment',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_fragment', args), [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, name, key_data, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+
+        key = fragment_cache_key(name, key_data)
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return html
+
+
+class TemplateRenderer:
+    """
+    Renders the article templates and keeps per-template timing stats.
+
+    Templates are compiled once at startup, and compiled bytecode is stored in
+    a directory shared by every worker process on the host so cold workers
+    load it instead of recompiling the large ss_* templates.
+    """
+
+    def __init__(self, app, template_names, cache_dir=None, slow_render_ms=200, fragment_cache_size=500):
+        self.app = app
+        self.template_names = list(template_names)
+        self.slow_render_ms = slow_render_ms
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'pagecrafter-jinja-cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+        # Theme-dependent chrome (the large style blocks) is cached per theme
+        self.fragment_cache = TTLCache(max_entries=fragment_cache_size, ttl=86400)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self.fragment_cache
+
+    def precompile(self):
+        """Load every allowed template so the first requests don't pay for compilation"""
+        started = time.perf_counter()
+        for template_name in self.template_names:
+            try:
+                self.app.jinja_env.get_template(template_name)
+            except Exception as e:
+                logger.error(f"Failed to precompile {template_name}: {str(e)}")
+        logger.info(f"Precompiled {len(self.template_names)} templates in "
+                    f"{(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def render(self, template_name, **context):
+        started = time.perf_counter()
+        html = render_template(template_name, **context)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._record(template_name, elapsed_ms)
+        if elapsed_ms > self.slow_render_ms:
+            logger.warning(f"Slow render of {template_name}: {elapsed_ms:.1f}ms")
+        return html
+
+    def render_block(self, template_name, block_name, **context):
+        """Render a single {% block %} of a template, e.g. its theme styles"""
+        started = time.perf_counter()
+        template = self.app.jinja_env.get_template(template_name)
+        self.app.update_template_context(context)
+        html = ''.join(template.blocks[block_name](template.new_context(context)))
+        self._record(f'{template_name}#{block_name}', (time.perf_counter() - started) * 1000)
+        return html
+
+    def _record(self, template_name, elapsed_ms):
+        with self._lock:
+            stats = self._stats.setdefault(template_name, {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0
+            })
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['last_ms'] = elapsed_ms
+
+    def stats(self):
+        with self._lock:
+            templates = {
+                name: {**stats, 'avg_ms': stats['total_ms'] / stats['count']}
+                for name, stats in self._stats.items()
+            }
+        return {'templates': templates, 'fragment_cache': self.fragment_cache.stats()}
@@ -0,0 +1,231 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+import async_runtime
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """The LLM provider can't take the request right now; retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+def is_retryable(error):
+    """Rate limits, 5xx, timeouts and connection errors are worth retrying"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error):
+    """The Retry-After (or retry-after-ms) the upstream sent with an error, in seconds"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. A Retry-After from the upstream is
+    honoured when it is longer than the backoff, up to `max_delay`; if it is
+    longer than that the call fails instead of waiting.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=20.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (1-based), or None to give up"""
+        if attempt >= self.max_attempts or error is not None and not is_retryable(error):
+            return None
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            return max(backoff, retry_after)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds one trial call is let through (half-open); its
+    outcome closes the circuit again or keeps it open.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go through now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpen(f'{self.name} is unavailable', retry_after=retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """The call was abandoned (e.g. lost a hedge) without telling us anything"""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        return {'state': self.state, 'failures': self.failures}
+
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight upstream calls per process, for threads and coroutines
+    alike. Callers wait up to `timeout` seconds for a slot, then get
+    UpstreamUnavailable instead of piling more requests onto the provider.
+
+    Slots are an asyncio.Semaphore on the shared background loop, so waiting
+    coroutines don't hold a thread; request threads block on a future until
+    the loop hands them a slot.
+    """
+
+    def __init__(self, limit, timeout=30.0, runtime=None):
+        self.limit = limit
+        self.timeout = timeout
+        self.active = 0
+        self.runtime = runtime or async_runtime.runtime
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _semaphore_for(self, loop):
+        with self._lock:
+            # The loop is replaced after a fork, and slots held in the parent with it
+            if self._loop is not loop:
+                self._loop = loop
+                self._semaphore = asyncio.Semaphore(self.limit)
+                self.active = 0
+            return self._semaphore
+
+    async def _acquire(self):
+        """Runs on the background loop"""
+        semaphore = self._semaphore_for(asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailable('Too many generations in progress', retry_after=self.timeout) from None
+        with self._lock:
+            self.active += 1
+
+    def acquire(self):
+        self.runtime.run(self._acquire())
+
+    async def acquire_async(self):
+        loop = self.runtime.loop
+        if asyncio.get_running_loop() is loop:
+            await self._acquire()
+            return
+        waiter = asyncio.run_coroutine_threadsafe(self._acquire(), loop)
+        try:
+            await asyncio.shield(asyncio.wrap_future(waiter))
+        except asyncio.CancelledError:
+            # Hand back the slot if the wait succeeds after we gave up on it
+            waiter.add_done_callback(lambda done: done.exception() or self.release())
+            raise
+
+    def _release(self, semaphore):
+        with self._lock:
+            if semaphore is not self._semaphore:
+                return
+            self.active -= 1
+        semaphore.release()
+
+    def release(self):
+        loop, semaphore = self._loop, self._semaphore
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._release(semaphore)
+        else:
+            loop.call_soon_threadsafe(self._release, semaphore)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def stats(self):
+        return {'limit': self.limit, 'active': self.active}
@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result. A successful result is
+    also handed to late joiners for `window` seconds after it finishes.
+    """
+
+    def __init__(self, window=0):
+        self.window = window
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per key. Returns (result, shared)."""
+        with self._lock:
+            self._purge_expired()
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            with self._lock:
+                # Only successful results are worth handing to late joiners
+                if self.window <= 0 or call.error is not None or call.result is None:
+                    self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [key for key, call in self._calls.items()
+                   if call.finished_at is not None and now - call.finished_at > self.window]
+        for key in expired:
+            del self._calls[key]
@@ -0,0 +1,219 @@
+"""
+Shared fixtures. The app is imported once, with the OpenAI and Supabase
+clients replaced by in-memory fakes per test, so nothing talks to the network.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+JWT_SECRET = 'test-jwt-secret-' + 'x' * 32
+
+os.environ.update({
+    'SUPABASE_URL': 'http://supabase.test',
+    'SUPABASE_SERVICE_KEY': 'test-service-key',
+    'OPENAI_API_KEY': 'sk-test',
+    'SUPABASE_JWT_SECRET': JWT_SECRET,
+    'JOB_DB_PATH': os.path.join(tempfile.mkdtemp(prefix='pagecrafter-tests-'), 'jobs.sqlite3'),
+    'LLM_CACHE_BACKEND': 'memory',
+    'SUBSCRIPTION_CACHE_BACKEND': 'memory',
+    'LLM_MAX_ATTEMPTS': '1',
+})
+
+ARTICLE = {
+    'template_data': {'headline': 'Big Day', 'featured_image_alt': 'alt'},
+    'meta_data': {'meta_description': 'desc', 'keywords': ['a', 'b'], 'author': 'me'},
+    'article_content': [
+        {'type': 'section', 'heading': 'Intro', 'content': ['p1', 'p2']},
+        {'type': 'section', 'heading': 'More', 'content': [{'type': 'bullet_list', 'points': ['x', 'y']}]},
+    ],
+}
+
+GENERATE_PAYLOAD = {
+    'topic': 'Derby day',
+    'keywords': 'derby',
+    'context': 'context',
+    'supporting_data': 'data',
+    'template_name': 'ss_article_template.html',
+    'theme': {'font': 'Inter', 'colors': {'background': '#0b0c1f', 'text': '#fff', 'accent': '#ef7a15'}},
+}
+
+
+def make_token(user_id='user-1', secret=JWT_SECRET, expires_in=600, **claims):
+    return jwt.encode({'sub': user_id, 'email': f'{user_id}@example.com', 'aud': 'authenticated',
+                       'exp': int(time.time()) + expires_in, **claims}, secret, algorithm='HS256')
+
+
+def completion(text, finish_reason='stop', completion_tokens=200):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason=finish_reason)],
+        usage=SimpleNamespace(prompt_tokens=100, completion_tokens=completion_tokens,
+                              total_tokens=100 + completion_tokens)
+    )
+
+
+def stream_chunks(text, size=7):
+    for start in range(0, len(text), size):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[start:start + size]),
+                                                       finish_reason=None)], usage=None)
+    yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=100, completion_tokens=200,
+                                                            total_tokens=300))
+
+
+class FakeLLM:
+    """
+    Stands in for chat.completions.create on both OpenAI clients. `respond`
+    maps the request kwargs to the response text (or raises).
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.respond = lambda request: json.dumps(ARTICLE)
+
+    def create(self, **request):
+        self.calls.append(request)
+        text = self.respond(request)
+        if request.get('stream'):
+            return stream_chunks(text)
+        return completion(text)
+
+    async def acreate(self, **request):
+        return self.create(**request)
+
+
+class FakeQuery:
+    """The part of the postgrest query builder the app uses, over lists of dicts"""
+
+    def __init__(self, rows, log=None):
+        self.rows = rows
+        self.log = log
+        self.operation = 'select'
+        self.values = None
+        self.filters = []
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def update(self, values):
+        self.operation, self.values = 'update', values
+        return self
+
+    def insert(self, values):
+        self.operation, self.values = 'insert', values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args, **kwargs):
+        return self
+
+    def execute(self):
+        if self.log is not None:
+            self.log.append(self.operation)
+        if self.operation == 'insert':
+            self.rows.append(dict(self.values))
+            return SimpleNamespace(data=[dict(self.values)])
+        rows = [row for row in self.rows if all(match(row) for match in self.filters)]
+        if self.operation == 'update':
+            for row in rows:
+                row.update(self.values)
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+
+class FakeAsyncQuery(FakeQuery):
+    async def execute(self):
+        return super().execute()
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {
+            'subscriptions': [{'user_id': 'user-1', 'plan_type': 'free', 'status': 'active',
+                               'articles_remaining': 3, 'articles_generated': 0}],
+            'articles': [],
+        }
+        # Operations run through each client, for tests that care which one is used
+        self.sync_log = []
+        self.async_log = []
+        self.async_client = SimpleNamespace(table=self.async_table)
+
+    def table(self, name):
+        return FakeQuery(self.tables.setdefault(name, []), self.sync_log)
+
+    def async_table(self, name):
+        return FakeAsyncQuery(self.tables.setdefault(name, []), self.async_log)
+
+    async def get_async_client(self):
+        return self.async_client
+
+    def subscription(self, user_id='user-1'):
+        return next(row for row in self.tables['subscriptions'] if row['user_id'] == user_id)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def llm(app_module, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(app_module.client.chat.completions, 'create', fake.create)
+    monkeypatch.setattr(app_module.async_client.chat.completions, 'create', fake.acreate)
+    return fake
+
+
+@pytest.fixture
+def supabase(app_module, monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(app_module.supabase_client, 'table', fake.table)
+    monkeypatch.setattr(app_module.quota, 'async_client', fake.get_async_client)
+    return fake
+
+
+@pytest.fixture
+def client(app_module, llm, supabase, monkeypatch):
+    """Test client with fresh caches, coalescing, quota cache and LLM router"""
+    from llm_backends import create_router_from_env
+    from llm_cache import MemoryCache
+    from singleflight import SingleFlight
+
+    monkeypatch.setattr(app_module, 'llm_cache', MemoryCache(max_entries=100, ttl=60))
+    monkeypatch.setattr(app_module, 'generation_flight', SingleFlight(window=30))
+    monkeypatch.setattr(app_module.quota, 'cache', MemoryCache(max_entries=100, ttl=60))
+    monkeypatch.setattr(app_module, 'llm_router', create_router_from_env(
+        app_module.client, app_module.async_client, app_module.http_pool))
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def auth_headers():
+    return {'Authorization': f'Bearer {make_token()}'}
+
+
+def sse_events(response):
+    """[(event, data), ...] of a Server-Sent Events response"""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields.get('data', 'null'))))
+    return events
@@ -0,0 +1,29 @@
+from conftest import GENERATE_PAYLOAD
+
+
+def test_async_generation_charges_quota(client, auth_headers, supabase):
+    response = client.post('/api/generate/async', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['raw_content']['headline'] == 'Big Day'
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_async_generation_refunds_quota_on_failure(client, auth_headers, supabase, llm):
+    llm.respond = lambda request: 'not json'
+
+    response = client.post('/api/generate/async', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 500
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+
+def test_async_quota_calls_use_the_async_client(client, auth_headers, supabase, llm):
+    llm.respond = lambda request: 'not json'
+
+    client.post('/api/generate/async', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    # Reserve, then the refund after the failed generation
+    assert supabase.async_log == ['select', 'update', 'update']
+    assert 'update' not in supabase.sync_log
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from conftest import GENERATE_PAYLOAD, sse_events
+
+EDITED = {'template_name': 'ss_article_template.html', 'theme': GENERATE_PAYLOAD['theme'],
+          'edited_content': {'headline': 'Edited', 'article_content': '<p>Edited body</p>',
+                             'theme': GENERATE_PAYLOAD['theme']}}
+
+
+def remaining_after_batch(supabase, expected, timeout=5):
+    # The batch settles its quota once every item is done, just after the last event
+    deadline = time.monotonic() + timeout
+    while supabase.subscription()['articles_remaining'] != expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return supabase.subscription()['articles_remaining']
+
+
+def test_batch_streams_every_item(client, auth_headers, supabase):
+    items = [GENERATE_PAYLOAD, {**GENERATE_PAYLOAD, 'topic': 'Cup final'}, EDITED]
+
+    events = sse_events(client.post('/api/generate/batch', json={'items': items}, headers=auth_headers))
+
+    assert events[0] == ('start', {'total': 3})
+    results = sorted((data['index'], data['status']) for event, data in events if event == 'item')
+    assert results == [(0, 200), (1, 200), (2, 200)]
+    assert events[-1] == ('done', {'total': 3, 'succeeded': 3, 'failed': 0})
+    assert remaining_after_batch(supabase, 0) == 0
+
+
+def test_failed_items_are_refunded(client, auth_headers, supabase, llm):
+    llm.respond = lambda request: 'not json' if 'Cup final' in request['messages'][1]['content'] else \
+        '{"template_data": {"headline": "H"}, "meta_data": {"meta_description": "d"}, ' \
+        '"article_content": [{"heading": "A", "content": ["p"]}]}'
+    items = [GENERATE_PAYLOAD, {**GENERATE_PAYLOAD, 'topic': 'Cup final'}]
+
+    events = sse_events(client.post('/api/generate/batch', json={'items': items}, headers=auth_headers))
+
+    assert events[-1][1] == {'total': 2, 'succeeded': 1, 'failed': 1}
+    assert remaining_after_batch(supabase, 2) == 2
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'items': []}, 'No items'),
+    ({'items': 'abc'}, 'must be a list'),
+    ({'items': ['abc']}, 'Item 0 must be an object'),
+    ({'items': [{'topic': 'T'}]}, 'Item 0 is missing required fields'),
+    (['not', 'an', 'object'], 'No items'),
+])
+def test_invalid_batches_are_rejected(client, auth_headers, supabase, body, error):
+    response = client.post('/api/generate/batch', json=body, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+def test_batches_over_the_quota_are_rejected(client, auth_headers, supabase):
+    items = [{**GENERATE_PAYLOAD, 'topic': f'Match {number}'} for number in range(4)]
+    response = client.post('/api/generate/batch', json={'items': items}, headers=auth_headers)
+    assert response.status_code == 403
@@ -0,0 +1,85 @@
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+from conftest import GENERATE_PAYLOAD
+from export import stream_zip, unique_name
+
+ARTICLE = {'template_name': 'ss_article_template.html', 'headline': 'Big Day',
+           'article_content': '<p>Body</p>', 'theme': GENERATE_PAYLOAD['theme']}
+
+
+def read_zip(chunks):
+    return zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+
+def test_unique_name():
+    taken = set()
+    assert [unique_name(name, taken) for name in ('a.html', 'a.html', 'a.html', 'b', 'b')] == [
+        'a.html', 'a-2.html', 'a-3.html', 'b', 'b-2']
+
+
+def test_stream_zip_keeps_order_and_lists_failures():
+    def render(item):
+        if item == 'bad':
+            raise ValueError('cannot render')
+        return f'<h1>{item}</h1>'
+
+    archive = read_zip(stream_zip(['one', 'bad', 'one', 'two'], render, lambda item: f'{item}.html',
+                                  max_workers=2))
+
+    assert archive.namelist() == ['one.html', 'one-2.html', 'two.html', 'manifest.json']
+    assert archive.read('two.html') == b'<h1>two</h1>'
+    assert json.loads(archive.read('manifest.json')) == {
+        'files': ['one.html', 'one-2.html', 'two.html'],
+        'errors': [{'name': 'bad.html', 'error': 'cannot render'}]}
+
+
+def test_stream_zip_renders_a_bounded_number_ahead():
+    rendered = []
+    lock = threading.Lock()
+
+    def render(item):
+        with lock:
+            rendered.append(item)
+        return str(item)
+
+    chunks = stream_zip(range(100), render, lambda item: f'{item}.html', max_workers=2, ahead=3)
+    next(chunks)
+    chunks.close()
+
+    assert len(rendered) <= 4
+
+
+def test_export_articles(client, auth_headers, supabase):
+    supabase.tables['articles'] += [
+        {'id': 7, 'user_id': 'user-1', 'template_name': 'ss_article_template.html',
+         'raw_content': json.dumps({**ARTICLE, 'headline': 'Saved one'})},
+        {'id': 8, 'user_id': 'user-2', 'template_name': 'ss_article_template.html', 'raw_content': ARTICLE},
+    ]
+
+    response = client.post('/api/export', json={'articles': [ARTICLE], 'history_ids': [7]}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    archive = read_zip([response.get_data()])
+    assert archive.namelist() == ['Big-Day.html', 'Saved-one.html', 'manifest.json']
+    assert 'Saved one' in archive.read('Saved-one.html').decode()
+
+
+def test_other_users_articles_are_not_found(client, auth_headers, supabase):
+    supabase.tables['articles'].append({'id': 8, 'user_id': 'user-2', 'raw_content': ARTICLE})
+
+    response = client.post('/api/export', json={'history_ids': [8]}, headers=auth_headers)
+
+    assert response.status_code == 404
+    assert response.get_json()['missing_ids'] == [8]
+
+
+@pytest.mark.parametrize('body', [{}, {'articles': 'abc'}, {'articles': ['abc']},
+                                  {'history_ids': list(range(1000))}])
+def test_invalid_exports_are_rejected(client, auth_headers, body):
+    assert client.post('/api/export', json=body, headers=auth_headers).status_code == 400
@@ -0,0 +1,113 @@
+import pytest
+
+from formatting import (DEFAULT_IMAGE_URL, format_content, format_section_html, get_section_key, parse_recent_form,
+                        schema_for)
+
+MATCH_RESPONSE = {
+    'template_data': {'headline': 'Reds edge Blues', 'match_summary': 'Tight game', 'featured_image_alt': ' '},
+    'meta_data': {'meta_description': 'Report', 'keywords': ['reds', 'blues']},
+    'match_report': [{'heading': 'First half', 'content': ['Quiet start.']}],
+}
+MATCH_REQUEST = {'home_team': 'Reds', 'away_team': 'Blues', 'home_score': 2, 'away_score': 1,
+                 'home_possession': 61, 'home_xg': '1.4', 'image_url': '  ', 'theme': {'font': 'Inter'}}
+
+
+def test_match_reports_mix_llm_and_request_fields():
+    values = format_content(MATCH_RESPONSE, 'ss_match_report_template.html', MATCH_REQUEST)
+
+    assert values['headline'] == 'Reds edge Blues'
+    assert values['home_team'] == 'Reds'
+    assert values['article_category'] == 'Sports'
+    assert values['featured_image_url'] == DEFAULT_IMAGE_URL
+    assert values['featured_image_alt'] == 'Reds vs Blues match report'
+    assert values['match_stats']['possession'] == {'home': 61, 'away': 50}
+    assert values['match_stats']['xg'] == {'home': 1.4, 'away': 0.0}
+    assert values['theme'] == {'font': 'Inter'}
+    assert values['article_content'].count('class="ss-content-paragraph"') == 1
+    assert values['sections'] == MATCH_RESPONSE['match_report']
+
+
+def test_both_match_templates_share_fields_but_not_html():
+    plain = format_content(MATCH_RESPONSE, 'match_report_template.html', MATCH_REQUEST)
+    styled = format_content(MATCH_RESPONSE, 'ss_match_report_template.html', MATCH_REQUEST)
+
+    assert {key: value for key, value in plain.items() if key != 'article_content'} == \
+        {key: value for key, value in styled.items() if key != 'article_content'}
+    assert '<section class="match-section">' in plain['article_content']
+
+
+def test_defaults_fill_in_missing_values():
+    values = format_content({}, 'ss_player_scout_report_template.html')
+
+    assert values['headline'] == 'Default Headline'
+    assert values['player_name'] == 'Unknown Player'
+    assert values['keywords'] == ''
+    assert values['article_content'] == ''
+    assert values['form_summary'] == {} and values['recent_matches'] == []
+
+
+def test_mutable_defaults_are_not_shared():
+    first = format_content({}, 'ss_article_template.html')
+    first['theme']['font'] = 'changed'
+    assert format_content({}, 'ss_article_template.html')['theme'] == {}
+
+
+def test_article_sections_render_lists_and_skip_the_main_headline():
+    response = {'template_data': {'headline': 'Title'}, 'article_content': [
+        {'heading': 'Title', 'content': ['Repeated headline']},
+        {'heading': 'Body', 'content': ['<p>One</p>', {'type': 'bullet_list', 'points': ['a']},
+                                        {'type': 'blockquote', 'text': 'Quote'}]},
+    ]}
+
+    content = format_content(response, 'ss_article_template.html')['article_content']
+
+    assert content == '<h2>Body</h2>\n<p>One</p>\n<ul>\n<li>a</li>\n</ul>\n<blockquote>Quote</blockquote>'
+
+
+def test_unknown_templates_use_the_standard_schema():
+    values = format_content({'template_data': {'headline': 'H'}, 'meta_data': {'keywords': ['a', 'b']}},
+                            'custom.html')
+
+    assert values['keywords'] == 'a, b'
+    assert get_section_key('custom.html') == 'article_content'
+    assert 'template_data.slug' in schema_for('custom.html').missing_paths({'template_data': {'headline': 'H'}})
+
+
+def test_missing_paths_treats_blank_as_missing():
+    schema = schema_for('ss_article_template.html')
+    assert schema.missing_paths({'template_data': {'headline': ''}, 'meta_data': {'meta_description': 'd'}}) == [
+        'template_data.headline']
+
+
+@pytest.mark.parametrize('section, valid', [
+    ({'heading': 'H', 'content': ['p']}, True),
+    ({'heading': 'H'}, False),
+    ({'content': 'not a list'}, False),
+    ('text', False),
+])
+def test_valid_section(section, valid):
+    assert schema_for('ss_article_template.html').valid_section(section) is valid
+
+
+def test_scout_sections_need_no_content():
+    assert schema_for('ss_player_scout_report_template.html').valid_section({'heading': 'H'})
+    assert format_section_html({'heading': 'H'}, 'ss_player_scout_report_template.html') == \
+        '<section class="scout-report-section">\n\n<h2>H</h2>\n\n</section>\n'
+
+
+def test_recent_form_is_parsed_from_the_scout_stats():
+    form = '\n'.join([
+        'Recent Form',
+        'Total: 3 goals from 10 shots (8 on target, 1.11 xG)',
+        '',
+        '- vs Nottm Forest (H): 0 goals from 1 shots (1 on target, 0.03 xG)',
+        '- vs Everton (A): 2 goals from 4 shots (3 on target, 0.80 xG)',
+    ])
+
+    summary, matches = parse_recent_form(form)
+
+    assert summary == {'goals': 3, 'shots': 10, 'on_target': 8, 'xg': 1.11}
+    assert matches[1] == {'opponent': 'Everton', 'venue': 'Away', 'goals': 2, 'shots': 4, 'on_target': 3,
+                          'xg': 0.8}
+    values = format_content({}, 'ss_player_scout_report_template.html', {'scout_stats': {'Recent Form': form}})
+    assert values['recent_matches'] == matches
@@ -0,0 +1,42 @@
+import httpx
+
+from http_pool import HTTPPool, MeteredTransport, parse_host_limits
+
+
+def test_parse_host_limits():
+    assert parse_host_limits('api.openai.com=50, *.supabase.co=20,bad,x=y') == {
+        'api.openai.com': 50, '*.supabase.co': 20}
+    assert parse_host_limits(None) == {}
+
+
+def test_metered_transport_records_requests_per_host():
+    pool = HTTPPool(http2=False)
+
+    def handler(request):
+        return httpx.Response(503 if request.url.path == '/down' else 200)
+
+    with httpx.Client(transport=MeteredTransport(httpx.MockTransport(handler), pool.metrics)) as client:
+        client.get('https://api.example.com/ok')
+        client.get('https://api.example.com/down')
+        client.get('https://images.example.com/ok')
+
+    hosts = pool.stats()['hosts']
+    assert hosts['api.example.com']['requests'] == 2
+    assert hosts['api.example.com']['errors'] == 1
+    assert hosts['api.example.com']['active'] == 0
+    assert hosts['images.example.com']['requests'] == 1
+
+
+def test_clients_mount_per_host_limits():
+    pool = HTTPPool(http2=False, host_limits={'api.openai.com': 5})
+    client = pool.client()
+    assert any('api.openai.com' in pattern.pattern for pattern in client._mounts)
+    client.close()
+
+
+def test_http_debug_endpoint_needs_the_debug_token(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    assert client.get('/api/debug/http').status_code == 401
+    response = client.get('/api/debug/http', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'hosts' in response.get_json()
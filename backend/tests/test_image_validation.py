@@ -0,0 +1,131 @@
+import socket
+
+import httpx
+import pytest
+
+import image_validation
+from image_validation import ImageValidator, extract_image_urls, is_public_host
+
+PUBLIC_HOSTS = {'images.example.com': '93.184.216.34', 'cdn.example.com': '93.184.216.35',
+                'internal.example.com': '10.0.0.5'}
+
+
+@pytest.fixture(autouse=True)
+def resolver(monkeypatch):
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host in PUBLIC_HOSTS:
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (PUBLIC_HOSTS[host], port or 0))]
+        return real_getaddrinfo(host, port, *args, **kwargs)
+    monkeypatch.setattr(image_validation.socket, 'getaddrinfo', getaddrinfo)
+
+
+def validator_for(handler, **kwargs):
+    requests = []
+
+    def recording(request):
+        requests.append(str(request.url))
+        return handler(request)
+    validator = ImageValidator(httpx.Client(transport=httpx.MockTransport(recording)), **kwargs)
+    return validator, requests
+
+
+def image(request):
+    return httpx.Response(200, headers={'content-type': 'image/png'})
+
+
+def test_extract_image_urls_keeps_order_and_drops_duplicates():
+    html = '<p><img src="a.png"><IMG alt="x" src=\'b.png\'><img src="a.png"></p>'
+    assert extract_image_urls(html) == ['a.png', 'b.png']
+    assert extract_image_urls(None) == []
+
+
+@pytest.mark.parametrize('host', ['127.0.0.1', 'localhost', '169.254.169.254', '10.0.0.1',
+                                  '192.168.1.1', '::1', '::ffff:127.0.0.1', 'internal.example.com'])
+def test_non_public_hosts_are_refused(host):
+    assert not is_public_host(host)
+
+
+def test_public_hosts_are_allowed():
+    assert is_public_host('images.example.com', 443)
+    assert is_public_host('93.184.216.34')
+
+
+@pytest.mark.parametrize('url', ['http://127.0.0.1/a.png', 'http://169.254.169.254/latest/meta-data.png',
+                                 'http://10.0.0.1/a.png', 'http://[::1]/a.png', 'file:///etc/passwd'])
+def test_private_urls_are_never_requested(url):
+    validator, requests = validator_for(image)
+
+    assert validator.validate(url) is False
+    assert requests == []
+
+
+def test_images_on_public_hosts_are_checked():
+    validator, requests = validator_for(image)
+
+    assert validator.validate('https://images.example.com/a.png') is True
+    assert validator.validate('https://images.example.com/a.png') is True
+    assert requests == ['https://images.example.com/a.png']
+
+
+def test_redirects_are_followed_between_public_hosts():
+    def handler(request):
+        if request.url.host == 'images.example.com':
+            return httpx.Response(302, headers={'location': 'https://cdn.example.com/a.png'})
+        return image(request)
+    validator, requests = validator_for(handler)
+
+    assert validator.validate('https://images.example.com/a.png') is True
+    assert requests == ['https://images.example.com/a.png', 'https://cdn.example.com/a.png']
+
+
+@pytest.mark.parametrize('location', ['http://169.254.169.254/latest/meta-data/',
+                                      'http://internal.example.com/a.png', 'http://127.0.0.1:8080/a.png'])
+def test_redirects_to_private_hosts_are_refused(location):
+    def handler(request):
+        return httpx.Response(302, headers={'location': location})
+    validator, requests = validator_for(handler)
+
+    assert validator.validate('https://images.example.com/a.png') is False
+    assert requests == ['https://images.example.com/a.png']
+
+
+def test_redirect_loops_stop():
+    def handler(request):
+        return httpx.Response(302, headers={'location': '/again.png'})
+    validator, requests = validator_for(handler)
+
+    assert validator.validate('https://images.example.com/a.png') is False
+    assert len(requests) == image_validation.MAX_REDIRECTS + 1
+
+
+def test_validate_many_is_capped():
+    validator, requests = validator_for(image, max_urls=2)
+    urls = [f'https://images.example.com/{number}.png' for number in range(3)]
+
+    with pytest.raises(ValueError):
+        validator.validate_many(urls)
+    assert validator.validate_many(urls[:2] + urls[:1]) == {urls[0]: True, urls[1]: True}
+
+
+def test_endpoint_rejects_too_many_urls(client, auth_headers, app_module):
+    urls = [f'https://images.example.com/{number}.png' for number in range(app_module.image_validator.max_urls + 1)]
+
+    response = client.post('/api/images/validate', json={'urls': urls}, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert 'At most' in response.get_json()['error']
+
+
+def test_endpoint_rejects_a_string_of_urls(client, auth_headers):
+    response = client.post('/api/images/validate', json={'urls': 'http://127.0.0.1/a.png'}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_endpoint_reports_private_images_as_invalid(client, auth_headers):
+    response = client.post('/api/images/validate', json={'content': '<img src="http://169.254.169.254/a.png">'},
+                           headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.get_json()['invalid'] == ['http://169.254.169.254/a.png']
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from conftest import GENERATE_PAYLOAD, make_token, sse_events
+from jobs import JobStore, JobWorkerPool
+
+
+def test_jobs_are_claimed_oldest_first_and_once(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    first = store.create('user-1', {'topic': 'a'})
+    second = store.create('user-1', {'topic': 'b'})
+
+    assert store.claim_next()['id'] == first
+    assert store.claim_next()['id'] == second
+    assert store.claim_next() is None
+    assert store.get(first)['status'] == 'running'
+
+
+def test_finished_jobs_keep_their_result(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    succeeded, failed = store.create('user-1', {}), store.create('user-1', {})
+    store.finish(succeeded, {'preview_html': '<p>'}, 200)
+    store.finish(failed, {'error': 'boom'}, 500)
+
+    assert store.get(succeeded)['status'] == 'succeeded'
+    assert store.get(succeeded)['result'] == {'preview_html': '<p>'}
+    assert store.get(failed)['status'] == 'failed'
+
+
+def test_stale_running_jobs_are_requeued_and_old_results_purged(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), retention=-1)
+    running, finished = store.create('user-1', {}), store.create('user-1', {})
+    store.claim_next()
+    store.finish(finished, {}, 200)
+
+    assert store.requeue_stale(older_than=-1) == 1
+    assert store.get(running)['status'] == 'queued'
+    assert store.purge_finished() == 1
+    assert store.get(finished) is None
+
+
+def test_each_process_opens_its_own_connection(tmp_path, monkeypatch):
+    path = tmp_path / 'jobs.sqlite3'
+    store = JobStore(str(path))
+    assert not path.exists()
+
+    job_id = store.create('user-1', {})
+    parent = store._conn
+    # As seen from a forked worker
+    monkeypatch.setattr('jobs.os.getpid', lambda: -1)
+
+    assert store._conn is not parent
+    assert store.get(job_id)['status'] == 'queued'
+
+
+def test_workers_run_queued_jobs(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    done = threading.Event()
+
+    def handler(job):
+        if job['payload'].get('fail'):
+            raise RuntimeError('boom')
+        done.set()
+        return {'topic': job['payload']['topic']}, 200
+
+    pool = JobWorkerPool(store, handler, workers=1, poll_interval=0.01)
+    failing = store.create('user-1', {'fail': True})
+    job_id = store.create('user-1', {'topic': 'a'})
+    pool.ensure_started()
+
+    assert done.wait(5)
+    deadline = time.monotonic() + 5
+    while store.get(job_id)['status'] != 'succeeded' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.get(job_id)['result'] == {'topic': 'a'}
+    assert store.get(failing)['result'] == {'error': 'boom'}
+
+
+def wait_for_job(client, job_id, headers, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()
+        if job['status'] in ('succeeded', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def test_submitted_jobs_generate_and_charge_quota(client, auth_headers, supabase):
+    response = client.post('/api/jobs', json=GENERATE_PAYLOAD, headers=auth_headers)
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.get_json()['job_id'], auth_headers)
+
+    assert job['status'] == 'succeeded'
+    assert job['result']['raw_content']['headline'] == 'Big Day'
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_failed_jobs_are_refunded(client, auth_headers, supabase, llm):
+    llm.respond = lambda request: 'not json'
+    job_id = client.post('/api/jobs', json=GENERATE_PAYLOAD, headers=auth_headers).get_json()['job_id']
+
+    job = wait_for_job(client, job_id, auth_headers)
+
+    assert job['status'] == 'failed'
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+def test_jobs_are_private_to_their_user(client, auth_headers, supabase):
+    supabase.tables['subscriptions'].append({'user_id': 'user-2', 'plan_type': 'free', 'status': 'active',
+                                             'articles_remaining': 3, 'articles_generated': 0})
+    job_id = client.post('/api/jobs', json=GENERATE_PAYLOAD, headers=auth_headers).get_json()['job_id']
+    wait_for_job(client, job_id, auth_headers)
+
+    other_user = {'Authorization': f'Bearer {make_token("user-2")}'}
+    assert client.get(f'/api/jobs/{job_id}', headers=other_user).status_code == 404
+
+
+def test_job_streams_close_with_a_pending_event(app_module, client, auth_headers, tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(app_module, 'job_store', store)
+    monkeypatch.setattr(app_module.job_workers, 'ensure_started', lambda: None)
+    monkeypatch.setattr(app_module, 'JOB_STREAM_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(app_module, 'JOB_STREAM_MAX_SECONDS', 0.05)
+    job_id = store.create('user-1', {})
+
+    events = sse_events(client.get(f'/api/jobs/{job_id}/stream', headers=auth_headers))
+
+    assert events == [('status', {'job_id': job_id, 'status': 'queued'}),
+                      ('pending', {'job_id': job_id, 'status': 'queued'})]
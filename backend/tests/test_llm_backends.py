@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from conftest import completion
+from llm_backends import Backend, BackendRouter
+from resilience import CircuitBreaker, RetryPolicy
+
+REQUEST = {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'hi'}]}
+
+
+def server_error():
+    request = httpx.Request('POST', 'http://llm.test/v1/chat/completions')
+    return openai.InternalServerError('boom', response=httpx.Response(500, request=request), body=None)
+
+
+class FakeAsyncClient:
+    """An AsyncOpenAI stand-in answering `text` after `delay` seconds, or raising `error`"""
+
+    def __init__(self, text='ok', delay=0.0, error=None):
+        self.text, self.delay, self.error = text, delay, error
+        self.requests = []
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        self.requests.append(request)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return completion(self.text)
+
+
+def backend(name, latencies=(), hedge_only=False, **kwargs):
+    result = Backend(name, None, FakeAsyncClient(**kwargs), hedge_only=hedge_only,
+                     breaker=CircuitBreaker(name, failure_threshold=1))
+    for latency in latencies:
+        result.record(latency)
+    return result
+
+
+def router(*backends, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(max_attempts=1))
+    return BackendRouter(backends, **kwargs)
+
+
+def test_ranking_prefers_untried_then_fast_backends():
+    slow, fast, new = backend('slow', [2.0]), backend('fast', [0.5]), backend('new')
+    hedge = backend('hedge', hedge_only=True)
+    failing = backend('failing', [0.1])
+    failing.record_error()
+
+    assert [b.name for b in router(slow, hedge, failing, fast, new).ranked()] == [
+        'new', 'fast', 'slow', 'failing', 'hedge']
+
+
+def test_open_circuits_go_last():
+    broken, slow = backend('broken', [0.1]), backend('slow', [5.0])
+    broken.breaker.record_failure()
+
+    assert router(broken, slow).primary() is slow
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    primary, hedge = backend('primary', text='slow', delay=5), backend('hedge', text='fast', hedge_only=True)
+
+    result, winner = asyncio.run(router(primary, hedge, hedge_after=0.01).complete(**REQUEST))
+
+    assert (result.choices[0].message.content, winner) == ('fast', hedge)
+    assert primary.async_client.cancelled == 1
+
+
+def test_no_hedge_before_the_delay():
+    primary, hedge = backend('primary', text='first', delay=0.01), backend('hedge', hedge_only=True)
+
+    result, winner = asyncio.run(router(primary, hedge, hedge_after=1).complete(**REQUEST))
+
+    assert winner is primary
+    assert hedge.async_client.requests == []
+
+
+def test_failures_fail_over_and_open_the_circuit():
+    primary, fallback = backend('primary', error=server_error()), backend('fallback', text='saved')
+    balancer = router(primary, fallback)
+
+    _, winner = asyncio.run(balancer.complete(**REQUEST))
+
+    assert winner is fallback
+    assert primary.breaker.state == 'open'
+    assert balancer.primary() is fallback
+
+
+def test_errors_are_raised_when_every_backend_fails():
+    balancer = router(backend('a', error=server_error()), backend('b', error=server_error()))
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(balancer.complete(**REQUEST))
+
+
+def test_backend_models_override_the_request():
+    local = Backend('local', None, FakeAsyncClient(), model='llama')
+
+    asyncio.run(router(local).complete(**REQUEST))
+
+    assert local.async_client.requests[0]['model'] == 'llama'
+
+
+def test_retryable_errors_are_retried():
+    flaky = backend('flaky')
+    errors = [server_error()]
+    create = flaky.async_client.create
+
+    async def fail_once(**request):
+        if errors:
+            raise errors.pop()
+        return await create(**request)
+    flaky.async_client.chat.completions.create = fail_once
+    flaky.breaker.failure_threshold = 5
+
+    _, winner = asyncio.run(router(flaky, retry_policy=RetryPolicy(max_attempts=2, base_delay=0)).complete(**REQUEST))
+
+    assert winner is flaky
+    assert flaky.consecutive_errors == 0
+
+
+def test_debug_llm_backends_needs_the_debug_token(app_module, client, monkeypatch):
+    assert client.get('/api/debug/llm-backends').status_code == 404
+
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    assert client.get('/api/debug/llm-backends').status_code == 401
+    response = client.get('/api/debug/llm-backends', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'openai' in response.get_json()['backends']
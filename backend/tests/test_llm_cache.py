@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from conftest import ARTICLE, completion
+from llm_cache import MemoryCache, NullCache, SQLiteCache, create_cache_from_env, make_cache_key
+
+
+def test_cache_key_covers_prompts_model_and_params():
+    key = make_cache_key('system', 'prompt', 'gpt-4o', temperature=0.7, top_p=0.9)
+    assert key == make_cache_key('system', 'prompt', 'gpt-4o', top_p=0.9, temperature=0.7)
+    assert key != make_cache_key('system', 'prompt', 'gpt-4o', temperature=0.2, top_p=0.9)
+    assert key != make_cache_key('system', 'other prompt', 'gpt-4o', temperature=0.7, top_p=0.9)
+    assert key != make_cache_key('system', 'prompt', 'gpt-4o-mini', temperature=0.7, top_p=0.9)
+
+
+def test_sqlite_cache_expires_and_evicts(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'), max_entries=2, ttl=60)
+    cache.set('a', '1')
+    cache.set('expired', '2', ttl=-1)
+    assert cache.get('a') == '1'
+    assert cache.get('expired') is None
+
+    cache.set('b', '2')
+    cache.set('c', '3')
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_sqlite_cache_reconnects_after_a_fork(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    cache.set('a', '1')
+    parent = cache._conn
+    monkeypatch.setattr('llm_cache.os.getpid', lambda: -1)
+
+    assert cache.get('a') == '1'
+    assert cache._conn is not parent
+
+
+def test_create_cache_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv('TEST_CACHE_BACKEND', 'none')
+    assert isinstance(create_cache_from_env('TEST_CACHE'), NullCache)
+    monkeypatch.setenv('TEST_CACHE_BACKEND', 'sqlite')
+    monkeypatch.setenv('TEST_CACHE_PATH', str(tmp_path / 'test.sqlite3'))
+    assert isinstance(create_cache_from_env('TEST_CACHE'), SQLiteCache)
+    monkeypatch.setenv('TEST_CACHE_PATH', str(tmp_path / 'missing' / 'test.sqlite3'))
+    assert isinstance(create_cache_from_env('TEST_CACHE'), MemoryCache)
+    monkeypatch.setenv('TEST_CACHE_BACKEND', 'memory')
+    assert isinstance(create_cache_from_env('TEST_CACHE'), MemoryCache)
+
+
+def test_run_gpt4_serves_repeated_prompts_from_the_cache(app_module, client, llm):
+    first = app_module.run_gpt4('prompt', 'ss_article_template.html')
+    second = app_module.run_gpt4('prompt', 'ss_article_template.html')
+
+    assert first == second == json.dumps(ARTICLE)
+    assert len(llm.calls) == 1
+
+    app_module.run_gpt4('prompt', 'ss_article_template.html', use_cache=False)
+    assert len(llm.calls) == 2
+
+
+def test_run_gpt4_does_not_cache_truncated_completions(app_module, client, llm, monkeypatch):
+    async def truncated(**request):
+        llm.calls.append(request)
+        return completion('{"template_data": {', finish_reason='length')
+    monkeypatch.setattr(app_module.async_client.chat.completions, 'create', truncated)
+
+    app_module.run_gpt4('prompt', 'ss_article_template.html')
+    app_module.run_gpt4('prompt', 'ss_article_template.html')
+    assert len(llm.calls) == 2
+
+
+@pytest.mark.parametrize('token, status', [(None, 404), ('secret', 401)])
+def test_debug_cache_needs_the_debug_token(app_module, client, monkeypatch, token, status):
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', token)
+    assert client.get('/api/debug/cache', headers={'Authorization': 'Bearer wrong'}).status_code == status
+
+
+def test_debug_cache_with_the_debug_token(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    response = client.get('/api/debug/cache', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.get_json()['backend'] == 'memory'
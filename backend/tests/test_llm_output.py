@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from conftest import ARTICLE
+from formatting import format_content
+from llm_output import parse_llm_output, parse_outline, parse_section
+
+TEMPLATE = 'ss_article_template.html'
+HEADER = '{"template_data": {"headline": "Big Day"}, "meta_data": {"meta_description": "d"}, "article_content": ['
+ONE = '{"heading": "One", "content": ["First."]}'
+TWO = '{"heading": "Two", "content": ["Second."]}'
+
+
+def test_complete_output():
+    parsed = parse_llm_output(json.dumps(ARTICLE), TEMPLATE)
+
+    assert parsed.complete and not parsed.truncated
+    assert parsed.sections == ARTICLE['article_content']
+
+
+def test_cut_inside_a_section_keeps_the_closed_ones():
+    parsed = parse_llm_output(HEADER + ONE + ', {"heading": "Two", "content": ["Sec', TEMPLATE)
+
+    assert parsed.truncated
+    assert parsed.data['article_content'] == [json.loads(ONE)]
+    assert parsed.missing == ['article_content[1:]']
+
+
+def test_cut_between_sections():
+    parsed = parse_llm_output(HEADER + ONE + ', ' + TWO + ',', TEMPLATE)
+
+    assert [section['heading'] for section in parsed.sections] == ['One', 'Two']
+    assert parsed.missing == ['article_content[2:]']
+
+
+def test_malformed_sections_keep_their_place():
+    text = HEADER + ONE + ', {"heading": "Bad"}, ' + TWO + ']}'
+
+    parsed = parse_llm_output(text, TEMPLATE)
+
+    assert parsed.data['article_content'] == [json.loads(ONE), None, json.loads(TWO)]
+    assert parsed.sections == [json.loads(ONE), json.loads(TWO)]
+    assert parsed.missing == ['article_content[1]']
+    values = format_content(parsed.data, TEMPLATE)
+    assert values['sections'][1] is None
+    assert '<h2>One</h2>' in values['article_content'] and '<h2>Two</h2>' in values['article_content']
+
+
+def test_scalar_items_keep_later_indices_when_cut_off():
+    parsed = parse_llm_output(HEADER + ONE + ', "junk", null, ' + TWO + ', {"heading": "Thr', TEMPLATE)
+
+    assert parsed.data['article_content'] == [json.loads(ONE), None, None, json.loads(TWO)]
+    assert parsed.missing == ['article_content[1]', 'article_content[2]', 'article_content[4:]']
+
+
+def test_cut_before_the_sections():
+    assert parse_llm_output('{"template_data": {"headline": "Big Day"}, "meta', TEMPLATE) is None
+
+    parsed = parse_llm_output('{"template_data": {"headline": "Big Day"}, "meta',
+                              'ss_player_scout_report_template.html')
+    assert parsed.missing == ['meta_data.meta_description', 'scout_report']
+    assert parsed.data['scout_report'] == []
+
+
+def test_missing_required_fields_are_listed():
+    parsed = parse_llm_output('{"template_data": {"headline": "Big D', TEMPLATE)
+    assert parsed is None
+
+    parsed = parse_llm_output('{"article_content": [' + ONE + ']}', TEMPLATE)
+    assert parsed.missing == ['template_data.headline', 'meta_data.meta_description']
+    assert not parsed.truncated
+
+
+@pytest.mark.parametrize('text', ['not json', '[1, 2]', ''])
+def test_unusable_output(text):
+    assert parse_llm_output(text, TEMPLATE) is None
+
+
+def test_parse_section():
+    assert parse_section('{"section": ' + ONE + '}', TEMPLATE) == json.loads(ONE)
+    assert parse_section('{"section": {"heading": "H"}}', TEMPLATE) is None
+    assert parse_section('{"section": ', TEMPLATE) is None
+
+
+def test_parse_outline_drops_unusable_items_and_caps_the_length():
+    text = json.dumps({'template_data': {'headline': 'H'}, 'meta_data': 'bad', 'outline': [
+        {'heading': 'A'}, {'heading': ' '}, 'junk', {'heading': 'B'}, {'heading': 'C'}]})
+
+    plan = parse_outline(text, max_sections=2)
+
+    assert plan == {'template_data': {'headline': 'H'}, 'meta_data': {},
+                    'outline': [{'heading': 'A'}, {'heading': 'B'}]}
+    assert parse_outline('{"outline": []}') is None
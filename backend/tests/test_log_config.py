@@ -0,0 +1,143 @@
+import io
+import json
+import logging
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify
+
+import log_config
+from log_config import (REDACTED, ForkSafeQueueHandler, JSONFormatter, RequestLogger, configure_logging,
+                        parse_sample_rates, redact, redact_headers, truncate)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def records():
+    handler = Records()
+    logger = logging.getLogger('test-requests')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler.records
+    logger.removeHandler(handler)
+
+
+def make_app(monkeypatch, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    app = Flask(__name__)
+    RequestLogger(app, logger_name='test-requests')
+
+    @app.route('/api/<path:path>', methods=['GET', 'POST'])
+    def echo(path):
+        return jsonify({}), 500 if path == 'fail' else 200
+    return app
+
+
+def test_parse_sample_rates_skips_malformed_items():
+    assert parse_sample_rates('/api/generate=0.1, /api/debug=0,*=0.01,bad,/x=nan?') == {
+        '/api/generate': 0.1, '/api/debug': 0.0, '*': 0.01}
+    assert parse_sample_rates(None) == {}
+
+
+def test_sample_rate_uses_the_longest_prefix(monkeypatch):
+    monkeypatch.setenv('LOG_REQUEST_SAMPLING', '/api=0.5,/api/generate=0.1')
+    monkeypatch.setenv('LOG_REQUEST_SAMPLE_RATE', '0.2')
+    request_logger = RequestLogger(Flask(__name__))
+
+    assert request_logger.sample_rate('/api/generate/batch') == 0.1
+    assert request_logger.sample_rate('/api/jobs') == 0.5
+    assert request_logger.sample_rate('/health') == 0.2
+
+
+def test_unsampled_requests_are_not_logged_but_errors_are(monkeypatch, records):
+    client = make_app(monkeypatch, LOG_REQUEST_SAMPLE_RATE='0').test_client()
+
+    client.get('/api/ok')
+    client.get('/api/fail')
+
+    assert [(record.path, record.status, record.levelno) for record in records] == [
+        ('/api/fail', 500, logging.ERROR)]
+    assert records[0].duration_ms is not None
+    assert not hasattr(records[0], 'body')
+
+
+def test_sampled_payloads_are_redacted_and_truncated(monkeypatch, records):
+    client = make_app(monkeypatch, LOG_REQUEST_SAMPLE_RATE='1', LOG_REQUEST_PAYLOADS='1',
+                      LOG_PAYLOAD_MAX_BYTES='60').test_client()
+
+    client.post('/api/ok', json={'password': 'hunter2', 'topic': 'x' * 100},
+                headers={'Authorization': 'Bearer abc'})
+
+    record, = records
+    assert record.headers['Authorization'] == REDACTED
+    assert 'hunter2' not in record.body
+    assert record.body.endswith('bytes)')
+
+
+def test_redact_nested_values():
+    body = {'user': {'api_key': 'k', 'name': 'n'}, 'cards': [{'card_number': '4242'}]}
+    assert redact(body) == {'user': {'api_key': REDACTED, 'name': 'n'}, 'cards': REDACTED}
+    assert redact([{'token': 't'}]) == [{'token': REDACTED}]
+    assert redact_headers({'Cookie': 'c', 'Accept': '*/*'}) == {'Cookie': REDACTED, 'Accept': '*/*'}
+
+
+def test_truncate():
+    assert truncate('short', 10) == 'short'
+    assert truncate('x' * 20, 5) == 'xxxxx... (20 bytes)'
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({'name': 'app', 'levelname': 'INFO', 'msg': 'hi %s', 'args': ('there',),
+                                    'status': 200})
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry['message'] == 'hi there'
+    assert entry['status'] == 200
+    assert entry['logger'] == 'app'
+
+
+def test_queue_handler_writes_from_a_listener_thread():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    handler = ForkSafeQueueHandler(target)
+    logger = logging.getLogger('test-queue')
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        logger.warning('queued')
+        deadline = time.monotonic() + 5
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        logger.removeHandler(handler)
+    assert stream.getvalue() == 'queued\n'
+    assert handler._listener._thread is not threading.current_thread()
+
+
+def test_configure_logging_replaces_root_handlers(monkeypatch):
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    monkeypatch.setenv('LOG_LEVEL', 'debug')
+    monkeypatch.setenv('LOG_FORMAT', 'text')
+    try:
+        configure_logging()
+
+        handler, = root.handlers
+        assert isinstance(handler, ForkSafeQueueHandler)
+        assert not isinstance(handler.handler.formatter, JSONFormatter)
+        assert root.level == logging.DEBUG
+        assert all(logging.getLogger(name).level == logging.WARNING for name in log_config.NOISY_LOGGERS)
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
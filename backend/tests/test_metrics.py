@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+
+def test_counter_and_gauge_render_per_label_set():
+    registry = Registry()
+    counter = registry.counter('requests_total', 'Requests', ('route',))
+    gauge = registry.gauge('in_flight', 'In flight')
+    counter.inc(route='/a')
+    counter.inc(2, route='/a')
+    counter.inc(route='say "hi"\n')
+    gauge.inc(3)
+    gauge.dec()
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a"} 3',
+        'requests_total{route="say \\"hi\\"\\n"} 1',
+        '# HELP in_flight In flight',
+        '# TYPE in_flight gauge',
+        'in_flight 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        'latency_seconds_sum 5.55',
+        'latency_seconds_count 3',
+    ]
+
+
+def test_collectors_run_on_every_render():
+    registry = Registry()
+    scrapes = []
+
+    def collect():
+        gauge = metrics.Gauge('scrapes', 'Scrapes')
+        scrapes.append(1)
+        gauge.set(len(scrapes))
+        return [gauge]
+    registry.add_collector(collect)
+
+    registry.render()
+    assert registry.render().splitlines()[-1] == 'scrapes 2'
+
+
+def series(metric, stage):
+    return metric._values.get((stage,))
+
+
+def test_stage_times_calls_and_counts_errors():
+    with metrics.stage('test_ok'):
+        assert series(metrics.stage_in_flight, 'test_ok') == 1
+    with pytest.raises(ValueError):
+        with metrics.stage('test_error'):
+            raise ValueError
+
+    assert series(metrics.stage_seconds, 'test_ok')['count'] == 1
+    assert series(metrics.stage_in_flight, 'test_ok') == 0
+    assert series(metrics.stage_errors, 'test_ok') is None
+    assert series(metrics.stage_errors, 'test_error') == 1
+
+
+def test_timed_wraps_a_function():
+    @metrics.timed('test_timed')
+    def double(value):
+        return value * 2
+
+    assert double(2) == 4
+    assert double.__name__ == 'double'
+    assert series(metrics.stage_seconds, 'test_timed')['count'] == 1
+
+
+def test_record_usage_counts_tokens():
+    metrics.record_usage('test-model', SimpleNamespace(prompt_tokens=10, completion_tokens=None))
+    metrics.record_usage('test-model', None)
+
+    assert metrics.llm_tokens._values[('test-model', 'prompt')] == 10
+    assert metrics.llm_tokens._values[('test-model', 'completion')] == 0
+
+
+def test_metrics_endpoint_needs_the_debug_token(app_module, client, monkeypatch):
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert '# TYPE pagecrafter_stage_duration_seconds histogram' in response.get_data(as_text=True)
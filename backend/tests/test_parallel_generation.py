@@ -0,0 +1,73 @@
+import json
+
+from conftest import GENERATE_PAYLOAD
+from token_budget import TokenBudget
+
+OUTLINE = {'template_data': {'headline': 'Big Day'}, 'meta_data': {'meta_description': 'd'},
+           'outline': [{'heading': 'One', 'points': ['a']}, {'heading': 'Two', 'points': ['b']},
+                       {'heading': 'Three', 'points': ['c']}]}
+PAYLOAD = {**GENERATE_PAYLOAD, 'generation_mode': 'parallel'}
+
+
+def respond(failing=()):
+    def respond(request):
+        prompt = request['messages'][1]['content']
+        if 'Return the metadata and the outline only' in prompt:
+            return json.dumps(OUTLINE)
+        for item in OUTLINE['outline']:
+            if f'"{item["heading"]}", covering its points' in prompt:
+                if item['heading'] in failing:
+                    return 'not json'
+                return json.dumps({'section': {'heading': item['heading'], 'content': [f'{item["heading"]}.']}})
+        raise AssertionError('unexpected prompt')
+    return respond
+
+
+def test_sections_are_written_from_the_outline(client, auth_headers, supabase, llm):
+    llm.respond = respond()
+
+    response = client.post('/api/generate', json=PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 200
+    raw_content = response.get_json()['raw_content']
+    assert [section['heading'] for section in raw_content['sections']] == ['One', 'Two', 'Three']
+    assert len(llm.calls) == 4
+
+
+def test_outline_and_sections_have_their_own_budgets(app_module, client, auth_headers, supabase, llm, monkeypatch):
+    monkeypatch.setattr(app_module, 'token_budget', TokenBudget(part_defaults={'outline': 1000, 'section': 500}))
+    llm.respond = respond()
+
+    client.post('/api/generate', json=PAYLOAD, headers=auth_headers)
+
+    assert sorted(call['max_tokens'] for call in llm.calls) == [500, 500, 500, 1000]
+
+
+def test_a_failed_section_is_missing_at_its_outline_index(client, auth_headers, supabase, llm):
+    llm.respond = respond(failing=('Two',))
+
+    result = client.post('/api/generate', json=PAYLOAD, headers=auth_headers).get_json()
+
+    assert result['missing_parts'] == ['article_content[1]']
+    sections = result['raw_content']['sections']
+    assert sections[1] is None and sections[2]['heading'] == 'Three'
+
+    llm.respond = lambda request: json.dumps({'section': {'heading': 'Two', 'content': ['Two.']}})
+    payload = {**GENERATE_PAYLOAD, 'raw_content': result['raw_content'], 'section_index': 1}
+    raw_content = client.post('/api/generate/section', json=payload, headers=auth_headers).get_json()['raw_content']
+
+    assert [section['heading'] for section in raw_content['sections']] == ['One', 'Two', 'Three']
+    article_content = raw_content['article_content']
+    assert article_content.index('Two.') < article_content.index('Three.')
+
+
+def test_without_an_outline_it_generates_in_one_completion(client, auth_headers, supabase, llm):
+    article = {'template_data': {'headline': 'Big Day'}, 'meta_data': {'meta_description': 'd'},
+               'article_content': [{'heading': 'Only', 'content': ['p']}]}
+    llm.respond = lambda request: 'no outline' if 'outline only' in request['messages'][1]['content'] \
+        else json.dumps(article)
+
+    response = client.post('/api/generate', json=PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert len(llm.calls) == 2
@@ -0,0 +1,75 @@
+import re
+
+import pytest
+
+THEME = {'font': 'Inter', 'colors': {'background': '#0b0c1f', 'text': '#ffffff', 'accent': '#ef7a15'}}
+OTHER_THEME = {'font': 'Roboto', 'colors': {'background': '#fafafa', 'text': '#111111', 'accent': '#00aa00'}}
+SCOUT_STATS = {
+    'Current Season Performance': {'Goals': 3},
+    'League Rankings': [],
+    'Shooting Summary': {'Shots': 10, 'Accuracy': 0.5,
+                         'Shot Distribution': {'Inside Box': 6, 'Right Foot': 7, 'Left Foot': 3}},
+}
+THEME_STYLES = re.compile(r'<style id="theme-styles">.*?</style>', re.DOTALL)
+
+
+@pytest.mark.parametrize('template_name', [
+    'ss_article_template.html', 'ss_match_report_template.html', 'ss_player_scout_report_template.html'])
+def test_theme_only_affects_the_theme_styles_block(app_module, template_name):
+    def render(theme):
+        template_vars = app_module.build_preview_vars({'headline': 'Title'}, template_name, theme)
+        template_vars.update(scout_stats=SCOUT_STATS, form_summary={}, recent_matches=[])
+        with app_module.app.app_context():
+            return app_module.template_renderer.render(template_name, preview_mode=False, **template_vars)
+
+    assert THEME_STYLES.sub('', render(THEME)) == THEME_STYLES.sub('', render(OTHER_THEME))
+
+
+def post_diff(client, auth_headers, **payload):
+    payload = {'session_id': 'editor-1', 'template_name': 'ss_article_template.html', **payload}
+    response = client.post('/api/render-template/diff', json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_first_request_is_a_full_render(client, auth_headers):
+    result = post_diff(client, auth_headers, content={'headline': 'Hello'}, theme=THEME)
+    assert result['full'] is True
+    assert 'Hello' in result['preview_html']
+
+
+def test_content_changes_are_patched(client, auth_headers):
+    version = post_diff(client, auth_headers, content={'headline': 'Hello'}, theme=THEME)['version']
+
+    result = post_diff(client, auth_headers, base_version=version, content={'headline': '<b>New</b>'})
+
+    assert result['full'] is False
+    assert result['fragments'] == {'headline': '&lt;b&gt;New&lt;/b&gt;'}
+    assert result['version'] != version
+
+
+def test_requests_without_a_session_are_not_shared(app_module, client, auth_headers):
+    first = post_diff(client, auth_headers, session_id=None, content={'headline': 'Tab one'}, theme=THEME)
+
+    result = post_diff(client, auth_headers, session_id=None, base_version=first['version'],
+                       content={'author': 'Tab two'}, theme=THEME)
+
+    assert result['full'] is True
+    assert 'Tab one' not in result['preview_html']
+    assert app_module.preview_sessions.get(('user-1', None)) is None
+
+
+def test_theme_changes_send_the_theme_styles(client, auth_headers):
+    version = post_diff(client, auth_headers, content={'headline': 'Hello'}, theme=THEME)['version']
+
+    result = post_diff(client, auth_headers, base_version=version, theme={'colors': {'background': '#123456'}})
+
+    assert result['full'] is False
+    assert '#123456' in result['theme_styles']
+    assert result['css_variables'] == {'--theme-background': '#123456'}
+
+
+def test_stale_versions_fall_back_to_a_full_render(client, auth_headers):
+    post_diff(client, auth_headers, content={'headline': 'Hello'}, theme=THEME)
+    result = post_diff(client, auth_headers, base_version='stale', content={'headline': 'Again'})
+    assert result['full'] is True
@@ -0,0 +1,87 @@
+import pytest
+
+import prompts
+
+ARTICLE_INPUT = {'template_name': 'ss_article_template.html', 'article_type': 'general',
+                 'topic': 'Derby day', 'keywords': 'derby', 'context': 'A tight derby.'}
+MATCH_INPUT = {'template_name': 'ss_match_report_template.html', 'topic': 'Derby', 'home_team': 'Reds',
+               'away_team': 'Blues', 'home_score': 2, 'away_score': 1, 'competition': 'League',
+               'venue': 'Park', 'match_date': '2024-05-01'}
+SCOUT_INPUT = {'template_name': 'ss_player_scout_report_template.html', 'topic': 'Scouting Smith',
+               'player_name': 'Smith', 'scout_stats': {'Goals': 3}}
+
+
+@pytest.mark.parametrize('user_input, kind, detail', [
+    (ARTICLE_INPUT, 'article', 'Derby day'), (MATCH_INPUT, 'match_report', 'Reds vs Blues'),
+    (SCOUT_INPUT, 'scout_report', 'Smith')])
+def test_user_prompt_is_the_static_prefix_then_the_request(user_input, kind, detail):
+    prompt = prompts.build_user_prompt(user_input)
+    prefix = prompts.USER_PROMPT_PREFIXES[(kind, 'general')]
+
+    assert prompt.startswith(prefix + '\n')
+    assert detail not in prefix
+    assert detail in prompt[len(prefix):]
+
+
+def test_requests_for_the_same_template_share_the_prefix():
+    first = prompts.build_user_prompt(ARTICLE_INPUT)
+    second = prompts.build_user_prompt({**ARTICLE_INPUT, 'topic': 'Cup final', 'context': 'Extra time.'})
+    prefix = prompts.USER_PROMPT_PREFIXES[('article', 'general')]
+
+    assert first[:len(prefix)] == second[:len(prefix)]
+
+
+def test_unknown_article_types_use_the_general_prefix():
+    prompt = prompts.build_user_prompt({**ARTICLE_INPUT, 'article_type': 'unknown'})
+    assert prompt.startswith(prompts.USER_PROMPT_PREFIXES[('article', 'general')])
+
+
+def test_prefixes_leave_out_instructions_the_system_prompt_gives():
+    for (kind, _), prefix in prompts.USER_PROMPT_PREFIXES.items():
+        system_lines = {line.strip() for line in prompts.SYSTEM_PROMPTS[kind].splitlines() if len(line.strip()) > 30}
+        assert not system_lines & {line.strip() for line in prefix.splitlines()}
+
+
+def test_system_prompts_are_built_once_per_kind():
+    assert prompts.system_prompt('ss_match_report_template.html') is prompts.system_prompt('match_report_template.html')
+    assert prompts.system_prompt('anything.html') is prompts.SYSTEM_PROMPTS['article']
+
+
+def test_section_prompt_puts_the_request_after_the_static_prefix():
+    sections = [{'heading': 'One', 'content': ['First.']}, {'heading': 'Two', 'content': ['Second.']},
+                {'heading': 'Three', 'content': ['Third.']}]
+
+    prompt = prompts.build_section_prompt(ARTICLE_INPUT, sections, 1, 'Shorter please')
+
+    assert prompt.startswith(prompts.SECTION_PREFIXES[('article', 'general')])
+    assert '2. Two  <-- this section' in prompt
+    assert '### Previous Section\n\n## One\nFirst.' in prompt
+    assert '### Next Section\n\n## Three\nThird.' in prompt
+    assert prompt.endswith('Write a new version of section 2 of 3.\nEditor\'s instructions for this section: '
+                           'Shorter please')
+
+
+def test_section_prompt_for_a_new_section():
+    prompt = prompts.build_section_prompt(ARTICLE_INPUT, [{'heading': 'One', 'content': []}], 1)
+
+    assert '2. (new section)  <-- this section' in prompt
+    assert '### Current Version' not in prompt
+    assert prompt.endswith('Write section 2, a new section that follows the ones above.')
+
+
+def test_section_text_is_cut_on_a_word():
+    section = {'heading': 'H', 'content': ['word ' * 10, {'type': 'bullet_list', 'points': ['a', 'b']}]}
+
+    assert prompts.section_text(section).endswith('- a\n- b')
+    assert prompts.section_text(section, limit=12) == '## H\nword ...'
+
+
+def test_outlined_section_prompt_marks_its_section():
+    outline = [{'heading': 'Intro', 'points': ['set up']}, {'heading': 'Body', 'points': ['detail']}]
+
+    prompt = prompts.build_outlined_section_prompt(ARTICLE_INPUT, outline, 1)
+
+    assert prompt.startswith(prompts.OUTLINED_SECTION_PREFIXES[('article', 'general')])
+    assert '2. Body  <-- this section\n   - detail' in prompt
+    assert prompt.endswith('Write section 2 of 2, "Body", covering its points.')
+    assert not prompts.supports_outline('ss_match_report_template.html')
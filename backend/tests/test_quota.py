@@ -0,0 +1,193 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import GENERATE_PAYLOAD, FakeSupabase
+from llm_cache import MemoryCache
+from quota import QuotaExceeded, QuotaManager
+
+
+def test_reserve_takes_articles_and_refund_gives_them_back():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase)
+
+    reservation = quota.reserve('user-1', 2)
+    assert supabase.subscription()['articles_remaining'] == 1
+    assert supabase.subscription()['articles_generated'] == 2
+
+    quota.refund(reservation)
+    quota.refund(reservation)
+    assert supabase.subscription()['articles_remaining'] == 3
+    assert supabase.subscription()['articles_generated'] == 0
+
+
+def test_committed_reservations_are_not_refunded():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase)
+
+    reservation = quota.reserve('user-1')
+    quota.commit(reservation)
+    quota.refund(reservation)
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_partial_refund():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase)
+
+    quota.refund(quota.reserve('user-1', 3), 1)
+    assert supabase.subscription()['articles_remaining'] == 1
+
+
+def test_reserve_fails_without_enough_articles():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase)
+
+    with pytest.raises(QuotaExceeded):
+        quota.reserve('user-1', 4)
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+def test_pro_plans_are_not_limited():
+    supabase = FakeSupabase()
+    supabase.subscription().update(plan_type='pro', articles_remaining=0)
+    QuotaManager(supabase).reserve('user-1')
+    assert supabase.subscription()['articles_remaining'] == -1
+
+
+def test_users_without_a_subscription_get_the_free_tier_untracked():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase)
+
+    reservation = quota.reserve('new-user')
+    assert not reservation.tracked
+    quota.refund(reservation)
+    with pytest.raises(QuotaExceeded):
+        quota.reserve('new-user', 4)
+
+
+def test_reserve_retries_when_the_row_changed_concurrently():
+    supabase = FakeSupabase()
+    table = supabase.table
+
+    def racing_table(name):
+        query = table(name)
+        execute = query.execute
+
+        def execute_after_another_reservation():
+            if query.operation == 'update' and not racing_table.raced:
+                racing_table.raced = True
+                supabase.subscription()['articles_remaining'] -= 1
+            return execute()
+        query.execute = execute_after_another_reservation
+        return query
+    racing_table.raced = False
+    supabase.table = racing_table
+
+    QuotaManager(supabase).reserve('user-1')
+    assert supabase.subscription()['articles_remaining'] == 1
+
+
+def test_reserve_and_release_with_rpcs():
+    calls = []
+    rows = {'user-1': {'user_id': 'user-1', 'status': 'active', 'articles_remaining': 1}}
+
+    class RPCSupabase(FakeSupabase):
+        def rpc(self, name, params):
+            calls.append((name, params))
+            row = rows[params['p_user_id']]
+            if name == 'reserve_articles' and row['articles_remaining'] < params['p_count']:
+                return SimpleNamespace(execute=lambda: SimpleNamespace(data=[]))
+            row['articles_remaining'] += -params['p_count'] if name == 'reserve_articles' else params['p_count']
+            return SimpleNamespace(execute=lambda: SimpleNamespace(data=[dict(row)]))
+
+    quota = QuotaManager(RPCSupabase(), reserve_rpc='reserve_articles', release_rpc='release_articles')
+    reservation = quota.reserve('user-1')
+    with pytest.raises(QuotaExceeded):
+        quota.reserve('user-1')
+    quota.refund(reservation)
+
+    assert rows['user-1']['articles_remaining'] == 1
+    assert [name for name, _ in calls] == ['reserve_articles', 'reserve_articles', 'release_articles']
+
+
+def test_async_reserve_and_refund():
+    supabase = FakeSupabase()
+    quota = QuotaManager(supabase, async_client=supabase.get_async_client)
+
+    reservation = asyncio.run(quota.reserve_async('user-1', 2))
+    assert supabase.subscription()['articles_remaining'] == 1
+    with pytest.raises(QuotaExceeded):
+        asyncio.run(quota.reserve_async('user-1', 2))
+
+    asyncio.run(quota.refund_async(reservation))
+    asyncio.run(quota.refund_async(reservation))
+    assert supabase.subscription()['articles_remaining'] == 3
+    assert supabase.sync_log == []
+
+
+def test_generate_refunds_failed_generations(client, auth_headers, supabase, llm):
+    llm.respond = lambda request: 'not json'
+
+    response = client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 500
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+def test_generate_is_refused_without_articles(client, auth_headers, supabase):
+    supabase.subscription()['articles_remaining'] = 0
+
+    response = client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    assert response.status_code == 403
+
+
+class CountingSupabase(FakeSupabase):
+    def __init__(self):
+        super().__init__()
+        self.selects = 0
+
+    def table(self, name):
+        query = super().table(name)
+        execute = query.execute
+
+        def counted():
+            if query.operation == 'select':
+                self.selects += 1
+            return execute()
+        query.execute = counted
+        return query
+
+
+def test_subscription_rows_are_served_from_the_cache():
+    supabase = CountingSupabase()
+    quota = QuotaManager(supabase, cache=MemoryCache(max_entries=10, ttl=60))
+
+    quota.get_subscription('user-1')
+    quota.reserve('user-1')
+    assert quota.get_subscription('user-1')['articles_remaining'] == 2
+    assert supabase.selects == 1
+
+
+def test_a_stale_cached_row_does_not_hide_an_upgrade():
+    supabase = CountingSupabase()
+    quota = QuotaManager(supabase, cache=MemoryCache(max_entries=10, ttl=60))
+    quota.get_subscription('user-1')
+    supabase.subscription().update(plan_type='pro', articles_remaining=50)
+
+    quota.reserve('user-1', 10)
+    assert supabase.subscription()['articles_remaining'] == 40
+
+
+def test_the_stripe_webhook_replaces_the_cached_row(app_module, client, supabase, monkeypatch):
+    app_module.quota.get_subscription('user-1')
+    event = {'type': 'checkout.session.completed', 'data': {'object': {
+        'metadata': {'user_id': 'user-1'}, 'subscription': 'sub_1', 'customer': 'cus_1'}}}
+    monkeypatch.setattr(app_module.stripe.Webhook, 'construct_event', lambda *args: event)
+
+    response = client.post('/api/webhook', data=b'{}', headers={'STRIPE_SIGNATURE': 'signature'})
+
+    assert response.status_code == 200
+    assert app_module.quota.get_subscription('user-1')['plan_type'] == 'pro'
@@ -0,0 +1,74 @@
+import os
+
+from flask import Flask
+
+from rendering import TemplateRenderer
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+
+def make_renderer(tmp_path, template_names=('download_template.html',)):
+    app = Flask(__name__, template_folder=TEMPLATES_DIR)
+    renderer = TemplateRenderer(app, template_names, cache_dir=str(tmp_path / 'jinja'))
+    return app, renderer
+
+
+def test_precompile_writes_the_bytecode_cache(tmp_path):
+    app, renderer = make_renderer(tmp_path)
+    renderer.precompile()
+    assert os.listdir(tmp_path / 'jinja')
+
+
+def test_precompile_survives_a_broken_template(tmp_path):
+    app, renderer = make_renderer(tmp_path, ('missing_template.html', 'download_template.html'))
+    renderer.precompile()
+    with app.app_context():
+        assert 'Hello' in renderer.render('download_template.html', headline='Hello', theme={})
+
+
+def test_render_records_per_template_timings(tmp_path):
+    app, renderer = make_renderer(tmp_path)
+    with app.app_context():
+        renderer.render('download_template.html', headline='Hello', article_content='<p>Body</p>', theme={})
+        renderer.render('download_template.html', headline='Again', article_content='', theme={})
+
+    stats = renderer.stats()['templates']['download_template.html']
+    assert stats['count'] == 2
+    assert stats['avg_ms'] == stats['total_ms'] / 2
+
+
+def test_render_stats_endpoint_needs_the_debug_token(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    assert client.get('/api/debug/render-stats').status_code == 401
+    response = client.get('/api/debug/render-stats', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'templates' in response.get_json()
+
+
+def test_fragment_is_rendered_once_per_key(tmp_path):
+    app, renderer = make_renderer(tmp_path)
+    template = app.jinja_env.from_string(
+        "{% cache_fragment 'styles', theme %}{{ theme.color }}-{{ counter() }}{% endcache_fragment %}")
+    calls = []
+
+    def counter():
+        calls.append(1)
+        return len(calls)
+
+    assert template.render(theme={'color': 'red'}, counter=counter) == 'red-1'
+    assert template.render(theme={'color': 'red'}, counter=counter) == 'red-1'
+    assert template.render(theme={'color': 'blue'}, counter=counter) == 'blue-2'
+    assert renderer.fragment_cache.stats()['entries'] == 2
+
+
+def test_theme_styles_are_cached_per_theme(tmp_path):
+    app, renderer = make_renderer(tmp_path, ('ss_article_template.html',))
+    theme = {'font': 'Inter', 'colors': {'background': '#101010', 'accent': '#ff0000'}}
+    with app.app_context():
+        first = renderer.render('ss_article_template.html', headline='One', theme=theme)
+        second = renderer.render('ss_article_template.html', headline='Two', theme=dict(theme))
+        renderer.render('ss_article_template.html', headline='Three', theme={**theme, 'font': 'Roboto'})
+
+    assert '#101010' in first and '#101010' in second
+    stats = renderer.fragment_cache.stats()
+    assert (stats['entries'], stats['hits']) == (2, 1)
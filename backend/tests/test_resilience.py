@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from async_runtime import BackgroundLoop
+from resilience import (CircuitBreaker, CircuitOpen, ConcurrencyLimiter, RetryPolicy, UpstreamUnavailable,
+                        is_retryable, retry_after_seconds)
+
+
+def status_error(status, headers=None):
+    request = httpx.Request('POST', 'http://llm.test/v1/chat/completions')
+    response = httpx.Response(status, headers=headers, request=request)
+    return openai.APIStatusError('error', response=response, body=None)
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (status_error(429), True), (status_error(503), True), (status_error(400), False),
+    (httpx.ConnectError('refused'), True), (ValueError('bad'), False)])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(status_error(429, {'retry-after': '3'})) == 3
+    assert retry_after_seconds(status_error(429, {'retry-after-ms': '250'})) == 0.25
+    assert retry_after_seconds(status_error(429, {'retry-after': 'soon'})) is None
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=10)
+
+    assert 0 <= policy.delay(1, status_error(500)) <= 1
+    assert policy.delay(1, status_error(400)) is None
+    assert policy.delay(3, status_error(500)) is None
+    assert policy.delay(1, status_error(429, {'retry-after': '5'})) == 5
+    assert policy.delay(1, status_error(429, {'retry-after': '60'})) is None
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.allow()
+    assert 0 < raised.value.retry_after <= 0.05
+
+    time.sleep(0.06)
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.stats() == {'state': 'closed', 'failures': 0}
+
+
+def test_failed_trial_reopens_and_released_trial_allows_another():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+
+    breaker.allow()
+    breaker.release_trial()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+@pytest.fixture
+def runtime():
+    runtime = BackgroundLoop(name='test-limiter')
+    yield runtime
+    runtime.loop.call_soon_threadsafe(runtime.loop.stop)
+
+
+def test_limiter_times_out_threads(runtime):
+    limiter = ConcurrencyLimiter(1, timeout=0.05, runtime=runtime)
+    with limiter:
+        with pytest.raises(UpstreamUnavailable):
+            limiter.acquire()
+        assert limiter.stats() == {'limit': 1, 'active': 1}
+    limiter.acquire()
+
+
+def test_limiter_hands_slots_to_waiting_threads(runtime):
+    limiter = ConcurrencyLimiter(1, timeout=5, runtime=runtime)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def wait():
+        with limiter:
+            acquired.set()
+    thread = threading.Thread(target=wait)
+    thread.start()
+    assert not acquired.wait(0.05)
+
+    limiter.release()
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_waiting_coroutines_hold_no_threads(runtime):
+    limiter = ConcurrencyLimiter(1, timeout=5, runtime=runtime)
+
+    async def scenario():
+        await limiter.acquire_async()
+        threads = threading.active_count()
+        waiters = [asyncio.ensure_future(limiter.acquire_async()) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        assert threading.active_count() == threads
+        assert not any(waiter.done() for waiter in waiters)
+
+        for _ in waiters:
+            limiter.release()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*waiters)
+        limiter.release()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert limiter.active == 0
+
+
+def test_cancelled_waiters_give_their_slot_back(runtime):
+    limiter = ConcurrencyLimiter(1, timeout=5, runtime=runtime)
+
+    async def scenario():
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.02)
+        waiter.cancel()
+        limiter.release()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert limiter.active == 0
+    limiter.acquire()
+
+
+def test_limiter_works_on_its_own_loop(runtime):
+    limiter = ConcurrencyLimiter(2, timeout=5, runtime=runtime)
+
+    async def hold():
+        async with limiter:
+            return limiter.stats()['active']
+
+    assert runtime.run(hold()) == 1
+    time.sleep(0.01)
+    assert limiter.active == 0
+
+
+def test_a_full_limiter_does_not_leave_the_trial_running(app_module, client, monkeypatch):
+    backend = app_module.llm_router.primary()
+    backend.breaker = CircuitBreaker('openai', failure_threshold=1, reset_timeout=0)
+    backend.breaker.record_failure()
+    monkeypatch.setattr(app_module.llm_router, 'limiter', ConcurrencyLimiter(1, timeout=0.01))
+
+    with app_module.llm_router.limiter:
+        with pytest.raises(UpstreamUnavailable):
+            list(app_module.stream_gpt4('prompt', 'ss_article_template.html'))
+
+    assert backend.breaker.state == 'half_open'
+    backend.breaker.allow()
@@ -0,0 +1,100 @@
+import json
+
+import prompts
+from conftest import GENERATE_PAYLOAD
+from formatting import format_content, splice_section
+from token_budget import TokenBudget
+
+TEMPLATE = 'ss_article_template.html'
+A = {'heading': 'A', 'content': ['First.']}
+B = {'heading': 'B', 'content': ['Second.']}
+C = {'heading': 'C', 'content': ['Third.']}
+NEW = {'heading': 'New', 'content': ['Fresh.']}
+
+
+def article_content(*sections):
+    return format_content({'article_content': list(sections)}, TEMPLATE)['article_content']
+
+
+def test_splice_replaces_a_section():
+    assert splice_section(article_content(A, B, C), TEMPLATE, [A, B, C], 1, NEW) == article_content(A, NEW, C)
+
+
+def test_splice_appends_a_new_section():
+    assert splice_section(article_content(A, B), TEMPLATE, [A, B], 2, NEW) == article_content(A, B, NEW)
+
+
+def test_splice_fills_a_missing_section_in_place():
+    assert splice_section(article_content(A, C), TEMPLATE, [A, None, C], 1, B) == article_content(A, B, C)
+    assert splice_section(article_content(B, C), TEMPLATE, [None, B, C], 0, A) == article_content(A, B, C)
+    assert splice_section(article_content(A), TEMPLATE, [A, None, None], 2, C) == article_content(A, C)
+
+
+def test_splice_refuses_edited_content():
+    assert splice_section('<p>Rewritten by hand</p>', TEMPLATE, [A, B], 1, NEW) is None
+    assert splice_section('<p>Rewritten by hand</p>', TEMPLATE, [A, None], 1, NEW) is None
+
+
+def test_section_prompt_for_a_missing_section():
+    prompt = prompts.build_section_prompt({'template_name': TEMPLATE, 'topic': 'T'}, [A, None, C], 1)
+
+    assert '1. A\n2. (missing section)  <-- this section\n3. C' in prompt
+    assert '### Previous Section' in prompt and '### Next Section' in prompt
+    assert '### Current Version' not in prompt
+    assert prompt.endswith('Write section 2 of 3, which is missing.')
+
+    prompt = prompts.build_section_prompt({'template_name': TEMPLATE, 'topic': 'T'}, [A, None, C], 2)
+    assert '### Previous Section' not in prompt
+
+
+def generation_with_a_malformed_section(client, auth_headers, llm):
+    article = {'template_data': {'headline': 'Big Day'}, 'meta_data': {'meta_description': 'd'},
+               'article_content': [A, {'heading': 'B'}, C]}
+    llm.respond = lambda request: json.dumps(article)
+    response = client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def regenerate(client, auth_headers, llm, result, index, section):
+    llm.respond = lambda request: json.dumps({'section': section})
+    payload = {**GENERATE_PAYLOAD, 'raw_content': result['raw_content'], 'section_index': index}
+    return client.post('/api/generate/section', json=payload, headers=auth_headers)
+
+
+def test_missing_sections_are_regenerated_where_they_belong(client, auth_headers, supabase, llm):
+    result = generation_with_a_malformed_section(client, auth_headers, llm)
+    assert result['missing_parts'] == ['article_content[1]']
+    assert result['raw_content']['sections'] == [A, None, C]
+
+    response = regenerate(client, auth_headers, llm, result, 1, B)
+
+    assert response.status_code == 200
+    raw_content = response.get_json()['raw_content']
+    assert raw_content['sections'] == [A, B, C]
+    assert raw_content['article_content'] == article_content(A, B, C)
+    assert '2. (missing section)  <-- this section' in llm.calls[-1]['messages'][1]['content']
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_regenerating_after_a_missing_section_replaces_the_right_one(client, auth_headers, supabase, llm):
+    result = generation_with_a_malformed_section(client, auth_headers, llm)
+
+    raw_content = regenerate(client, auth_headers, llm, result, 2, NEW).get_json()['raw_content']
+
+    assert raw_content['sections'] == [A, None, NEW]
+    assert raw_content['article_content'] == article_content(A, NEW)
+
+
+def test_section_index_is_bounded(client, auth_headers, supabase, llm):
+    result = generation_with_a_malformed_section(client, auth_headers, llm)
+    assert regenerate(client, auth_headers, llm, result, 4, NEW).status_code == 400
+
+
+def test_sections_are_sized_by_the_section_budget(app_module, client, auth_headers, supabase, llm, monkeypatch):
+    result = generation_with_a_malformed_section(client, auth_headers, llm)
+    monkeypatch.setattr(app_module, 'token_budget', TokenBudget(part_defaults={'section': 1234}))
+
+    regenerate(client, auth_headers, llm, result, 1, B)
+
+    assert llm.calls[-1]['max_tokens'] == 1234
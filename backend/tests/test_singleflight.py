@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from conftest import GENERATE_PAYLOAD
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert calls == [1]
+    assert sorted(results) == [('result', False), ('result', True)]
+
+
+def test_results_are_shared_within_the_window_only():
+    flight = SingleFlight(window=0.05)
+    assert flight.do('key', lambda: 1) == (1, False)
+    assert flight.do('key', lambda: 2) == (1, True)
+    time.sleep(0.1)
+    assert flight.do('key', lambda: 3) == (3, False)
+
+
+def test_errors_and_empty_results_are_not_kept():
+    flight = SingleFlight(window=30)
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: None) == (None, False)
+    assert flight.do('key', lambda: 'ok') == ('ok', False)
+
+
+def test_identical_generations_are_coalesced_and_charged_once(client, auth_headers, llm, supabase):
+    first = client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+    second = client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    assert first.status_code == second.status_code == 200
+    assert len(llm.calls) == 1
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_regenerate_is_not_served_from_an_earlier_generation(client, auth_headers, llm, supabase):
+    client.post('/api/generate', json=GENERATE_PAYLOAD, headers=auth_headers)
+    response = client.post('/api/generate', json={**GENERATE_PAYLOAD, 'skip_cache': True}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert len(llm.calls) == 2
+    assert supabase.subscription()['articles_remaining'] == 1
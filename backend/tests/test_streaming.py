@@ -0,0 +1,76 @@
+import json
+
+from conftest import ARTICLE, GENERATE_PAYLOAD, sse_events
+from utils import JSONArrayStreamParser
+
+
+def test_parser_positions_count_every_item():
+    parser = JSONArrayStreamParser('items')
+    chunks = ['{"items": [{"a": 1}, "x,', ' y]", 12', ', nul', 'l, [1, 2], {bad}, {"b": "}"}', ']}']
+
+    items = [item for chunk in chunks for item in parser.feed_indexed(chunk)]
+
+    assert items == [(0, {'a': 1}), (1, 'x, y]'), (2, 12), (3, None), (4, [1, 2]), (5, None), (6, {'b': '}'})]
+    assert parser.done and parser.count == 7
+
+
+def test_stream_sends_each_section_then_done(client, auth_headers, supabase):
+    response = client.post('/api/generate/stream', json=GENERATE_PAYLOAD, headers=auth_headers)
+
+    events = sse_events(response)
+    assert [event for event, _ in events] == ['start', 'section', 'section', 'done']
+    assert '<h2>Intro</h2>' in events[1][1]['html']
+    assert events[-1][1]['raw_content']['headline'] == 'Big Day'
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_stream_skips_malformed_sections(client, auth_headers, supabase, llm):
+    article = {**ARTICLE, 'article_content': [
+        {'type': 'section', 'heading': 'Intro', 'content': ['p1']},
+        {'type': 'section', 'heading': 'No content'},
+        {'type': 'section', 'heading': 'Outro', 'content': ['p3']},
+    ]}
+    llm.respond = lambda request: json.dumps(article)
+
+    events = sse_events(client.post('/api/generate/stream', json=GENERATE_PAYLOAD, headers=auth_headers))
+
+    assert [event for event, _ in events] == ['start', 'section', 'section', 'done']
+    assert [data['index'] for event, data in events if event == 'section'] == [0, 2]
+    assert events[-1][1]['missing_parts'] == ['article_content[1]']
+    assert supabase.subscription()['articles_remaining'] == 2
+
+
+def test_stream_indices_count_skipped_and_scalar_items(client, auth_headers, llm):
+    article = {**ARTICLE, 'article_content': [
+        {'type': 'section', 'heading': 'Big Day', 'content': ['Repeats the headline']},
+        'junk',
+        {'type': 'section', 'heading': 'Body', 'content': ['p']},
+    ]}
+    llm.respond = lambda request: json.dumps(article)
+
+    events = sse_events(client.post('/api/generate/stream', json=GENERATE_PAYLOAD, headers=auth_headers))
+
+    assert [data['index'] for event, data in events if event == 'section'] == [2]
+    assert events[-1][1]['missing_parts'] == ['article_content[1]']
+
+
+def test_stream_rejects_missing_template_fields(client, auth_headers, supabase, llm):
+    payload = {**GENERATE_PAYLOAD, 'template_name': 'ss_match_report_template.html'}
+
+    response = client.post('/api/generate/stream', json=payload, headers=auth_headers)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Missing required field')
+    assert llm.calls == []
+    assert supabase.subscription()['articles_remaining'] == 3
+
+
+def test_stream_refunds_quota_when_generation_fails(client, auth_headers, supabase, llm):
+    def fail(request):
+        raise ValueError('bad request')
+    llm.respond = fail
+
+    events = sse_events(client.post('/api/generate/stream', json=GENERATE_PAYLOAD, headers=auth_headers))
+
+    assert events[-1][0] == 'error'
+    assert supabase.subscription()['articles_remaining'] == 3
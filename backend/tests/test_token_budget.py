@@ -0,0 +1,90 @@
+import pytest
+
+import token_budget
+from token_budget import TokenBudget, count_message_tokens, count_tokens, dedupe_instructions
+
+
+def test_default_budget_until_enough_samples():
+    budget = TokenBudget(default=8000, min_samples=3)
+    budget.record('t', 1000)
+    budget.record('t', 1000)
+
+    assert budget.max_tokens('t') == 8000
+    budget.record('t', 1000)
+    assert budget.max_tokens('t') == 2000
+
+
+def test_budget_is_the_percentile_with_headroom_within_limits():
+    budget = TokenBudget(floor=500, percentile=0.9, headroom=1.5, min_samples=10)
+    for tokens in range(100, 1100, 100):
+        budget.record('t', tokens)
+
+    assert budget.max_tokens('t') == 1500
+    assert budget.max_tokens('t', prompt_tokens=127900) == 100
+    for _ in range(10):
+        budget.record('big', 20000)
+    assert budget.max_tokens('big') == token_budget.MODEL_LIMITS['gpt-4o']['output']
+    for _ in range(10):
+        budget.record('small', 10)
+    assert budget.max_tokens('small') == 500
+
+
+def test_truncated_completions_raise_the_budget():
+    budget = TokenBudget(min_samples=1, floor=1, headroom=1.0)
+    budget.record('t', 1000, max_tokens=1000, truncated=True)
+    budget.record('t', 0)
+
+    assert budget.max_tokens('t') == 1500
+    assert budget.stats() == {'t': {'samples': 1, 'observed_p': 1500.0, 'max_tokens': 1500}}
+
+
+def test_only_the_recent_window_counts():
+    budget = TokenBudget(min_samples=1, floor=1, headroom=1.0, window=2)
+    for tokens in (5000, 100, 100):
+        budget.record('t', tokens)
+    assert budget.max_tokens('t') == 100
+
+
+def test_parts_start_from_their_own_default():
+    budget = TokenBudget(default=16000, floor=2000, min_samples=2, headroom=1.0,
+                         part_defaults={'section': 1500})
+    assert budget.max_tokens('t#section') == 1500
+    assert budget.max_tokens('t#other') == 16000
+
+    budget.record('t#section', 600)
+    budget.record('t#section', 600)
+    assert budget.max_tokens('t#section') == 600
+    assert budget.max_tokens('t') == 16000
+
+
+@pytest.fixture
+def without_tiktoken(monkeypatch):
+    monkeypatch.setattr(token_budget, 'tiktoken', None)
+
+
+def test_token_estimate_without_tiktoken(without_tiktoken):
+    assert count_tokens('x' * 9) == 3
+    assert count_tokens('ab\ncd') == 3
+    assert count_message_tokens([{'content': 'x' * 8}, {'content': ''}]) == 2 + 4 + 4 + 3
+
+
+def test_repeated_instructions_are_dropped():
+    system = 'Always answer with valid JSON only, no prose.'
+    prompt = '\n'.join([
+        'Write an article.',
+        'Always answer with VALID JSON only - no prose!',
+        'Use British spelling throughout the article.',
+        'Write an article.',
+        'use british spelling throughout the article',
+    ])
+
+    assert dedupe_instructions(prompt, system) == 'Write an article.\nUse British spelling throughout the article.\n' \
+                                                  'Write an article.'
+
+
+def test_debug_token_budget_needs_the_debug_token(app_module, client, monkeypatch):
+    assert client.get('/api/debug/token-budget').status_code == 404
+
+    monkeypatch.setattr(app_module, 'DEBUG_API_TOKEN', 'secret')
+    assert client.get('/api/debug/token-budget', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/api/debug/token-budget', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,119 @@
+import json
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+
+from conftest import JWT_SECRET, make_token
+from token_verifier import TokenVerifier
+
+
+class RemoteUsers:
+    def __init__(self, user=None):
+        self.user = user
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        return SimpleNamespace(user=self.user)
+
+
+class FakeJWKSClient:
+    def __init__(self, jwk):
+        self.jwk = jwk
+
+    def get_signing_key_from_jwt(self, token):
+        return self.jwk
+
+
+@pytest.fixture(scope='module')
+def rsa_key():
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def jwks_verifier(rsa_key, alg='RS256'):
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(rsa_key.public_key()))
+    verifier._jwks_client = FakeJWKSClient(jwt.PyJWK({**jwk, 'alg': alg}))
+    return verifier
+
+
+def claims(**extra):
+    return {'sub': 'user-1', 'aud': 'authenticated', 'exp': int(time.time()) + 600, **extra}
+
+
+def test_verifies_hs256_tokens_locally_and_caches_the_user():
+    remote = RemoteUsers()
+    verifier = TokenVerifier(remote, jwt_secret=JWT_SECRET)
+    token = make_token()
+
+    assert verifier.verify(token).id == 'user-1'
+    assert verifier.verify(token).email == 'user-1@example.com'
+    assert remote.calls == 0
+
+
+def test_rejects_hs256_tokens_signed_with_another_secret():
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    assert verifier.lookup(make_token(secret='another-secret-' + 'y' * 32)) is None
+
+
+def test_verifies_rs256_tokens_against_the_jwks_key(rsa_key):
+    verifier = jwks_verifier(rsa_key)
+    token = jwt.encode(claims(), rsa_key, algorithm='RS256')
+    assert verifier.lookup(token).id == 'user-1'
+
+
+def test_algorithm_is_pinned_to_the_key_not_the_token_header(rsa_key):
+    verifier = jwks_verifier(rsa_key)
+    # Same key, but the header asks for a different algorithm than the JWK's
+    token = jwt.encode(claims(), rsa_key, algorithm='PS256')
+    assert verifier.lookup(token) is None
+
+
+def test_hs256_tokens_are_only_checked_against_the_secret():
+    # e.g. HMAC signed with the (public) JWKS key: the key confusion attack
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    verifier._jwks_client = FakeJWKSClient(jwt.PyJWK({'kty': 'oct', 'k': 'cHVibGljLWtleQ', 'alg': 'HS256'}))
+    assert verifier.lookup(make_token(secret='public-key')) is None
+
+
+def test_rejects_unsigned_tokens():
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    verifier._jwks_client = FakeJWKSClient(jwt.PyJWK({'kty': 'oct', 'k': 'cHVibGljLWtleQ', 'alg': 'HS256'}))
+    assert verifier.lookup(jwt.encode(claims(), None, algorithm='none')) is None
+
+
+def test_rejects_jwks_keys_outside_the_allowlist():
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    verifier._jwks_client = FakeJWKSClient(jwt.PyJWK({'kty': 'oct', 'k': 'cHVibGljLWtleQ', 'alg': 'HS512'}))
+    assert verifier.lookup(jwt.encode(claims(), 'public-key', algorithm='HS512')) is None
+
+
+def test_rejects_jwks_keys_with_unexpected_algorithms(rsa_key):
+    verifier = jwks_verifier(rsa_key, alg='RS512')
+    token = jwt.encode(claims(), rsa_key, algorithm='RS512')
+    assert verifier.lookup(token) is None
+
+
+def test_falls_back_to_supabase_and_caches_the_user():
+    user = SimpleNamespace(id='user-2')
+    remote = RemoteUsers(user)
+    verifier = TokenVerifier(remote)
+    token = make_token('user-2')
+
+    assert verifier.verify(token) is user
+    assert verifier.verify(token) is user
+    assert remote.calls == 1
+
+
+def test_invalid_tokens_raise():
+    verifier = TokenVerifier(RemoteUsers(None), jwt_secret=JWT_SECRET)
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(secret='another-secret-' + 'y' * 32))
+
+
+def test_expired_tokens_are_not_verified_locally():
+    verifier = TokenVerifier(RemoteUsers(), jwt_secret=JWT_SECRET)
+    assert verifier.lookup(make_token(expires_in=-10)) is None
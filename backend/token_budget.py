@@ -0,0 +1,149 @@
+import logging
+import math
+import re
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # Optional, token counts are estimated without it
+    tiktoken = None
+
+# Context window and output cap per model
+MODEL_LIMITS = {
+    'gpt-4o': {'context': 128000, 'output': 16384},
+    'gpt-4o-mini': {'context': 128000, 'output': 16384},
+}
+DEFAULT_LIMITS = {'context': 128000, 'output': 16000}
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                logger.warning(f"No tokenizer for {model}, estimating token counts: {str(e)}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model='gpt-4o'):
+    """Token count of `text`, exact with tiktoken installed, otherwise a close estimate"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Roughly 4 characters per token for English text, plus one per line break
+    return math.ceil(len(text) / 4) + text.count('\n')
+
+
+def count_message_tokens(messages, model='gpt-4o'):
+    # Each chat message carries a few tokens of framing
+    return sum(count_tokens(message['content'], model) + 4 for message in messages) + 3
+
+
+def _normalize(line):
+    return re.sub(r'[^a-z0-9]+', ' ', line.lower()).strip()
+
+
+def dedupe_instructions(prompt, *context, min_length=24):
+    """
+    Drop lines of `prompt` that repeat an instruction already given, earlier in
+    the prompt or in `context` (e.g. the system prompt). Only lines of at least
+    `min_length` normalized characters are considered, so headings and short
+    list items are kept.
+    """
+    seen = set()
+    for text in context:
+        seen.update(_normalize(line) for line in text.splitlines())
+
+    lines = []
+    for line in prompt.splitlines():
+        normalized = _normalize(line)
+        if len(normalized) >= min_length:
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+class TokenBudget:
+    """
+    Chooses max_tokens per template from the completion sizes seen so far.
+
+    Until `min_samples` completions have been recorded for a template the
+    `default` budget is used. After that it is the `percentile` of the recent
+    completion sizes times `headroom`, kept between `floor` and the model's
+    output cap. Truncated completions (finish_reason 'length') are recorded
+    as larger than their budget so the next one gets more room.
+
+    Keys of the form 'template#part' (one part of a generation, e.g. a single
+    section) start from `part_defaults[part]` instead, and are not held to
+    `floor`, which is sized for whole articles.
+    """
+
+    def __init__(self, default=16000, floor=2000, percentile=0.95, headroom=1.3,
+                 min_samples=20, window=200, part_defaults=None):
+        self.default = default
+        self.floor = floor
+        self.part_defaults = part_defaults or {}
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, template_name, completion_tokens, max_tokens=None, truncated=False):
+        if not completion_tokens:
+            return
+        if truncated:
+            logger.warning(f"Completion for {template_name} hit max_tokens={max_tokens}")
+            completion_tokens = max(completion_tokens, max_tokens or 0) * 1.5
+        with self._lock:
+            samples = self._samples.get(template_name)
+            if samples is None:
+                samples = self._samples[template_name] = deque(maxlen=self.window)
+            samples.append(completion_tokens)
+
+    def _observed(self, template_name):
+        with self._lock:
+            samples = sorted(self._samples.get(template_name, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile))]
+
+    def _defaults(self, template_name):
+        part = template_name.rpartition('#')[2] if '#' in template_name else None
+        if part in self.part_defaults:
+            return self.part_defaults[part], 1
+        return self.default, self.floor
+
+    def max_tokens(self, template_name, prompt_tokens=0, model='gpt-4o'):
+        limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        default, floor = self._defaults(template_name)
+        observed = self._observed(template_name)
+        budget = default if observed is None else int(observed * self.headroom)
+        budget = max(floor, min(budget, limits['output']))
+        # Never ask for more than the context window has left
+        return max(1, min(budget, limits['context'] - prompt_tokens))
+
+    def stats(self):
+        with self._lock:
+            templates = list(self._samples)
+        return {
+            template_name: {
+                'samples': len(self._samples[template_name]),
+                'observed_p': self._observed(template_name),
+                'max_tokens': self.max_tokens(template_name),
+            }
+            for template_name in templates
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import time
+from types import SimpleNamespace
+
+import jwt
+
+from utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Algorithms accepted for keys from the JWKS endpoint
+JWKS_ALGORITHMS = ('RS256', 'ES256')
+
+def user_from_claims(claims):
+    """Build a user object with the attributes routes use from Supabase JWT claims"""
+    return SimpleNamespace(
+        id=claims['sub'],
+        email=claims.get('email'),
+        phone=claims.get('phone'),
+        role=claims.get('role'),
+        aud=claims.get('aud'),
+        app_metadata=claims.get('app_metadata', {}),
+        user_metadata=claims.get('user_metadata', {}),
+    )
+
+
+class TokenVerifier:
+    """
+    Resolve access tokens to users without a Supabase round trip.
+
+    Tokens are verified locally, against the project's JWT secret (HS256) or
+    its JWKS endpoint, and the resulting user is cached until the token
+    expires (at most `cache_ttl` seconds). When local verification is not
+    possible the remote `auth.get_user` call is used instead.
+    """
+
+    def __init__(self, remote_get_user, jwt_secret=None, jwks_url=None,
+                 audience='authenticated', cache_ttl=300, max_entries=10000):
+        self.remote_get_user = remote_get_user
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.cache_ttl = cache_ttl
+        self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwks_url else None
+        self._cache = TTLCache(max_entries=max_entries, ttl=cache_ttl)
+
+    @staticmethod
+    def _cache_key(token):
+        # Don't keep raw bearer tokens around in memory
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _decode(self, token):
+        # The header only picks the key. The algorithm is pinned to the key's,
+        # so a token can't choose a weaker one (or 'none').
+        if jwt.get_unverified_header(token).get('alg') == 'HS256':
+            if not self.jwt_secret:
+                return None
+            key, algorithm = self.jwt_secret, 'HS256'
+        else:
+            if self._jwks_client is None:
+                return None
+            signing_key = self._jwks_client.get_signing_key_from_jwt(token)
+            if signing_key.algorithm_name not in JWKS_ALGORITHMS:
+                raise jwt.InvalidAlgorithmError(f'Unsupported signing key algorithm {signing_key.algorithm_name}')
+            key, algorithm = signing_key.key, signing_key.algorithm_name
+        return jwt.decode(token, key, algorithms=[algorithm], audience=self.audience,
+                          options={'require': ['exp', 'sub']})
+
+    def lookup(self, token):
+        """Return the cached or locally verified user for a token, or None"""
+        cache_key = self._cache_key(token)
+        user = self._cache.get(cache_key)
+        if user is not None:
+            return user
+
+        try:
+            claims = self._decode(token)
+        except Exception as e:
+            logger.debug(f"Local token verification failed: {str(e)}")
+            return None
+        if claims is None:
+            return None
+
+        user = user_from_claims(claims)
+        ttl = min(self.cache_ttl, claims['exp'] - time.time())
+        if ttl > 0:
+            self._cache.set(cache_key, user, ttl=ttl)
+        return user
+
+    def remember(self, token, user):
+        """Cache a user returned by the remote check, no longer than the token is valid"""
+        ttl = self.cache_ttl
+        try:
+            expires_at = jwt.decode(token, options={'verify_signature': False}).get('exp')
+            if expires_at:
+                ttl = min(ttl, expires_at - time.time())
+        except jwt.PyJWTError:
+            pass
+        if ttl > 0:
+            self._cache.set(self._cache_key(token), user, ttl=ttl)
+
+    def verify(self, token):
+        """Return the user for a token, falling back to Supabase. Raises if the token is invalid."""
+        user = self.lookup(token)
+        if user is not None:
+            return user
+
+        user = self.remote_get_user(token).user
+        if user is None:
+            raise ValueError('Invalid token')
+        self.remember(token, user)
+        return user
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,177 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def sse_event(event, data):
+    """Format a single Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def find_json_string(text, key):
+    """Return the first complete string value for `key` in a (possibly partial) JSON document"""
+    match = re.search(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"' % re.escape(key), text)
+    if not match:
+        return None
+    try:
+        return json.loads(f'"{match.group(1)}"')
+    except ValueError:
+        return None
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally pull complete objects out of a named JSON array while the
+    document is still arriving, e.g. the "article_content" list of a streamed
+    completion. Call feed() with each new chunk of text; it returns the objects
+    that were completed by that chunk. feed_indexed() returns every completed
+    item instead, paired with its position in the array.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.buffer = ''
+        self.done = False
+        self.count = 0  # Items of any type completed so far
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._scan_pos = None  # Index just after '[' once the array is found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+
+    @property
+    def found(self):
+        """Whether the start of the array has arrived"""
+        return self._scan_pos is not None
+
+    @property
+    def in_item(self):
+        """Whether the text so far ends inside an object or array item of the array"""
+        return self._depth > 0
+
+    def feed(self, text):
+        return [item for _, item in self.feed_indexed(text) if isinstance(item, dict)]
+
+    def feed_indexed(self, text):
+        """
+        Add `text` and return (position, item) for each item it completed,
+        whatever its type. Items that are not valid JSON come back as None so
+        that later positions still match the array.
+        """
+        self.buffer += text
+        if self.done:
+            return []
+
+        if self._scan_pos is None:
+            match = self._key_pattern.search(self.buffer)
+            if not match:
+                return []
+            self._scan_pos = match.end()
+
+        items = []
+        buffer = self.buffer
+        pos = self._scan_pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char in '{[':
+                if self._depth == 0:
+                    self._item_start = pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # Closing bracket of the array itself, ending any scalar item
+                    if self._item_start is not None:
+                        items.append(self._complete_item(pos))
+                    self.done = True
+                    pos += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    items.append(self._complete_item(pos + 1))
+            elif self._depth == 0 and char == ',':
+                if self._item_start is not None:
+                    items.append(self._complete_item(pos))
+            elif not char.isspace():
+                if self._depth == 0 and self._item_start is None:
+                    # Start of a string, number or literal item
+                    self._item_start = pos
+                if char == '"':
+                    self._in_string = True
+            pos += 1
+
+        self._scan_pos = pos
+        return items
+
+    def _complete_item(self, end):
+        try:
+            item = json.loads(self.buffer[self._item_start:end])
+        except ValueError:
+            item = None
+        position = self.count
+        self.count += 1
+        self._item_start = None
+        return position, item
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, max_entries=1000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -388,7 +388,7 @@ function AppContent() {
     }
   };
 
-  const generateContent = async (values) => {
+  const generateContent = async (values, { skipCache = false } = {}) => {
     setLoading(true);
     setErrorMessage(null);
 
@@ -411,7 +411,9 @@ function AppContent() {
         ...values,
         template_name: values.template_name || 'article_template.html',
         hero_image_position: values.hero_image_position,
-        theme: values.theme
+        theme: values.theme,
+        // Regenerating with the same inputs should not return the cached article
+        skip_cache: skipCache
       };
 
       // Add match stats only for match report template
@@ -522,7 +524,7 @@ function AppContent() {
 
   const handleRegenerate = async () => {
     setShowRegenerateConfirm(false);
-    await generateContent(formik.values);
+    await generateContent(formik.values, { skipCache: true });
   };
 
   const handleSaveArticle = async () => {
@@ -1000,7 +1002,7 @@ function AppContent() {
               setShowRegenerateConfirm(false);
               setPreviousContent(null);
               setHasGeneratedContent(false);
-              await generateContent(formik.values);
+              await generateContent(formik.values, { skipCache: true });
             }}
             autoFocus
           >